@@ -1,4 +1,4 @@
-from .kkmeans import KKMeans, KKMeans_iterative
+from .kkmeans import KKMeans, KKMeans_iterative, KKMeans_minibatch
 from .kward import KWard
 from .spectral_clustering import SpectralClustering_rubanov
 from .wrappers import KMeans_sklearn, Ward_sklearn, SpectralClustering_sklearn, KKMeans_kernlab, \
@@ -6,6 +6,7 @@ from .wrappers import KMeans_sklearn, Ward_sklearn, SpectralClustering_sklearn,
 
 __all__ = ['KKMeans',
            'KKMeans_iterative',
+           'KKMeans_minibatch',
            'KKMeans_kernlab',
            'KWard',
            'SpectralClustering_rubanov',
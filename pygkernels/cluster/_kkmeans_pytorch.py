@@ -2,35 +2,44 @@ import numpy as np
 import torch
 
 from pygkernels.cluster.base import torch_func
+from pygkernels.score.score import modularity_batch
 
 
-def _hKh(hk, ei, K):
-    hk_ei = hk - ei
-    return torch.einsum('i,ij,j->', [hk_ei, K, hk_ei])
+def _symmetrize(K):
+    """
+    The quadratic forms x^T K x only depend on the symmetric part of K
+    """
+    return (K + K.transpose(0, 1)) / 2
 
 
-def _inertia(h, e, K, labels):
-    h_e = h.gather(0, labels[None]) - e
-    return torch.einsum('ki,ij,kj->', [h_e, K, h_e])
+def _distances(h, K, K_diag):
+    """
+    ||φ_i - c_k||^2 = (e_i - h_k)^T K (e_i - h_k) = K_ii - 2(hK)_ki + (hKh^T)_kk for symmetric K, [k, n];
+    O(k*n^2) instead of O(k*n^3) for the [k, n, n] difference tensor. A batch of h [R, k, n] gives [R, k, n]
+    """
+    hK = torch.matmul(h, K)
+    hKh = torch.sum(h * hK, dim=-1, keepdim=True)
+    return K_diag - 2 * hK + hKh
 
 
-def _modularity(A, labels):
+def _inertia(h, K, labels):
     """
-    Simplified version only for undirected graphs
+    Sum of the distances to the own centroids; a batch of h [R, k, n] with labels [R, n] gives [R]
     """
-    n_edges = torch.sum(A)
-    degrees = torch.sum(A, dim=1, keepdim=True)
+    return torch.sum(_distances(h, K, torch.diagonal(K)).gather(-2, labels.unsqueeze(-2)), dim=(-2, -1))
 
-    Q_items = A + torch.diagonal(A) - degrees.mm(degrees.transpose(1, 0)) / n_edges
-    Q = torch.Tensor([0])
-    for class_name in range(torch.max(labels).item() + 1):
-        mask = labels == class_name
-        Q += torch.sum(Q_items[mask][:, mask])
-    return Q / n_edges
+
+def _modularity(A, labels):
+    """
+    Simplified version only for undirected graphs; labels is [n] or a batch [R, n]
+    """
+    A = A.cpu().numpy() if type(A) == torch.Tensor else A
+    Q = modularity_batch(A, labels.cpu().numpy().reshape(-1, labels.shape[-1]))
+    return torch.from_numpy(Q) if labels.dim() > 1 else torch.from_numpy(Q[:1])
 
 
 @torch_func
-def kmeanspp(K, n_clusters, device):
+def kmeanspp(K, n_clusters, rng: np.random.Generator, device):
     """
     k-means++ initialization for k-means
     The method will work only if all the distances is finite
@@ -38,34 +47,38 @@ def kmeanspp(K, n_clusters, device):
     assert ~torch.any(torch.isnan(K))
 
     n = K.shape[0]
-    e = torch.eye(n, dtype=torch.float32).to(device)
+    K = _symmetrize(K)
+    K_diag = torch.diagonal(K)
     h = torch.zeros((n_clusters, n), dtype=torch.float32).to(device)
 
-    first_centroid = np.random.randint(n)
+    first_centroid = rng.integers(n)
     h[0, first_centroid] = 1
+    # the rows of h not chosen yet are zero centroids, distance K_ii; the distances to a new centroid j (one node) are
+    # K_ii - 2K_ij + K_jj, O(n) per centroid
+    centroid_distances = K_diag + K_diag[first_centroid] - 2 * K[:, first_centroid]
     for c_idx in range(1, n_clusters):
-        h_e = h.unsqueeze(1) - e.unsqueeze(0)  # [k, n, n]
-        min_distances, _ = torch.min(torch.einsum('kni,ij,knj->kn', [h_e, K, h_e]), dim=0)
+        min_distances = torch.min(K_diag, centroid_distances)
         min_distances.pow_(2)
         if torch.sum(min_distances) > 0:
             p = (min_distances / min_distances.sum()).cpu().numpy()
             assert np.isclose(np.sum(p), 1)
-            next_centroid = np.random.choice(range(n), p=p)
+            next_centroid = rng.choice(n, p=p)
         else:  # no way to make all different centroids; let's choose random one just for rerun
-            next_centroid = np.random.choice(range(n))
+            next_centroid = rng.choice(n)
         h[c_idx, next_centroid] = 1
+        centroid_distances = torch.min(centroid_distances, K_diag + K_diag[next_centroid] - 2 * K[:, next_centroid])
     return h
 
 
 @torch_func
 def predict(K, h, max_iter: int, A, device):
     n_clusters, n = h.shape
-    e = torch.eye(n, dtype=torch.float32).to(device)
+    K = _symmetrize(K)
+    K_diag = torch.diagonal(K)
 
     labels, success = torch.zeros((n,), dtype=torch.int64).to(device), True
     for _ in range(max_iter):
-        h_e = h.unsqueeze(1) - e.unsqueeze(0)  # [k, n, n]
-        l = torch.einsum('kni,ij,knj->kn', [h_e, K, h_e]).argmin(dim=0)
+        l = _distances(h, K, K_diag).argmin(dim=0)
         if torch.all(labels == l):  # early stop
             break
         labels = l
@@ -78,55 +91,118 @@ def predict(K, h, max_iter: int, A, device):
             break
         h = (U / nn).transpose(0, 1)
 
-    inertia = _inertia(h, e, K, labels)
+    inertia = _inertia(h, K, labels)
     modularity = _modularity(A, labels) if A is not None else None
     return labels, inertia, modularity, success
 
 
 @torch_func
-def iterative_predict(K, h, max_iter: int, eps: float, A, device):
+def predict_batch(K, h, max_iter: int, A, device):
+    """
+    predict() for R restarts at once, h is [R, k, n]. Every restart stops on its own (no label changes or an empty
+    cluster, then success=False) while the others go on; the results are [R, n] labels and [R] inertia, modularity
+    and success
+    """
+    n_runs, n_clusters, n = h.shape
+    K = _symmetrize(K)
+    K_diag = torch.diagonal(K)
+
+    labels = torch.zeros((n_runs, n), dtype=torch.int64).to(device)
+    success = torch.ones((n_runs,), dtype=torch.bool).to(device)
+    active = torch.ones((n_runs,), dtype=torch.bool).to(device)
+    for _ in range(max_iter):
+        idx = torch.nonzero(active).squeeze(1)
+        if len(idx) == 0:
+            break
+        l = _distances(h[idx], K, K_diag).argmin(dim=1)  # [r, n]
+        converged = torch.all(labels[idx] == l, dim=1)
+        labels[idx] = l
+
+        U = torch.nn.functional.one_hot(l, n_clusters).float()  # [r, n, k]
+        nn = U.sum(dim=1, keepdim=True)
+        empty = torch.any(nn == 0, dim=2).squeeze(1) & ~converged
+        update = ~converged & ~empty
+        h[idx[update]] = (U[update] / nn[update]).transpose(1, 2)
+        success[idx[empty]] = False
+        active[idx[~update]] = False
+
+    inertia = _inertia(h, K, labels)
+    modularity = _modularity(A, labels) if A is not None else None
+    return labels, inertia, modularity, success
+
+
+@torch_func
+def iterative_predict(K, h, max_iter: int, eps: float, A, rng: np.random.Generator, device, block_size: int = 64):
+    """
+    Node-by-node moves of Fouss's Algorithm 7.3 on cached products Kh = K*h^T [n, k] and hKh = diag(h*K*h^T) [k]:
+    the distance of node i to centroid k is K_ii - 2Kh_ik + hKh_k, so scoring a node is O(k). Moving i from a to b
+        h_a' = (n_a*h_a - e_i) / (n_a - 1),  Kh_a' = (n_a*Kh_a - K_i) / (n_a - 1),
+        hKh_a' = (n_a^2*hKh_a - 2n_a*Kh_ia + K_ii) / (n_a - 1)^2    (and the same with + for b)
+    is O(n). Nodes are scored a block at a time; the nodes before the first move in the block are exactly what the
+    one-by-one sweep would do, the rest of the block is rescored after the move. The cache is recomputed every sweep
+    """
     n_clusters, n = h.shape
-    e = torch.eye(n, dtype=torch.float32).to(device)
+    K = _symmetrize(K.double())
+    K_diag = torch.diagonal(K)
+    h = h.double()
 
     # initialization
-    h_e = h.unsqueeze(1) - e.unsqueeze(0)  # [k, n, n]
-    l = torch.einsum('kni,ij,knj->kn', [h_e, K, h_e]).argmin(dim=0)
+    l = _distances(h, K, K_diag).argmin(dim=0)
 
-    U = torch.zeros((n, n_clusters), dtype=torch.float32).to(device)
-    U[range(n), l] = 1
-    nn = U.sum(dim=0, keepdim=True)
+    U = torch.nn.functional.one_hot(l, n_clusters).double()
+    nn = U.sum(dim=0)
     if torch.any(nn == 0):  # bad start, rerun
-        inertia = _inertia(h, e, K, l)
-        return l, inertia, False
-    h = (U / nn).transpose(0, 1)
-    nn = nn.squeeze()
+        inertia = _inertia(h, K, l)
+        modularity = _modularity(A, l) if A is not None else None
+        return l, inertia, modularity, False
+    h = (U / nn[None]).transpose(0, 1)
+
+    def move(i, a, b):
+        """
+        Node i from cluster a to cluster b
+        """
+        na, nb, K_i = nn[a], nn[b], K[i]
+        hKh[a] = (na ** 2 * hKh[a] - 2 * na * Kh[i, a] + K_diag[i]) / (na - 1 + eps) ** 2
+        hKh[b] = (nb ** 2 * hKh[b] + 2 * nb * Kh[i, b] + K_diag[i]) / (nb + 1 + eps) ** 2
+        Kh[:, a] = (na * Kh[:, a] - K_i) / (na - 1 + eps)
+        Kh[:, b] = (nb * Kh[:, b] + K_i) / (nb + 1 + eps)
+        h[a] *= na / (na - 1 + eps)
+        h[a, i] -= 1. / (na - 1 + eps)
+        h[b] *= nb / (nb + 1 + eps)
+        h[b, i] += 1. / (nb + 1 + eps)
+        nn[a], nn[b] = na - 1, nb + 1
+        l[i] = b
 
     # iterative steps
     labels = l.clone()
     for _ in range(max_iter):
-        node_order = np.array(list(range(n)))
-        np.random.shuffle(node_order)
-        for i in node_order:  # for each node
-            h_ei = h - e[i][None]
-            ΔJ1 = nn / (nn + 1 + eps) * torch.einsum('ki,ij,kj->k', [h_ei, K, h_ei])
-            ΔJ1, k_star = ΔJ1.min(dim=0)
-            ΔJ2 = nn[l[i]] / (nn[l[i]] - 1 + eps) * _hKh(h[l[i]], e[i], K)
-            minΔJ = ΔJ1 - ΔJ2
-            if minΔJ < 0 and l[i] != k_star:
-                if nn[l[i]] == 1:  # it will cause empty cluster! exit with success=False
-                    inertia = _inertia(h, e, K, labels)
+        Kh = K.mm(h.transpose(0, 1))
+        hKh = torch.sum(h * Kh.transpose(0, 1), dim=1)
+        node_order = torch.from_numpy(rng.permutation(n)).to(device)
+        for start in range(0, n, block_size):
+            block = node_order[start:start + block_size]
+            while len(block) > 0:
+                l_block = l[block]
+                distances = K_diag[block, None] - 2 * Kh[block] + hKh[None]  # [b, k]
+                ΔJ1, k_star = (nn / (nn + 1 + eps) * distances).min(dim=1)
+                nn_l = nn[l_block]
+                ΔJ2 = nn_l / (nn_l - 1 + eps) * distances.gather(1, l_block[:, None]).squeeze(1)
+                moves = torch.nonzero((ΔJ1 - ΔJ2 < 0) & (l_block != k_star)).squeeze(1)
+                if len(moves) == 0:
+                    break
+                j = moves[0].item()
+                i, a, b = block[j].item(), l_block[j].item(), k_star[j].item()
+                if nn[a] == 1:  # it will cause empty cluster! exit with success=False
+                    inertia = _inertia(h, K, labels)
                     modularity = _modularity(A, labels) if A is not None else None
                     return labels, inertia, modularity, False
-                h[l[i]] = 1. / (nn[l[i]] - 1 + eps) * (nn[l[i]] * h[l[i]] - e[i])
-                h[k_star] = 1. / (nn[k_star] + 1 + eps) * (nn[k_star] * h[k_star] + e[i])
-                U[i, l[i]], U[i, k_star] = 0, 1
-                nn[l[i]], nn[k_star] = nn[l[i]] - 1, nn[k_star] + 1
-                l[i] = k_star
+                move(i, a, b)
+                block = block[j + 1:]
 
         if torch.all(labels == l):  # early stop
             break
         labels = l.clone()
 
-    inertia = _inertia(h, e, K, labels)
+    inertia = _inertia(h, K, labels)
     modularity = _modularity(A, labels) if A is not None else None
     return labels, inertia, modularity, ~np.isnan(inertia)
@@ -1,115 +1,213 @@
-import random
-from itertools import combinations
+import heapq
 
 import numpy as np
 import torch
+from scipy import sparse
 
 from pygkernels.cluster.base import torch_func
 
 
-def calc_cache_batch(Ck_n, Cl_n, Ck_h, Cl_h, K, device):
+def _ward_costs(K):
     """
-        dJ = (n_k * n_l)/(n_k + n_l) * (h_k - h_l)^T * K * (h_k - h_l)
+    Merge costs of all pairs of singletons, inf on the diagonal:
+        dJ = (n_k * n_l)/(n_k + n_l) * (h_k - h_l)^T * K * (h_k - h_l) = (K_kk + K_ll - K_kl - K_lk) / 2
     """
-    Ck_n = torch.from_numpy(np.array(Ck_n)).to(device)
-    Cl_n = torch.from_numpy(np.array(Cl_n)).to(device)
-    Ck_h, Cl_h = torch.stack(Ck_h, dim=0), torch.stack(Cl_h, dim=0)
+    diag = torch.diagonal(K).clone()
+    D = -(K + K.T) / 2  # the quadratic form only sees the symmetric part, D has to be symmetric for the chain
+    D += diag[:, None] / 2
+    D += diag[None, :] / 2
+    D.nan_to_num_(nan=np.inf)
+    D.fill_diagonal_(np.inf)
+    return D
 
-    hkhl = Ck_h - Cl_h
-    dJ = (Ck_n * Cl_n) * torch.einsum('ki,ij,kj->k', hkhl, K, hkhl) / (Ck_n + Cl_n)
-    dJ = dJ.cpu().numpy()
 
-    return dJ
+def nn_chain(K, min_compact_size=256):
+    """
+    Ward is reducible, so the nearest-neighbour chain finds the same merges as the greedy agglomeration.
+    Returns [n - 1, 3] merges (x, y, dJ) in the order they were found: x and y are any nodes of the merged clusters
+    """
+    n = K.shape[0]
+    return _nn_chain(_ward_costs(K), torch.ones(n, dtype=K.dtype, device=K.device), np.arange(n), min_compact_size)
 
 
-def _calc_cache_batched(Ck_n_all, Cl_n_all, Ck_h_all, Cl_h_all, K, device, batch_size=100000):
-    num_pages = len(Ck_n_all) // batch_size + 1
+def _nn_chain(D, size, nodes, min_compact_size=256):
+    """
+    Nearest-neighbour chain over clusters with merge costs D (inf on the diagonal, no nan), sizes and a node of every
+    cluster.
+    Merge costs are updated by the Lance-Williams recurrence in kernel space, O(n) per merge:
+        dJ(k ∪ l, m) = ((n_k + n_m) * dJ(k, m) + (n_l + n_m) * dJ(l, m) - n_m * dJ(k, l)) / (n_k + n_l + n_m)
+    The merged cluster takes the slot of l, the slot of k is masked out; once half of the slots are masked out, the
+    cost matrix is compacted.
+    """
+    n = D.shape[0]
+    inactive = torch.zeros(n, dtype=D.dtype, device=D.device)  # inf for merged away slots, masks stale costs
+    is_active = np.ones(n, dtype=bool)
+    merges = np.empty((n - 1, 3), dtype=np.float64)
+
+    chain = []
+    for merge_idx in range(n - 1):
+        n_active = n - merge_idx
+        if n_active <= len(nodes) // 2 and n_active >= min_compact_size:
+            # drop the merged away slots, so the row updates and the column writes only touch active clusters
+            keep = np.flatnonzero(is_active)
+            slot = np.cumsum(is_active) - 1
+            keep_t = torch.from_numpy(keep).to(D.device)
+            D = D.index_select(0, keep_t).index_select(1, keep_t)
+            size, inactive = size[keep_t], inactive[keep_t]
+            is_active, nodes = is_active[keep], nodes[keep]
+            chain = [int(slot[x]) for x in chain]
+
+        if not chain:
+            chain.append(int(np.argmax(is_active)))
+        while True:
+            x = chain[-1]
+            y = int(torch.argmin(D[x] + inactive).item())
+            if len(chain) > 1 and not D[x, y].item() < D[x, chain[-2]].item():
+                break  # x and the previous element are reciprocal nearest neighbours
+            if y == x or not is_active[y]:  # only inf costs are left in the row
+                y = int(np.flatnonzero(is_active)[0 if x != np.argmax(is_active) else 1])
+            chain.append(y)
+        x, y = chain.pop(), chain.pop()
+
+        dJ = D[x, y].item()
+        size_x, size_y = size[x].item(), size[y].item()
+        new = D[x] * (size + size_x)
+        new.addcmul_(D[y], size + size_y).sub_(size, alpha=dJ).div_(size + (size_x + size_y))
+        new.nan_to_num_(nan=np.inf)  # inf - inf for kernels with non-finite entries
+        new[x], new[y] = np.inf, np.inf
+        D[y], D[:, y] = new, new
+        size[y], size[x] = size_x + size_y, 0
+        inactive[x] = np.inf
+        is_active[x] = False
+        merges[merge_idx] = nodes[x], nodes[y], dJ
+    return merges
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def linkage_from_merges(n_nodes, merges, sort=True):
+    """
+    SciPy linkage matrix [n - 1, 4] (cluster1, cluster2, height, size): the merges of a reducible linkage are applied
+    in the order of their cost (sort=False keeps the given order), cluster n + i is created by row i. The height is
+    sqrt(2 * dJ), the same as the ward distance of scipy.cluster.hierarchy.linkage for the linear kernel (clipped at
+    zero for non-PSD kernels)
+    """
+    Z = np.empty((n_nodes - 1, 4), dtype=np.float64)
+    parent, cluster, size = np.arange(n_nodes), np.arange(n_nodes), np.ones(n_nodes, dtype=np.int64)
+    order = np.argsort(merges[:, 2], kind='stable') if sort else np.arange(len(merges))
+    for i, (x, y, dJ) in enumerate(merges[order]):
+        x, y = _find(parent, int(x)), _find(parent, int(y))
+        Z[i] = min(cluster[x], cluster[y]), max(cluster[x], cluster[y]), np.sqrt(2 * max(dJ, 0)), size[x] + size[y]
+        parent[x], cluster[y], size[y] = y, n_nodes + i, size[x] + size[y]
+    return Z
 
-    if num_pages > 1:
-        dJ_all = []
-        for p in range(num_pages):
-            slce = slice(p * batch_size, (p + 1) * batch_size)
-            c2_Ck_n, c2_Cl_n, c2_Ck_h, c2_Cl_h = Ck_n_all[slce], Cl_n_all[slce], Ck_h_all[slce], Cl_h_all[slce]
-            c2_dJ = calc_cache_batch(c2_Ck_n, c2_Cl_n, c2_Ck_h, c2_Cl_h, K, device)
-            dJ_all.append(c2_dJ)
-        dJ_all = np.concatenate(dJ_all, axis=0)
-    else:
-        dJ_all = calc_cache_batch(Ck_n_all, Cl_n_all, Ck_h_all, Cl_h_all, K, device)
 
-    return dJ_all
+def _cluster_costs(S, size):
+    """
+    Ward merge costs of clusters from the sums of the kernel over pairs of clusters S_kl = 1_k^T K 1_l:
+        dJ = (n_k * n_l)/(n_k + n_l) * (S_kk / n_k^2 + S_ll / n_l^2 - 2 * S_kl / (n_k * n_l))
+    """
+    S_diag = torch.diagonal(S) / size ** 2
+    D = (S_diag[:, None] + S_diag[None, :] - 2 * S / (size[:, None] * size[None, :])) * \
+        (size[:, None] * size[None, :]) / (size[:, None] + size[None, :])
+    D.nan_to_num_(nan=np.inf)
+    D.fill_diagonal_(np.inf)
+    return D
 
 
-class _KWardCluster:
-    def __init__(self, id, nodes, all_nodes_count, device):
-        self.id = id
-        self.nodes = nodes
-        self.n = len(nodes)
-        self.h = torch.zeros((all_nodes_count,), dtype=torch.float32).to(device)
-        self.h[nodes] = 1.0 / self.n
+def connected_merges(K, A):
+    """
+    Greedy agglomeration that only merges clusters joined by an edge of A. Candidate pairs live in a heap with lazy
+    deletion, so there are O(m) of them instead of O(n^2); the cluster adjacency is updated on every merge.
+    C[l] = Σ_{i ∈ l} K_i is kept for every cluster slot, so after a merge the sums S_lm for all clusters m come from
+    one bincount and the new costs are exact (Lance-Williams would need the costs to the clusters adjacent to only one
+    of the merged clusters, and those are not in the heap).
+    Clusters that are left when the components are exhausted are merged without constraints.
+    Returns [n - 1, 3] merges (x, y, dJ) in the order they have to be applied
+    """
+    n = K.shape[0]
+    A = (A + A.T).tocsr()
+    neighbours = [set(A.indices[A.indptr[i]:A.indptr[i + 1]]) - {i} for i in range(n)]
+
+    C = (K + K.T) / 2  # the quadratic forms only see the symmetric part
+    slot = torch.arange(n, device=K.device)
+    members = [[i] for i in range(n)]
+    size, self_sum = np.ones(n), torch.diagonal(K).double().cpu().numpy()
+    version = np.zeros(n, dtype=np.int64)
+    rows, cols = sparse.triu(A, k=1).nonzero()
+    costs = np.nan_to_num((self_sum[rows] + self_sum[cols]) / 2 - K[rows, cols].double().cpu().numpy(), nan=np.inf)
+    heap = [(cost, k, l, 0, 0) for cost, k, l in zip(costs.tolist(), rows.tolist(), cols.tolist())]
+    heapq.heapify(heap)
+
+    merges = []
+    while heap:
+        dJ, k, l, version_k, version_l = heapq.heappop(heap)
+        if version[k] != version_k or version[l] != version_l:
+            continue
+        x, y = (k, l) if size[k] <= size[l] else (l, k)  # the smaller cluster is relabeled
+        merges.append((x, y, dJ))
+
+        C[y] += C[x]
+        slot[members[x]] = y
+        members[y].extend(members[x])
+        members[x] = []
+        size[y], size[x] = size[y] + size[x], 0
+        version[x], version[y] = version[x] + 1, version[y] + 1
+        neighbours[y] = (neighbours[x] | neighbours[y]) - {x, y}
+        for m in neighbours[x]:
+            neighbours[m].discard(x)
+            if m != y:
+                neighbours[m].add(y)
+        neighbours[x] = set()
+
+        S = torch.bincount(slot, weights=C[y], minlength=n).double().cpu().numpy()
+        self_sum[y] = S[y]
+        nb = np.fromiter(neighbours[y], dtype=np.int64, count=len(neighbours[y]))
+        costs = (self_sum[y] / size[y] ** 2 + self_sum[nb] / size[nb] ** 2 - 2 * S[nb] / (size[y] * size[nb])) * \
+            (size[y] * size[nb]) / (size[y] + size[nb])
+        costs = np.nan_to_num(costs, nan=np.inf)
+        for m, cost in zip(nb.tolist(), costs.tolist()):
+            k, l = min(y, m), max(y, m)
+            heapq.heappush(heap, (cost, k, l, version[k], version[l]))
+
+    left = np.flatnonzero(size > 0)
+    merges = np.array(merges, dtype=np.float64).reshape(-1, 3)
+    if len(left) > 1:
+        left_t = torch.from_numpy(left).to(K.device)
+        S = torch.stack([torch.bincount(slot, weights=C[l], minlength=n)[left_t] for l in left_t]).double()
+        rest = _nn_chain(_cluster_costs(S, torch.from_numpy(size[left]).to(S.device)),
+                         torch.from_numpy(size[left]).to(S.device), left)
+        merges = np.concatenate([merges, rest[np.argsort(rest[:, 2], kind='stable')]])
+    return merges
+
+
+def cut(Z, n_clusters):
+    """
+    Flat clustering after the first n - n_clusters merges of the linkage matrix, O(n)
+    """
+    n_nodes = Z.shape[0] + 1
+    n_merges = max(n_nodes - n_clusters, 0)
+    root = np.arange(2 * n_nodes - 1)
+    # going from the last merge down, the parent of every cluster already knows its root
+    for i in range(n_merges - 1, -1, -1):
+        root[int(Z[i, 0])] = root[int(Z[i, 1])] = root[n_nodes + i]
+    return np.unique(root[:n_nodes], return_inverse=True)[1]
+
+
+@torch_func
+def linkage(K, device):
+    return linkage_from_merges(K.shape[0], nn_chain(K))
 
 
 @torch_func
+def connected_linkage(K, A, device):
+    return linkage_from_merges(K.shape[0], connected_merges(K, A), sort=False)
+
+
 def predict(K, n_clusters, device):
-    n_nodes = K.shape[0]
-    C = dict((i, _KWardCluster(i, [i], n_nodes, device)) for i in range(n_nodes))
-    last_taken_id = n_nodes - 1
-
-    # initialize cache
-    cache_dJ = {}
-    c2_key, c2_Ck_n, c2_Cl_n, c2_Ck_h, c2_Cl_h = [], [], [], [], []
-    for Ck, Cl in combinations(C.values(), 2):
-        c2_key.append((Ck.id, Cl.id))
-        c2_Ck_n.append(Ck.n)
-        c2_Cl_n.append(Cl.n)
-        c2_Ck_h.append(Ck.h)
-        c2_Cl_h.append(Cl.h)
-    c2_dJ = _calc_cache_batched(c2_Ck_n, c2_Cl_n, c2_Ck_h, c2_Cl_h, K, device)
-    for key, c2_dJ_item in zip(c2_key, c2_dJ):
-        cache_dJ[key] = c2_dJ_item
-    del c2_Cl_n, c2_Cl_h  # it should help to free cuda memory of taken by deleted clusters
-
-    for iter in range(n_nodes - n_clusters):
-        if iter > 0:
-            # update cache: add to cache all pairs not in cache
-            c2_key, c2_Ck_n, c2_Ck_h = [], [], []
-            for Ck in C.values():
-                if Ck.id != last_taken_id:
-                    c2_key.append((Ck.id, last_taken_id))
-                    c2_Ck_n.append(Ck.n)
-                    c2_Ck_h.append(Ck.h)
-            Cl = C[last_taken_id]
-            c2_dJ = _calc_cache_batched(c2_Ck_n, [Cl.n], c2_Ck_h, [Cl.h], K, device)
-            for key, c2_dJ_item in zip(c2_key, c2_dJ):
-                cache_dJ[key] = c2_dJ_item
-
-        # find pair of clusters to merge
-        minJ_k, minJ_l, minJ_val = None, None, np.inf
-        all_ids = list(C.keys())
-        random.shuffle(all_ids)
-        for k, l in combinations(all_ids, 2):
-            dJ = cache_dJ[(k, l) if k < l else (l, k)]
-            if dJ < minJ_val:
-                minJ_k, minJ_l, minJ_val = k, l, dJ
-
-        # merge clusters
-        union = C[minJ_k].nodes + C[minJ_l].nodes
-        del C[minJ_k]
-        del C[minJ_l]
-        new_id = last_taken_id + 1
-        C[new_id] = _KWardCluster(last_taken_id + 1, union, n_nodes, device)
-        last_taken_id = new_id
-
-        # check that nothing lost
-        # node_idx = defaultdict(lambda: 0)
-        # for Ci in C:
-        #     for node in Ci.nodes:
-        #         node_idx[node] += 1
-        # for i in range(n_nodes):
-        #     assert node_idx[i] == 1
-
-    result = np.zeros((n_nodes,), dtype=np.uint8)
-    for cluster_idx, cluster in enumerate(C.values()):
-        for node in cluster.nodes:
-            result[node] = cluster_idx
-
-    return result
+    return cut(linkage(K, device=device), n_clusters)
@@ -1,12 +1,16 @@
+import atexit
 import os
+import queue
 import subprocess
+import threading
+import time
 import uuid
 from abc import abstractmethod, ABC
+from concurrent.futures import Future
 from os.path import join as pj
 from typing import Optional
 
 import numpy as np
-import pandas as pd
 import torch
 from sklearn.base import BaseEstimator, ClusterMixin
 
@@ -37,21 +41,153 @@ class KernelEstimator(BaseEstimator, ClusterMixin, ABC):
         return self.labels_
 
 
-class REstimatorWrapper(KernelEstimator, ABC):
-    RSCRIPT_ROOT_PATH = pj(os.path.dirname(os.path.abspath(__file__)), 'r')
+class RWorker:
+    """
+    Persistent worker process for the R estimators (r/worker.r), kernlab is loaded once and the process lives across
+    predict calls. Requests are served one at a time from a queue, every request is a line on the stdin of the worker
+        <method> <kernel path> <n> <n_clusters> <result path>
+    The kernel is passed as raw float64 in column-major order (the layout of an R matrix), the labels come back as raw
+    int32. The worker answers with a line "pygkernels ok" or "pygkernels error <message>", other output is skipped.
+    The files are created in /dev/shm when it exists, so the exchange doesn't touch the disk.
+    """
+    COMMAND = ['Rscript', '--vanilla', pj(os.path.dirname(os.path.abspath(__file__)), 'r', 'worker.r')]
+
+    _shared = {}
+
+    def __init__(self, command=None, tmp_dir=None):
+        self.command = list(command) if command is not None else self.COMMAND
+        if tmp_dir is None and os.path.isdir('/dev/shm'):
+            tmp_dir = '/dev/shm'
+        self.tmp_dir = tmp_dir
+        self._process, self._lines = None, None
+        self._requests = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, command=None):
+        """
+        One worker per command for the whole python process, stopped at exit
+        """
+        key = tuple(command) if command is not None else tuple(cls.COMMAND)
+        if key not in cls._shared:
+            cls._shared[key] = cls(key)
+        return cls._shared[key]
+
+    @classmethod
+    def close_shared(cls):
+        for worker in cls._shared.values():
+            worker.close()
+        cls._shared.clear()
+
+    def submit(self, method, K, n_clusters, timeout=None) -> Future:
+        future = Future()
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._serve, daemon=True)
+                self._thread.start()
+            self._requests.put((future, method, K, n_clusters, timeout))
+        return future
+
+    def predict(self, method, K, n_clusters, timeout=None):
+        return self.submit(method, K, n_clusters, timeout).result()
+
+    def close(self):
+        with self._thread_lock:
+            if self._thread is not None:
+                self._requests.put(None)
+                self._thread.join()
+                self._thread = None
+        self._stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
-    def _predict(self, K, script_name):
-        temp_name = f"{uuid.uuid4()}.csv"
-        np.savetxt(temp_name, K, delimiter=",")
+    def _serve(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                break
+            future, method, K, n_clusters, timeout = request
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self._run(method, K, n_clusters, timeout))
+            except Exception as e:
+                future.set_exception(e)
+
+    def _start(self):
+        self._process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                         universal_newlines=True, bufsize=1)
+        self._lines = queue.Queue()
+        threading.Thread(target=self._read, args=(self._process.stdout, self._lines), daemon=True).start()
+
+    @staticmethod
+    def _read(stdout, lines):
+        for line in stdout:
+            lines.put(line)
+        lines.put(None)  # the worker has exited
+
+    def _stop(self):
+        if self._process is None:
+            return
         try:
-            subprocess.check_output(
-                ["Rscript", "--vanilla", pj(REstimatorWrapper.RSCRIPT_ROOT_PATH, script_name),
-                 temp_name, str(self.n_clusters)], timeout=60)
-            result = list(pd.read_csv(temp_name + '_result.csv')['x'])
+            self._process.stdin.close()  # the worker leaves its loop at the end of the input
+            self._process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self._process.kill()
+            self._process.wait()
+        self._process = None
+
+    def _run(self, method, K, n_clusters, timeout):
+        if self._process is None or self._process.poll() is not None:
+            self._start()
+        K = np.asarray(K, dtype=np.float64)
+        temp_name = pj(self.tmp_dir, str(uuid.uuid4())) if self.tmp_dir is not None else str(uuid.uuid4())
+        kernel_path, result_path = temp_name + '.bin', temp_name + '_result.bin'
+        try:
+            K.T.tofile(kernel_path)  # C order of K.T is the column-major order of K
+            try:
+                self._process.stdin.write(f'{method} {kernel_path} {K.shape[0]} {n_clusters} {result_path}\n')
+                self._process.stdin.flush()
+            except OSError:
+                pass  # the worker has exited, the reader reports it
+            deadline = time.monotonic() + timeout if timeout is not None else None
+            while True:
+                try:
+                    line = self._lines.get(timeout=max(deadline - time.monotonic(), 0) if deadline is not None else None)
+                except queue.Empty:
+                    self._process.kill()
+                    self._stop()
+                    raise subprocess.TimeoutExpired(self.command, timeout)
+                if line is None:
+                    returncode = self._process.wait()
+                    self._process = None
+                    raise subprocess.CalledProcessError(returncode, self.command)
+                if line.startswith('pygkernels '):
+                    break
+            status, _, message = line[len('pygkernels '):].rstrip('\n').partition(' ')
+            if status != 'ok':
+                raise subprocess.CalledProcessError(1, self.command, output=message)
+            return list(np.fromfile(result_path, dtype=np.int32))
         finally:
-            os.remove(temp_name)
-            os.remove(temp_name + '_result.csv')
-        return result
+            for path in [kernel_path, result_path]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+atexit.register(RWorker.close_shared)
+
+
+class REstimatorWrapper(KernelEstimator, ABC):
+    WORKER_COMMAND = RWorker.COMMAND
+    TIMEOUT = None
+
+    def _predict(self, K, method):
+        return RWorker.shared(self.WORKER_COMMAND).predict(method, K, self.n_clusters, timeout=self.TIMEOUT)
 
 
 def torch_func(func):
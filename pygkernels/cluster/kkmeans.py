@@ -1,18 +1,24 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
 import numpy as np
+from scipy.sparse import csr_matrix
 
 from pygkernels.cluster import _kkmeans_pytorch as _backend
 from pygkernels.cluster.base import KernelEstimator
 
 
 class KMeans_Fouss(KernelEstimator, ABC):
+    """
+    Every restart draws from its own np.random.Generator seeded by (random_state, init_idx), so the restarts are
+    independent: n_jobs > 1 runs them in a thread pool (torch releases the GIL) with bit-identical results.
+    """
     EPS = 10 ** -10
     INIT_NAMES = ['one', 'all', 'k-means++']
 
     def __init__(self, n_clusters, n_init=10, max_rerun=5, max_iter=100, init='k-means++', init_measure='modularity',
-                 random_state=42, device=None):
+                 random_state=42, device=None, n_jobs=1):
         super().__init__(n_clusters, random_state=random_state, device=device)
 
         self.n_init = n_init
@@ -20,15 +26,19 @@ class KMeans_Fouss(KernelEstimator, ABC):
         self.max_iter = max_iter
         self.init = init
         self.init_measure = init_measure
+        self.n_jobs = n_jobs
 
     def fit(self, K, y=None, sample_weight=None):
         self.labels_ = self.predict(K)
         return self
 
-    def _init_simple(self, K, init):
+    def _rng(self, init_idx: int):
+        seed = None if self.random_state is None else [self.random_state, init_idx]
+        return np.random.default_rng(seed)
+
+    def _init_simple(self, K, init, rng: np.random.Generator):
         n = K.shape[0]
-        q_idx = np.arange(n)
-        np.random.shuffle(q_idx)
+        q_idx = rng.permutation(n)
 
         h = np.zeros((self.n_clusters, n), dtype=np.float64)
         if init == 'one':  # one: choose one node for each cluster
@@ -43,11 +53,11 @@ class KMeans_Fouss(KernelEstimator, ABC):
             raise NotImplementedError()
         return h
 
-    def _init_h(self, K: np.array, init: str):
+    def _init_h(self, K: np.array, init: str, rng: np.random.Generator):
         if init in ['one', 'all']:
-            h = self._init_simple(K, init=init)
+            h = self._init_simple(K, init, rng)
         elif init == 'k-means++':
-            h = _backend.kmeanspp(K, self.n_clusters, device=self.device)
+            h = _backend.kmeanspp(K, self.n_clusters, rng, device=self.device)
         else:
             raise NotImplementedError()
         return h
@@ -62,12 +72,12 @@ class KMeans_Fouss(KernelEstimator, ABC):
         return quality
 
     def _predict_successful_once(self, K: np.array, init_idx: int, init: str, A: Optional[np.array] = None):
-        np.random.seed(self.random_state + init_idx)
+        rng = self._rng(init_idx)
         labels, inertia, modularity = None, np.nan, np.nan
         for _ in range(self.max_rerun):
             try:
                 K = K.astype(np.float64)
-                labels, inertia, modularity, success = self._predict_once(K, init, A=A)
+                labels, inertia, modularity, success = self._predict_once(K, init, rng, A=A)
                 if success:
                     quality = self._choose_measure_to_detect_best_trial(inertia, modularity)
                     return labels, quality, inertia, modularity
@@ -79,17 +89,23 @@ class KMeans_Fouss(KernelEstimator, ABC):
         return labels, quality, inertia, modularity
 
     @abstractmethod
-    def _predict_once(self, K: np.array, init: str, A: Optional[np.array] = None):
+    def _predict_once(self, K: np.array, init: str, rng: np.random.Generator, A: Optional[np.array] = None):
         pass
 
+    def _predict_all(self, K: np.array, init: str, A: Optional[np.array] = None):
+        if self.n_jobs == 1:
+            return [self._predict_successful_once(K, i, init, A=A) for i in range(self.n_init)]
+        with ThreadPoolExecutor(max_workers=self.n_jobs) as executor:
+            return list(executor.map(lambda i: self._predict_successful_once(K, i, init, A=A), range(self.n_init)))
+
     def predict(self, K, explicit=False, A: Optional[np.array] = None):
         if A is not None:
-            A = A.astype(np.float32)
+            A = csr_matrix(A, dtype=np.float64)
 
         inits, best_labels, best_quality = [], None, np.inf
         init_names = self.INIT_NAMES if self.init == 'any' else [self.init]
         for init in init_names:
-            results = [self._predict_successful_once(K, i, init, A=A) for i in range(self.n_init)]
+            results = self._predict_all(K, init, A=A)
             for labels, quality, inertia, modularity in results:
                 if explicit:
                     inits.append({
@@ -115,11 +131,65 @@ class KKMeans(KMeans_Fouss):
 
     name = 'KKMeans'
 
-    def _predict_once(self, K: np.array, init: str, A: Optional[np.array] = None):
-        h_init = self._init_h(K, init)
+    def _predict_once(self, K: np.array, init: str, rng: np.random.Generator, A: Optional[np.array] = None):
+        h_init = self._init_h(K, init, rng)
         labels, inertia, modularity, is_ok = _backend.predict(K, h_init, self.max_iter, A, device=self.device)
         return labels, inertia, modularity, is_ok
 
+    def _predict_batch(self, K: np.array, h_inits: list, A: Optional[np.array] = None):
+        try:
+            labels, inertia, modularity, success = _backend.predict_batch(K, np.stack(h_inits), self.max_iter, A,
+                                                                          device=self.device)
+            return [(labels[i], inertia[i], modularity[i] if modularity is not None else None, success[i])
+                    for i in range(len(h_inits))]
+        except Exception:  # one bad restart shouldn't fail the others
+            results = []
+            for h_init in h_inits:
+                try:
+                    results.append(_backend.predict(K, h_init, self.max_iter, A, device=self.device))
+                except Exception:
+                    results.append(None)
+            return results
+
+    def _predict_all(self, K: np.array, init: str, A: Optional[np.array] = None):
+        """
+        All restarts run as one batch [n_init, k, n]. A restart with an empty cluster is rerun (up to max_rerun
+        times) with the next init drawn from its own random stream, so the results are the same as one by one.
+        With n_jobs > 1 the inits are drawn in a thread pool
+        """
+        K = K.astype(np.float64)
+        rngs = [self._rng(init_idx) for init_idx in range(self.n_init)]
+        last = [(None, np.nan, np.nan, False)] * self.n_init
+
+        def draw_init(init_idx):
+            try:
+                return self._init_h(K, init, rngs[init_idx])
+            except Exception:
+                return None
+
+        pending = list(range(self.n_init))
+        for _ in range(self.max_rerun):
+            if self.n_jobs == 1:
+                h_inits = [draw_init(init_idx) for init_idx in pending]
+            else:
+                with ThreadPoolExecutor(max_workers=self.n_jobs) as executor:
+                    h_inits = list(executor.map(draw_init, pending))
+            started = [init_idx for init_idx, h_init in zip(pending, h_inits) if h_init is not None]
+            h_inits = [h_init for h_init in h_inits if h_init is not None]
+            if started:
+                for init_idx, result in zip(started, self._predict_batch(K, h_inits, A=A)):
+                    if result is not None:
+                        last[init_idx] = result
+            pending = [init_idx for init_idx in pending if not last[init_idx][3]]
+            if not pending:
+                break
+
+        results = []
+        for labels, inertia, modularity, _ in last:
+            quality = self._choose_measure_to_detect_best_trial(inertia, modularity)
+            results.append((labels, quality, inertia, modularity))
+        return results
+
 
 class KKMeans_iterative(KMeans_Fouss):
     """Kernel K-means clustering
@@ -132,8 +202,128 @@ class KKMeans_iterative(KMeans_Fouss):
 
     name = 'KKMeans_iterative'
 
-    def _predict_once(self, K: np.array, init: str, A: Optional[np.array] = None):
-        h_init = self._init_h(K, init)
-        labels, inertia, modularity, is_ok = _backend.iterative_predict(K, h_init, self.max_iter, self.EPS, A,
+    def _predict_once(self, K: np.array, init: str, rng: np.random.Generator, A: Optional[np.array] = None):
+        h_init = self._init_h(K, init, rng)
+        labels, inertia, modularity, is_ok = _backend.iterative_predict(K, h_init, self.max_iter, self.EPS, A, rng,
                                                                         device=self.device)
         return labels, inertia, modularity, is_ok
+
+
+class KKMeans_minibatch(KernelEstimator):
+    """Mini-batch kernel K-means clustering for large node sets
+    The centroids are combinations of a budgeted support set of nodes, c_k = Σ_j α_kj φ_j. Every iteration assigns
+    a random batch of nodes to the nearest centroids, ||φ_i - c_k||^2 = K_ii - 2K_iS α_k + α_k^T K_SS α_k, and moves
+    every centroid to its nodes with the decaying step 1/(number of nodes it got so far), i.e. keeps it the running
+    mean of its nodes. Only the blocks K[batch, support] are read; past max_support nodes every centroid keeps its
+    heaviest nodes. The final assignment reads K[:, support] in chunks.
+    K is a symmetric matrix (dense or memmap) or a callable K(rows, cols) returning the block K[rows][:, cols], its
+    number of nodes goes to fit/fit_predict/predict as n (or K.shape of a callable object); A is not used.
+    Reference
+    ---------
+    D. Sculley. Web-scale k-means clustering. WWW 2010
+    """
+
+    name = 'KKMeans_minibatch'
+
+    def __init__(self, n_clusters, batch_size=256, max_iter=100, max_support=1024, n_init=3, tol=1e-4,
+                 random_state=42, device=None):
+        super().__init__(n_clusters, random_state=random_state, device=device)
+
+        self.batch_size = batch_size
+        self.max_iter = max_iter
+        self.max_support = max_support
+        self.n_init = n_init
+        self.tol = tol
+
+    @staticmethod
+    def _block(K, rows, cols):
+        return np.asarray(K(rows, cols) if callable(K) else K[np.ix_(rows, cols)], dtype=np.float64)
+
+    @staticmethod
+    def _distances(K_diag, K_S, alpha, K_SS):
+        return K_diag[:, None] - 2 * K_S.dot(alpha.T) + np.sum(alpha.dot(K_SS) * alpha, axis=1)[None, :]
+
+    def _init_centroids(self, K, n, rng: np.random.Generator):
+        sample = rng.choice(n, min(n, max(3 * self.batch_size, 3 * self.n_clusters)), replace=False)
+        h = _backend.kmeanspp(self._block(K, sample, sample), self.n_clusters, rng, device=self.device)
+        support = sample[np.argmax(h, axis=1)]
+        return support, np.eye(self.n_clusters), self._block(K, support, support)
+
+    def _prune(self, support, alpha, K_SS):
+        """
+        Every centroid keeps its max_support / k heaviest nodes and stays a convex combination
+        """
+        per_cluster = max(1, self.max_support // self.n_clusters)
+        keep = np.unique(np.argsort(-alpha, axis=1, kind='stable')[:, :per_cluster])
+        alpha = alpha[:, keep]
+        alpha /= np.sum(alpha, axis=1, keepdims=True)
+        return support[keep], alpha, K_SS[np.ix_(keep, keep)]
+
+    def _fit_once(self, K, n, rng: np.random.Generator):
+        support, alpha, K_SS = self._init_centroids(K, n, rng)
+        counts = np.ones(self.n_clusters)
+        for _ in range(self.max_iter):
+            batch = rng.choice(n, min(n, self.batch_size), replace=False)
+            K_diag = np.diagonal(self._block(K, batch, batch))
+            labels = np.argmin(self._distances(K_diag, self._block(K, batch, support), alpha, K_SS), axis=1)
+
+            # extend the support by the batch nodes
+            new = batch[~np.isin(batch, support)]
+            K_new = self._block(K, new, np.concatenate([support, new]))
+            K_SS = np.block([[K_SS, K_new[:, :len(support)].T], [K_new]])
+            support = np.concatenate([support, new])
+            alpha_old = np.hstack([alpha, np.zeros((self.n_clusters, len(new)))])
+
+            # running means of the nodes of every centroid
+            position = {node: pos for pos, node in enumerate(support)}
+            alpha = alpha_old * counts[:, None]
+            np.add.at(alpha, (labels, [position[i] for i in batch]), 1.)
+            counts = counts + np.bincount(labels, minlength=self.n_clusters)
+            alpha /= counts[:, None]
+
+            shift = alpha - alpha_old
+            converged = np.mean(np.sum(shift.dot(K_SS) * shift, axis=1)) <= self.tol * np.mean(np.abs(K_diag))
+            if len(support) > self.max_support:
+                support, alpha, K_SS = self._prune(support, alpha, K_SS)
+            if converged:
+                break
+        return support, alpha, K_SS
+
+    def _inertia(self, K, idx, support, alpha, K_SS):
+        K_diag = np.diagonal(self._block(K, idx, idx))
+        distances = self._distances(K_diag, self._block(K, idx, support), alpha, K_SS)
+        labels = np.argmin(distances, axis=1)
+        return labels, np.sum(distances[np.arange(len(idx)), labels])
+
+    def fit(self, K, y=None, sample_weight=None, n: Optional[int] = None):
+        self.labels_ = self.predict(K, n=n)
+        return self
+
+    def fit_predict(self, X, y=None, n: Optional[int] = None):
+        self.fit(X, y, n=n)
+        return self.labels_
+
+    def predict(self, K, A: Optional[np.array] = None, n: Optional[int] = None):
+        """
+        n is the number of nodes, required for a callable K without shape
+        """
+        if n is None:
+            if not hasattr(K, 'shape'):
+                raise ValueError('n is required for a callable K')
+            n = K.shape[0]
+        validation = np.random.default_rng(self.random_state).choice(n, min(n, 4 * self.batch_size), replace=False)
+        best, best_inertia = None, np.inf
+        for init_idx in range(self.n_init):
+            rng = np.random.default_rng(None if self.random_state is None else [self.random_state, init_idx])
+            centroids = self._fit_once(K, n, rng)
+            inertia = self._inertia(K, validation, *centroids)[1] if self.n_init > 1 else 0.
+            if inertia < best_inertia or best is None:  # the restarts are compared on the same sample of nodes
+                best, best_inertia = centroids, inertia
+        self.support_, self.alpha_, _ = best
+
+        labels, self.inertia_ = np.empty(n, dtype=np.int64), 0.
+        for start in range(0, n, 4 * self.batch_size):
+            idx = np.arange(start, min(n, start + 4 * self.batch_size))
+            labels[idx], inertia = self._inertia(K, idx, *best)
+            self.inertia_ += inertia
+        return labels
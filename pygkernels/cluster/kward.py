@@ -1,6 +1,7 @@
 from typing import Optional
 
 import numpy as np
+from scipy.sparse import csr_matrix
 
 from pygkernels.cluster import _kward_pytorch
 from pygkernels.cluster.base import KernelEstimator
@@ -9,8 +10,30 @@ from pygkernels.cluster.base import KernelEstimator
 class KWard(KernelEstimator):
     name = 'KWard'
 
-    def __init__(self, n_clusters, device=None, random_state=None):
+    def __init__(self, n_clusters, device=None, random_state=None, connectivity=None):
+        """
+        connectivity: adjacency matrix, only clusters joined by an edge are merged (until the components are
+        exhausted); True means the A passed to predict
+        """
         super().__init__(n_clusters, device=device, random_state=random_state)
+        self.connectivity = connectivity
 
     def predict(self, K, A: Optional[np.array] = None):
-        return _kward_pytorch.predict(K, n_clusters=self.n_clusters, device=self.device)
+        self.linkage_ = self.linkage(K, A)
+        return self.cut(self.n_clusters)
+
+    def linkage(self, K, A: Optional[np.array] = None):
+        """
+        Full merge tree as a SciPy linkage matrix; it only depends on K, so it can be stored alongside the kernel
+        and cut at any number of clusters later
+        """
+        connectivity = A if self.connectivity is True else self.connectivity
+        if connectivity is None:
+            return _kward_pytorch.linkage(K, device=self.device)
+        return _kward_pytorch.connected_linkage(K, csr_matrix(connectivity), device=self.device)
+
+    def cut(self, n_clusters, Z: Optional[np.array] = None):
+        return _kward_pytorch.cut(self.linkage_ if Z is None else Z, n_clusters)
+
+    def cut_many(self, ks, Z: Optional[np.array] = None):
+        return [self.cut(n_clusters, Z) for n_clusters in ks]
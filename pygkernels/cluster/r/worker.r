@@ -0,0 +1,29 @@
+#! /usr/bin/Rscript
+
+# Persistent worker of pygkernels.cluster.base.RWorker, one request per line of stdin:
+#   <method> <kernel path> <n> <n_clusters> <result path>
+# The kernel is raw float64 in column-major order, the labels are written as raw int32.
+
+suppressMessages(library(kernlab))
+
+methods <- list(
+    kkmeans=function(K, centers) kkmeans(K, centers=centers),
+    specc=function(K, centers) specc(K, centers=centers)
+)
+
+input <- file("stdin", open="r")
+while (length(line <- readLines(input, n=1)) > 0) {
+    args <- strsplit(line, " ", fixed=TRUE)[[1]]
+    answer <- tryCatch({
+        n <- strtoi(args[3])
+        d <- matrix(readBin(args[2], "double", n=n * n), nrow=n, ncol=n)
+        K <- as.kernelMatrix(d)
+
+        Clusters <- methods[[args[1]]](K, strtoi(args[4]))
+
+        writeBin(as.integer(Clusters@.Data), args[5], size=4)
+        "ok"
+    }, error=function(e) paste("error", gsub("\n", " ", conditionMessage(e))))
+    cat("pygkernels ", answer, "\n", sep="")
+    flush(stdout())
+}
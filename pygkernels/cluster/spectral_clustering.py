@@ -1,6 +1,8 @@
 from typing import Optional
 
 import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import eigs, eigsh, lobpcg, aslinearoperator
 from sklearn.cluster import KMeans
 
 from pygkernels.cluster.base import KernelEstimator
@@ -8,16 +10,75 @@ from pygkernels.cluster.base import KernelEstimator
 
 class SpectralClustering_rubanov(KernelEstimator):
     name = 'SpectralClustering_rubanov'
+    EIGENSOLVERS = ['auto', 'dense', 'arpack', 'lobpcg']
+    DENSE_MAX_SIZE = 500  # 'auto' takes the full symmetric eigendecomposition up to this size
 
-    def __init__(self, n_clusters, n_init=10, random_state=None):
+    def __init__(self, n_clusters, n_init=10, random_state=None, eigensolver='auto'):
+        """
+        eigensolver: 'dense' (np.linalg.eigh), 'arpack' (Lanczos, scipy eigsh) or 'lobpcg'; the partial solvers also
+        take sparse matrices and linear operators and are warm started from the eigenvectors of the previous predict.
+        Non-symmetric kernels go to np.linalg.eig or eigs (Arnoldi)
+        """
         super().__init__(n_clusters)
+        assert eigensolver in self.EIGENSOLVERS
         self.n_init = n_init
         self.random_state = random_state
+        self.eigensolver = eigensolver
+        self._last_vec = None
 
-    def _max_ort(self, M):
-        val, vec = np.linalg.eig(M)
-        ind = np.argpartition(val, -self.n_clusters)[-self.n_clusters:]
-        return vec[:, ind]
+    def _warm_start(self, n):
+        if self._last_vec is not None and self._last_vec.shape == (n, self.n_clusters):
+            return self._last_vec
+        return None
+
+    @staticmethod
+    def _is_symmetric(M):
+        if isinstance(M, np.ndarray):
+            return np.allclose(M, M.T)
+        if sparse.issparse(M):
+            diff = abs(M - M.T)
+            return diff.nnz == 0 or diff.max() <= 1e-8 + 1e-5 * abs(M).max()
+        return False  # a linear operator can't be checked, predict(K, symmetric=True) says it is
+
+    def _max_ort(self, M, symmetric=None):
+        """
+        Eigenvectors of the n_clusters largest eigenvalues; symmetric=None checks dense and sparse M, linear operators
+        are taken as non-symmetric
+        """
+        n, is_dense = M.shape[0], isinstance(M, np.ndarray)
+        is_symmetric = self._is_symmetric(M) if symmetric is None else symmetric
+        eigensolver = self.eigensolver
+        if eigensolver == 'auto':
+            eigensolver = 'dense' if is_dense and n <= self.DENSE_MAX_SIZE else 'arpack'
+        if not is_dense and (eigensolver == 'dense' or self.n_clusters >= n - 1):
+            M = M.toarray() if sparse.issparse(M) else aslinearoperator(M).matmat(np.eye(n))
+
+        if not is_symmetric:  # e.g. PPR: the general eigenproblem, eigs (Arnoldi) for the partial solvers
+            if eigensolver == 'dense' or self.n_clusters >= n - 1:
+                val, vec = np.linalg.eig(M)
+                ind = np.argpartition(val, -self.n_clusters)[-self.n_clusters:]
+                return np.real_if_close(vec[:, ind], tol=1e6)
+            warm_start = self._warm_start(n)
+            v0 = np.sum(warm_start, axis=1) if warm_start is not None else None
+            val, vec = eigs(M, k=self.n_clusters, which='LR', v0=v0)
+            vec = np.real_if_close(vec, tol=1e6)
+            self._last_vec = vec
+            return vec
+
+        if eigensolver == 'dense' or self.n_clusters >= n - 1:
+            val, vec = np.linalg.eigh(M)
+            return vec[:, -self.n_clusters:]
+
+        warm_start = self._warm_start(n)
+        if eigensolver == 'arpack':
+            v0 = np.sum(warm_start, axis=1) if warm_start is not None else None
+            val, vec = eigsh(M, k=self.n_clusters, which='LA', v0=v0)
+        else:
+            X = warm_start if warm_start is not None else \
+                np.random.default_rng(self.random_state).standard_normal((n, self.n_clusters))
+            val, vec = lobpcg(aslinearoperator(M), X, largest=True, tol=1e-8, maxiter=500)
+        self._last_vec = vec
+        return vec
 
     def _sign_flip(self, X):
         max_pos = np.argmax(np.abs(X), axis=0)
@@ -25,8 +86,28 @@ class SpectralClustering_rubanov(KernelEstimator):
         S = np.diag(sgns)
         return X.dot(S)
 
-    def predict(self, K, A: Optional[np.array] = None):
-        X = self._max_ort(K)
+    def predict_params(self, kernel, params):
+        """
+        Labels for every param of the kernel. Where the kernel is an increasing spectral function of one operator M
+        (kernel.spectral_operator(param) is not None), the top eigenvectors of K(param) are the top eigenvectors of M:
+        M is decomposed and the embedding is clustered once for all these params, the others are predicted one by one
+        """
+        shared_labels, results = None, []
+        for param in params:
+            M = kernel.spectral_operator(param)
+            if M is not None:
+                if shared_labels is None:
+                    shared_labels = self.predict(M, symmetric=True)
+                results.append(shared_labels.copy())
+            else:
+                results.append(self.predict(kernel.get_K(param)))
+        return results
+
+    def predict(self, K, A: Optional[np.array] = None, symmetric=None):
+        """
+        symmetric: whether K is symmetric, None checks dense and sparse K; pass True for a symmetric linear operator
+        """
+        X = self._max_ort(K, symmetric=symmetric)
         X = self._sign_flip(X)
         cls = KMeans(n_clusters=self.n_clusters, n_init=self.n_init, random_state=self.random_state)
         prd = cls.fit_predict(X)
@@ -33,6 +33,10 @@ class Ward_sklearn(KernelEstimator):
 
 
 class SpectralClustering_sklearn(KernelEstimator):
+    """
+    No predict_params: sklearn embeds the normalized affinity D^{-1/2}WD^{-1/2} of W = K - min(K), the shift and the
+    degrees of W change with the param, so its eigenvectors are not those of the kernel's spectral operator
+    """
     name = 'SpectralClustering_sklearn'
 
     def predict(self, K, A: Optional[np.array] = None):
@@ -43,18 +47,18 @@ class KKMeans_kernlab(REstimatorWrapper):
     name = 'KernelKMeans_kernlab'
 
     def predict(self, K, A: Optional[np.array] = None):
-        return self._predict(K, 'kkmeans.r')
+        return self._predict(K, 'kkmeans')
 
 
 class SpectralClustering_kernlab(REstimatorWrapper):
     name = 'SpectralClustering_kernlab_-min'
 
     def predict(self, K, A: Optional[np.array] = None):
-        return self._predict(K - np.nanmin(K), 'spectral_clustering.r')
+        return self._predict(K - np.nanmin(K), 'specc')
 
 
 class SpectralClustering_kernlab_100(REstimatorWrapper):
     name = 'SpectralClustering_kernlab_+100'
 
     def predict(self, K, A: Optional[np.array] = None):
-        return self._predict(K + 100, 'spectral_clustering.r')
+        return self._predict(K + 100, 'specc')
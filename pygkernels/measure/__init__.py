@@ -1,5 +1,8 @@
 from typing import List, Type
 
+from .context import GraphContext
+from .engine import ProcessEngine
+from .family import MeasureFamily
 from .distance import Distance, SP_D, CT_D, RSP_vanilla_D, FE_vanilla_D, RSP_D, FE_D
 from .kernel import Kernel, CT_H, Katz_H, For_H, Comm_H, Heat_H, NHeat_H, SCT_H, SCCT_H, PPR_H, ModifPPR_H, HeatPR_H, \
     DF_H, Abs_H
@@ -46,7 +49,11 @@ __all__ = [
 
     # Lists
     "distances",
-    "kernels"
+    "kernels",
+
+    "GraphContext",
+    "MeasureFamily",
+    "ProcessEngine"
 ]
 
 distances: List[Type[Distance]] = [Katz_D, logKatz_D, For_D, logFor_D, Comm_D, logComm_D, Heat_D, logHeat_D, NHeat_D,
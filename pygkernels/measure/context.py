@@ -0,0 +1,258 @@
+from collections import OrderedDict
+
+import numpy as np
+from scipy.linalg import expm, lapack, eigvalsh
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import eigsh, ArpackError
+
+from . import shortcuts as h
+from .kron import KronReduction
+
+
+class GraphContext:
+    """
+    Per-graph cache shared by the measures of one graph.
+
+    Several measures are similar (or congruent) to one symmetric matrix:
+        nL = I - S,  S = D^{-1/2}AD^{-1/2}
+        NHeat:    exp(-t*nL)                        = E(t)
+        HeatPR:   exp(-t(I - P))                    = D^{-1/2} E(t) D^{1/2}
+        ModifPPR: (D - αA)^{-1}                      = R(α)
+        PPR:      (I - αP)^{-1} = (D - αA)^{-1}D     = R(α) D
+    The symmetric cores E(t) and R(α) are computed once per param and kept in a small LRU cache, so the siblings
+    cost only an O(n^2) diagonal scaling. Pass the same context to every measure of a graph to share the cores:
+        ctx = GraphContext(A)
+        for kernel_class in kernels:
+            kernel = kernel_class(A, ctx=ctx)
+    The cache holds the last cache_size cores (n^2 floats each): sweep params in the outer loop, as
+    scenario.ParallelByGraphs does for a list of kernels, or raise cache_size to the grid size.
+    The inverse-based kernels keep their own last keep_inverses inverses (none by default, also none for
+    cache_size = 0) for update_edges to correct, see kernel._InverseKernel.
+
+    Matrix functions of block-diagonal matrices are block-diagonal: blockwise() evaluates them per connected component,
+    Σn_i^3 instead of n^3. Isolated nodes are dangling nodes: d = 1 there, so P = D^{-1}A has a zero row.
+
+    With kron_reduction=True the Laplacian-based measures (CT, For, Abs, SP and SP-CT) eliminate pendant trees and
+    chains first and run the dense step on the core only, see KronReduction. The results are the same.
+
+    The inverses are float64. A float32 factorization refined to float64 (shortcuts.refined_solve) pays off for a few
+    right-hand sides only, the measures need full inverses and it is slower there (For_H at n = 2000: 1.13 s vs 0.65 s).
+
+    With engine=ProcessEngine(...) the inverses and exponentials of at least engine.min_size rows are computed by its
+    worker processes, see engine.py.
+    """
+
+    def __init__(self, A: np.ndarray, cache_size: int = 2, kron_reduction=False, engine=None, keep_inverses: int = 0):
+        self.A = A
+        self.cache_size = cache_size
+        self.keep_inverses = keep_inverses
+        self.kron_reduction = kron_reduction
+        self.engine = engine
+        self._operators = {}
+        self._cores = OrderedDict()
+
+    def updated(self, A: np.ndarray):
+        """
+        Fresh context with the same options for the changed graph
+        """
+        return GraphContext(A, cache_size=self.cache_size, kron_reduction=self.kron_reduction, engine=self.engine,
+                            keep_inverses=self.keep_inverses)
+
+    def _use_engine(self, X: np.ndarray):
+        return self.engine is not None and X.shape[0] >= self.engine.min_size
+
+    def inv(self, M: np.ndarray, fallback=np.linalg.inv):
+        """
+        M^{-1}, on the engine for large M; fallback(M) computes it otherwise (also for singular M on the engine)
+        """
+        if self._use_engine(M):
+            try:
+                return self.engine.inv(M)
+            except np.linalg.LinAlgError:
+                pass
+        return fallback(M)
+
+    def expm(self, X: np.ndarray):
+        """
+        exp(X), on the engine for large X
+        """
+        return self.engine.expm(X) if self._use_engine(X) else expm(X)
+
+    def cached(self, name, func):
+        """
+        Param-independent operator of the graph, computed by func() on the first request
+        """
+        if name not in self._operators:
+            self._operators[name] = func()
+        return self._operators[name]
+
+    @property
+    def is_symmetric(self):
+        return self.cached('is_symmetric', lambda: np.allclose(self.A, self.A.T))
+
+    @property
+    def degrees(self):
+        """
+        d = A*e; d = 1 for isolated nodes
+        """
+
+        def calc():
+            d = np.sum(self.A, axis=0).astype(np.float64)
+            d[d == 0] = 1.
+            return d
+
+        return self.cached('d', calc)
+
+    @property
+    def has_isolated_nodes(self):
+        return self.cached('has_isolated_nodes', lambda: bool(np.any(np.sum(self.A != 0, axis=0) == 0)))
+
+    @property
+    def components(self):
+        """
+        Node indices of every (weakly) connected component
+        """
+
+        def calc():
+            n_components, labels = connected_components(csr_matrix(self.A), directed=True, connection='weak')
+            if n_components == 1:
+                return [np.arange(self.A.shape[0])]
+            order = np.argsort(labels, kind='stable')
+            return np.split(order, np.cumsum(np.bincount(labels))[:-1])
+
+        return self.cached('components', calc)
+
+    def blockwise(self, func, X: np.ndarray, fill=0.):
+        """
+        Y = func(X) for X block-diagonal over the connected components, off-block entries of Y are fill
+        """
+        if len(self.components) == 1:
+            return func(X)
+        Y = np.full(X.shape, fill, dtype=np.float64)
+        for idx in self.components:
+            block = np.ix_(idx, idx)
+            Y[block] = func(X[block])
+        return Y
+
+    @property
+    def component_lambda_max(self):
+        """
+        Rightmost eigenvalue of A on every component
+        """
+
+        def calc(A):
+            if A.shape[0] < 3 or not self.is_symmetric:
+                return np.max(np.real(np.linalg.eigvals(A)))
+            try:
+                return eigsh(A.astype(np.float64), k=1, which='LA', v0=np.ones(A.shape[0]),
+                             return_eigenvectors=False)[0]
+            except ArpackError:
+                return eigvalsh(A)[-1]
+
+        return self.cached('component_lambda_max',
+                           lambda: np.array([calc(self.A[np.ix_(idx, idx)]) for idx in self.components]))
+
+    @property
+    def lambda_max(self):
+        """
+        Rightmost eigenvalue of A (the spectral radius for undirected graphs)
+        """
+        return np.max(self.component_lambda_max)
+
+    @property
+    def lambda_min(self):
+        """
+        Leftmost eigenvalue of A for undirected graphs (-ρ(A) is used for directed ones)
+        """
+
+        def calc():
+            if not self.is_symmetric:
+                return -np.max(np.abs(np.linalg.eigvals(self.A)))
+            if self.A.shape[0] < 3:
+                return eigvalsh(self.A)[0]
+            try:
+                return eigsh(self.A.astype(np.float64), k=1, which='SA', v0=np.ones(self.A.shape[0]),
+                             return_eigenvectors=False)[0]
+            except ArpackError:
+                return eigvalsh(self.A)[0]
+
+        return self.cached('lambda_min', calc)
+
+    @property
+    def d_sqrt(self):
+        """
+        d^{1/2}
+        """
+        return self.cached('d_sqrt', lambda: np.sqrt(self.degrees))
+
+    @property
+    def normalized_L(self):
+        """
+        nL = I - D^{-1/2}AD^{-1/2}
+        """
+
+        def calc():
+            d_12 = 1. / self.d_sqrt
+            nL = -(d_12[:, None] * self.A * d_12[None, :])
+            nL[np.diag_indices_from(nL)] += 1.
+            return nL
+
+        return self.cached('nL', calc)
+
+    def kron(self, exclude=None):
+        """
+        Elimination of the pendant trees and chains, exclude is the ground node
+        """
+        return self.cached(('kron', exclude), lambda: KronReduction(self.A, exclude=exclude))
+
+    @property
+    def ground(self):
+        """
+        Ground node for the Laplacian: a node of the largest degree, it always belongs to the core
+        """
+        return self.cached('ground', lambda: int(np.argmax(np.sum(self.A != 0, axis=0))))
+
+    def _core(self, key, func):
+        if key in self._cores:
+            self._cores.move_to_end(key)
+            return self._cores[key]
+        core = func()
+        if self.cache_size > 0:
+            self._cores[key] = core
+            while len(self._cores) > self.cache_size:
+                self._cores.popitem(last=False)
+        return core
+
+    def heat_core(self, t):
+        """
+        E(t) = exp(-t*nL)
+        """
+        return self._core(('heat', t), lambda: self.blockwise(self.expm, -t * self.normalized_L))
+
+    def log_heat_core(self, t):
+        """
+        log(E(t)) element-wise, see shortcuts.logexpm
+        """
+        return self._core(('log_heat', t),
+                          lambda: self.blockwise(h.logexpm, -t * self.normalized_L, fill=-np.inf))
+
+    def resolvent_core(self, alpha):
+        """
+        R(α) = (D - αA)^{-1}
+        Symmetric positive definite for 0 <= α < 1 on undirected graphs without isolated nodes: inverted through
+        Cholesky, which also keeps the small entries accurate for the log measures. Falls back to the LU inverse.
+        """
+
+        def cholesky_inv(M):
+            c, info = lapack.dpotrf(M, lower=False) if self.is_symmetric else (None, -1)
+            if info == 0:
+                Minv, info = lapack.dpotri(c, lower=False)
+                if info == 0:
+                    return np.triu(Minv) + np.triu(Minv, 1).T
+            return np.linalg.inv(M)
+
+        def calc():
+            return self.blockwise(lambda M: self.inv(M, fallback=cholesky_inv), np.diag(self.degrees) - alpha * self.A)
+
+        return self._core(('resolvent', alpha), calc)
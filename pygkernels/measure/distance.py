@@ -1,28 +1,53 @@
 from abc import ABC
+from typing import Optional
 
 import numpy as np
-from scipy.sparse.csgraph import shortest_path
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import shortest_path, connected_components
 from sklearn.utils import deprecated
 
+from . import elementwise
 from . import shortcuts as h
 from . import scaler
+from .context import GraphContext
+from .kron import laplacian_pinv
 
 
 class Distance(ABC):
     name, _default_scaler, power = None, None, None
     _parent_kernel_class = None
 
-    def __init__(self, A):
+    def __init__(self, A, ctx: Optional[GraphContext] = None):
+        self.ctx = ctx if ctx is not None else GraphContext(A)
         if self._parent_kernel_class:
-            self._parent_kernel = self._parent_kernel_class(A)
+            self._parent_kernel = self._parent_kernel_class(A, ctx=self.ctx)
             self._default_scaler = self._parent_kernel._default_scaler
         self.scaler = self._default_scaler(A)
         self.A = A
 
+    def condition_estimate(self, param):
+        """
+        See Kernel.condition_estimate
+        """
+        return self._parent_kernel.condition_estimate(param) if self._parent_kernel_class else 1.
+
+    def is_well_conditioned(self, param, max_condition=1e12):
+        return self.condition_estimate(param) <= max_condition
+
+    def update_edges(self, added=(), removed=(), max_updates=None):
+        """
+        Applies edge changes of the undirected graph (see shortcuts.edit_edges) to the measure.
+        Distances produced from kernels forward them to the parent kernel
+        """
+        if not self._parent_kernel_class:
+            raise NotImplementedError()
+        self._parent_kernel.update_edges(added, removed, max_updates=max_updates)
+        self.A, self.ctx, self.scaler = self._parent_kernel.A, self._parent_kernel.ctx, self._parent_kernel.scaler
+
     def get_D(self, param):
         H = self._parent_kernel.get_K(param)
         D = h.K_to_D(H)
-        return np.power(D, self.power) if self.power else D
+        return elementwise.ewpower(D, self.power, out=D) if self.power else D  # D is a fresh temporary
 
     def grid_search(self, params=np.linspace(0, 1, 55)):
         results = np.array((params.shape[0],))
@@ -32,28 +57,127 @@ class Distance(ABC):
 
 
 class SP_D(Distance):
+    """
+    Edge lengths are 1/A. The all-pairs distances are kept between calls and maintained under update_edges:
+    a shorter (or new) edge (i, j) of length l relaxes every pair at once, D = min(D, D_{:i} + l + D_{j:}, ...),
+    in O(n^2); a longer (or removed) edge invalidates only the sources whose shortest path trees use it, and these rows
+    are recomputed by Dijkstra. Past max_updates changes, or if most of the sources are affected, D is recomputed.
+    """
     name, _default_scaler = 'SP', scaler.Linear
+    max_updates = 32
 
-    def get_D(self, param):
+    def __init__(self, A, ctx: Optional[GraphContext] = None):
+        super().__init__(A, ctx=ctx)
+        self._D = None
+
+    @staticmethod
+    def _lengths(A):
         with np.errstate(divide='ignore', invalid='ignore'):
-            A = np.divide(1., self.A, where=lambda x: x != 0)
-        return np.array(shortest_path(A, directed=False), dtype=np.float64)
+            return np.divide(1., A, where=lambda x: x != 0)
+
+    def _shortest_path(self, A, indices=None):
+        if indices is None:
+            return np.array(shortest_path(self._lengths(A), directed=False), dtype=np.float64)
+        G = csr_matrix(A, dtype=np.float64)  # Dijkstra from a few sources, skip validating the dense graph
+        G.data = 1. / G.data
+        return np.array(shortest_path(G, directed=False, indices=indices), dtype=np.float64)
+
+    def get_D(self, param):
+        if self._D is None:
+            if self.ctx.kron_reduction and self.ctx.is_symmetric:
+                self._D = self.ctx.kron().shortest_path(self._lengths(self.A))
+            else:
+                self._D = self._shortest_path(self.A)
+        return self._D.copy()
+
+    def update_edges(self, added=(), removed=(), max_updates=None):
+        max_updates = self.max_updates if max_updates is None else max_updates
+        A_new = h.edit_edges(self.A, added, removed)[0]
+        D = self._D
+        if D is not None and len(added) + len(removed) <= max_updates and self.ctx.is_symmetric:
+            edges = {tuple(sorted(edge[:2])) for edge in list(added) + list(removed)}
+            lengths, new_lengths = self._lengths(self.A), self._lengths(A_new)
+            longer = [(i, j) for i, j in edges if new_lengths[i, j] > lengths[i, j]]
+            shorter = [(i, j) for i, j in edges if new_lengths[i, j] < lengths[i, j]]
+            D = D.copy()
+            if longer:
+                # source s uses edge (i, j) iff it lies on a shortest path: |D_si - D_sj| = l_ij
+                affected = np.zeros(D.shape[0], dtype=bool)
+                for i, j in longer:
+                    affected |= np.isclose(np.abs(D[:, i] - D[:, j]), lengths[i, j])
+                if len(longer) == 1:  # unless the farther end keeps another predecessor on a shortest path
+                    i, j = longer[0]
+                    for u, v in [(i, j), (j, i)]:
+                        through = affected & np.isclose(D[:, u] + lengths[u, v], D[:, v])
+                        rest = np.isfinite(new_lengths[:, v]) & (np.arange(D.shape[0]) != u)
+                        kept = np.any(np.isclose(D[np.ix_(through, rest)] + new_lengths[rest, v][None, :],
+                                                 D[through, v][:, None]), axis=1)
+                        affected[np.flatnonzero(through)[kept]] = False
+                sources = np.flatnonzero(affected)
+                if len(sources) > D.shape[0] // 2:
+                    D = None
+                else:
+                    A_longer = h.edit_edges(self.A, [(i, j, A_new[i, j]) for i, j in longer])[0]
+                    D[sources] = self._shortest_path(A_longer, indices=sources)
+                    D[:, sources] = D[sources].T
+            if D is not None:
+                for i, j in shorter:
+                    l_ij = new_lengths[i, j]
+                    np.minimum(D, D[:, i:i + 1] + l_ij + D[j:j + 1, :], out=D)
+                    np.minimum(D, D[:, j:j + 1] + l_ij + D[i:i + 1, :], out=D)
+        else:
+            D = None
+        self.A, self.ctx = A_new, self.ctx.updated(A_new)
+        self._D = D
 
 
 class CT_D(Distance):
     name, _default_scaler = 'CT', scaler.Linear
 
+    def __init__(self, A, ctx: Optional[GraphContext] = None):
+        super().__init__(A, ctx=ctx)
+        self._Linv = None
+
+    @staticmethod
+    def _pinv(L):
+        E_n = np.ones(L.shape) / L.shape[0]
+        return np.linalg.inv(L + E_n) - E_n
+
+    def _calc_Linv(self):
+        """
+        L^+ = (L + E/n)^{-1} - E/n on every connected component; kept between calls and corrected by Woodbury formula
+        in update_edges
+        """
+        if self._Linv is None:
+            if self.ctx.kron_reduction and self.ctx.is_symmetric and len(self.ctx.components) == 1:
+                self._Linv = laplacian_pinv(h.get_L(self.A), self.ctx.kron(self.ctx.ground))
+            else:
+                self._Linv = self.ctx.blockwise(self._pinv, h.get_L(self.A))
+        return self._Linv
+
+    def update_edges(self, added=(), removed=(), max_updates=None):
+        A_new, idx, dA = h.edit_edges(self.A, added, removed)
+        max_updates = SP_D.max_updates if max_updates is None else max_updates
+        if self._Linv is not None and len(added) + len(removed) <= max_updates and self.ctx.is_symmetric \
+                and len(self.ctx.components) == 1 and connected_components(A_new)[0] == 1:
+            E_n = 1. / self.A.shape[0]
+            Minv = h.woodbury(self._Linv + E_n, idx, np.diag(np.sum(dA, axis=0)) - dA)
+            self._Linv = Minv - E_n if Minv is not None else None
+        else:
+            self._Linv = None
+        self.A, self.ctx = A_new, self.ctx.updated(A_new)
+
     def commute_distance(self):
         """
         Original code copyright (C) Ulrike Von Luxburg, Python implementation by James McDermott.
         """
         size = self.A.shape[0]
-        L = h.get_L(self.A)
-
-        Linv = np.linalg.inv(L + np.ones(L.shape) / size) - np.ones(L.shape) / size
+        Linv = self._calc_Linv()
 
         Linv_diag = np.diag(Linv).reshape((size, 1))
         Rexact = Linv_diag * np.ones((1, size)) + np.ones((size, 1)) * Linv_diag.T - 2 * Linv
+        if len(self.ctx.components) > 1:  # no walks between the components
+            Rexact[self.ctx.blockwise(np.zeros_like, Rexact, fill=1.) != 0] = np.inf
 
         # convert from a resistance distance to a commute time distance
         vol = np.sum(self.A)
@@ -67,11 +191,11 @@ class CT_D(Distance):
 
 @deprecated()
 class RSP_vanilla_like(Distance, ABC):
-    def __init__(self, A):
+    def __init__(self, A, ctx: Optional[GraphContext] = None):
         """
         P^{ref} = D^{-1}*A, D = Diag(A*e)
         """
-        super().__init__(A)
+        super().__init__(A, ctx=ctx)
 
         self.size = A.shape[0]
         self.e = np.ones((self.size, 1))
@@ -81,7 +205,7 @@ class RSP_vanilla_like(Distance, ABC):
 
     def WZ(self, beta):
         W = self.Pref * np.exp(-beta * self.C)
-        Z = np.linalg.pinv(self.I - W)
+        Z = self.ctx.blockwise(np.linalg.pinv, self.I - W)
         return W, Z
 
 
@@ -128,8 +252,8 @@ class FE_vanilla_D(RSP_vanilla_like):
 
 # From https://github.com/jmmcd/GPDistance
 class _RSP_like(Distance, ABC):
-    def __init__(self, A):
-        super().__init__(A)
+    def __init__(self, A, ctx: Optional[GraphContext] = None):
+        super().__init__(A, ctx=ctx)
 
         max = np.finfo('d').max
         eps = 0.00000001
@@ -159,12 +283,20 @@ class _RSP_like(Distance, ABC):
         s[s == 0] = 1  # avoid zero-division
         self.Pref = tmp / (s * self.onesT).T
 
+    def condition_estimate(self, beta):
+        """
+        w = ||W||_∞ = max row sum of P^{ref} ◦ exp(-βC) < 1: κ_∞(I - W) <= (1 + w)/(1 - w); w -> 1 as β -> 0
+        """
+        with np.errstate(over='ignore'):  # C is the max float for non-edges
+            w = np.max(np.sum(np.exp(-beta * self.C) * self.Pref, axis=1))
+        return (1 + w) / (1 - w) if w < 1 else np.inf
+
     def WZ(self, beta):
         # Computation of the W and Z matrices
         W = np.exp(-beta * self.C) * self.Pref
 
-        # compute Z
-        Z = np.linalg.inv(self.I - W)
+        # compute Z, per connected component
+        Z = self.ctx.blockwise(self.ctx.inv, self.I - W)
         return W, Z
 
 
@@ -214,9 +346,8 @@ class FE_D(_RSP_like):
 
         # If there any 0 values in Zh (because of isolated nodes), taking
         # log will raise a divide-by-zero error -- ignore it
-        np.seterr(divide='ignore')
-        FE = -np.log(Zh) / beta
-        np.seterr(divide='raise')
+        with np.errstate(divide='ignore'):
+            FE = -np.log(Zh) / beta
         D_FE = 0.5 * (FE + FE.T)
 
         # Just in case, set diagonals to zero:
@@ -0,0 +1,96 @@
+"""
+Chunked element-wise transforms of dense n×n matrices.
+
+Every transform walks the matrix in blocks of CHUNK_SIZE elements (small enough to stay in cache), so the only
+full-size allocation is the output. Blocks are processed by a thread pool: numpy ufuncs release the GIL.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+CHUNK_SIZE = 2 ** 16  # elements per block: 512KB of float64
+N_THREADS = os.cpu_count() or 1
+
+_executor, _executor_threads = None, None
+
+
+def set_n_threads(n_threads: int):
+    global N_THREADS
+    N_THREADS = max(1, int(n_threads))
+
+
+def _get_executor():
+    global _executor, _executor_threads
+    if _executor is None or _executor_threads != N_THREADS:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _executor, _executor_threads = ThreadPoolExecutor(max_workers=N_THREADS), N_THREADS
+    return _executor
+
+
+def _prepare_out(X, out):
+    if out is None:
+        return np.empty(X.shape, dtype=np.result_type(X.dtype, np.float64))
+    if out.shape != X.shape:
+        raise ValueError(f'out has shape {out.shape}, expected {X.shape}')
+    if not out.flags.c_contiguous:
+        raise ValueError('out must be C-contiguous')
+    return out
+
+
+def ewapply(func, X: np.ndarray, out: np.ndarray = None):
+    """
+    Apply func(x_block, out_block) to every block of X. out=X makes the transform in-place.
+    """
+    X = np.ascontiguousarray(X)
+    out = _prepare_out(X, out)
+    x_flat, out_flat = X.reshape(-1), out.reshape(-1)
+    bounds = [(start, min(start + CHUNK_SIZE, x_flat.shape[0])) for start in range(0, x_flat.shape[0], CHUNK_SIZE)]
+
+    def run(bound):
+        start, stop = bound
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):  # error state is thread-local
+            func(x_flat[start:stop], out_flat[start:stop])
+
+    if N_THREADS == 1 or len(bounds) == 1:
+        for bound in bounds:
+            run(bound)
+    else:
+        list(_get_executor().map(run, bounds))
+    return out
+
+
+def _log_block(x, out):
+    negative = x < 0
+    np.log(x, out=out)
+    out[negative] = -np.inf
+
+
+def ewlog(K: np.ndarray, out: np.ndarray = None):
+    """
+    logK = element-wise log(K), log(x) = -inf for x <= 0
+    """
+    return ewapply(_log_block, K, out=out)
+
+
+def ewpower(X: np.ndarray, power: float, out: np.ndarray = None):
+    """
+    X^p element-wise
+    """
+    return ewapply(lambda x, o: np.power(x, power, out=o), X, out=out)
+
+
+def ewsigmoid(X: np.ndarray, alpha: float, out: np.ndarray = None):
+    """
+    H = 1/(1 + exp(-αX)) element-wise
+    """
+
+    def sigmoid_block(x, o):
+        np.multiply(x, -alpha, out=o)
+        np.exp(o, out=o)
+        o += 1.
+        np.reciprocal(o, out=o)
+
+    return ewapply(sigmoid_block, X, out=out)
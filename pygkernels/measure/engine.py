@@ -0,0 +1,383 @@
+"""
+Multi-process engine for the dense O(n^3) steps on very large single graphs.
+
+One process with threaded BLAS is bound by the memory bandwidth of one socket. ProcessEngine runs a few local worker
+processes instead, by default one per NUMA node, each pinned to the CPUs of its node and running threaded BLAS there.
+Matrices live in shared memory; row blocks (and column blocks of the right-hand sides) are distributed block-cyclically.
+Every shared array is first touched (zeroed) by the workers, each in its own row blocks, before the parent writes to it,
+so the pages of a row block are on the memory of the node of the worker that updates it in the factorizations and
+products (the column blocks of the solves are spread across the nodes).
+
+    inv:   blocked right-looking Cholesky (symmetric M) or LU with partial pivoting; the panels are factored by the
+           parent, the O(n^3) trailing updates and the triangular solves for the inverse by the workers
+    expm:  Padé(13) with scaling and squaring (Higham, 2005), every matrix product by the workers
+
+    with ProcessEngine(n_processes=4) as engine:
+        ctx = GraphContext(A, engine=engine)
+        K = For_H(A, ctx=ctx).get_K(t)
+
+The context sends the matrices of at least engine.min_size rows to the engine, smaller ones stay in the process.
+"""
+
+import multiprocessing as mp
+import os
+import weakref
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from scipy.linalg import lapack, cholesky, solve_triangular, LinAlgError
+
+_PADE13 = [64764752532480000., 32382376266240000., 7771770303897600., 1187353796428800., 129060195264000.,
+           10559470521600., 670442572800., 33522128640., 1323241920., 40840800., 960960., 16380., 182., 1.]
+_THETA13 = 5.371920351148152
+
+# worker side: shared memory segments attached by the worker, by name
+_segments = {}
+
+
+def _array(desc):
+    name, shape = desc
+    if name not in _segments:
+        _segments[name] = SharedMemory(name=name)
+    return np.ndarray(shape, dtype=np.float64, buffer=_segments[name].buf)
+
+
+def _release(names):
+    for name in names:
+        if name in _segments:
+            _segments.pop(name).close()
+
+
+def _worker_main(conn, cpus, n_threads):
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+    from threadpoolctl import threadpool_limits
+    limits = threadpool_limits(n_threads)  # noqa: F841, kept for the lifetime of the worker
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        func, args = task
+        try:
+            conn.send((True, func(*args)))
+        except Exception as e:
+            conn.send((False, e))
+    _release(list(_segments.keys()))
+
+
+def _touch_rows(a_desc, row_blocks):
+    """
+    A[rows] = 0, the first touch puts the pages of the rows on the memory of the node of the worker
+    """
+    A = _array(a_desc)
+    for r0, r1 in row_blocks:
+        A[r0:r1] = 0.
+
+
+def _matmul_rows(a_desc, b_desc, c_desc, row_blocks):
+    """
+    C[rows] = A[rows]*B
+    """
+    A, B, C = _array(a_desc), _array(b_desc), _array(c_desc)
+    for r0, r1 in row_blocks:
+        np.dot(A[r0:r1], B, out=C[r0:r1])
+
+
+def _cholesky_update(m_desc, k0, k1, row_blocks):
+    """
+    M[r, k1:r1] -= L[r, k0:k1]*L[k1:r1, k0:k1]^T, the lower triangle of the trailing matrix
+    """
+    M = _array(m_desc)
+    for r0, r1 in row_blocks:
+        M[r0:r1, k1:r1] -= M[r0:r1, k0:k1].dot(M[k1:r1, k0:k1].T)
+
+
+def _lu_update(m_desc, k0, k1, row_blocks):
+    """
+    M[r, k1:] -= L[r, k0:k1]*U[k0:k1, k1:]
+    """
+    M = _array(m_desc)
+    for r0, r1 in row_blocks:
+        M[r0:r1, k1:] -= M[r0:r1, k0:k1].dot(M[k0:k1, k1:])
+
+
+def _solve_cols(f_desc, perm, b_desc, x_desc, col_blocks):
+    """
+    X[:, c] = M^{-1}B[:, c] from the factorization F of M: Cholesky LL^T if perm is None, else M[perm] = LU.
+    B = None is the identity
+    """
+    F, X = _array(f_desc), _array(x_desc)
+    B = _array(b_desc) if b_desc is not None else None
+    for c0, c1 in col_blocks:
+        if B is not None:
+            rhs = B[:, c0:c1] if perm is None else B[perm, c0:c1]
+        else:
+            rows = np.arange(F.shape[0]) if perm is None else perm
+            rhs = (rows[:, None] == np.arange(c0, c1)[None, :]).astype(np.float64)
+        if perm is None:
+            Y = solve_triangular(F, rhs, lower=True, check_finite=False)
+            X[:, c0:c1] = solve_triangular(F, Y, lower=True, trans='T', check_finite=False)
+        else:
+            Y = solve_triangular(F, rhs, lower=True, unit_diagonal=True, check_finite=False)
+            X[:, c0:c1] = solve_triangular(F, Y, lower=False, check_finite=False)
+
+
+def _parse_cpulist(text):
+    cpus = set()
+    for part in text.strip().split(','):
+        if part:
+            start, _, stop = part.partition('-')
+            cpus.update(range(int(start), int(stop or start) + 1))
+    return cpus
+
+
+def numa_nodes():
+    """
+    CPU sets of the NUMA nodes available to the process; one set of all CPUs if the topology is unknown
+    """
+    available = os.sched_getaffinity(0) if hasattr(os, 'sched_getaffinity') else set(range(os.cpu_count() or 1))
+    nodes, root = [], '/sys/devices/system/node'
+    if os.path.isdir(root):
+        for name in sorted(os.listdir(root)):
+            if name.startswith('node') and name[4:].isdigit():
+                with open(os.path.join(root, name, 'cpulist')) as f:
+                    cpus = _parse_cpulist(f.read()) & available
+                if cpus:
+                    nodes.append(cpus)
+    return nodes if nodes else [available]
+
+
+class _Shared:
+    """
+    float64 array in a shared memory segment owned by the parent
+    """
+
+    def __init__(self, shape):
+        self.shm = SharedMemory(create=True, size=max(int(np.prod(shape)) * 8, 8))
+        self.array = np.ndarray(shape, dtype=np.float64, buffer=self.shm.buf)
+        self.desc = (self.shm.name, shape)
+
+    def free(self):
+        del self.array
+        self.shm.close()
+        self.shm.unlink()
+
+
+class ProcessEngine:
+    def __init__(self, n_processes: int = None, block_size: int = 1024, min_size: int = 4096, numa=True):
+        """
+        n_processes: number of worker processes, one per NUMA node by default;
+        workers are pinned round-robin to the nodes and split the CPUs of a node (numa=False: no pinning)
+        """
+        nodes = numa_nodes() if numa else [set(range(os.cpu_count() or 1))]
+        self.n_processes = n_processes if n_processes is not None else len(nodes)
+        self.block_size = block_size
+        self.min_size = min_size
+
+        cpu_sets = []
+        for i in range(self.n_processes):
+            node = sorted(nodes[i % len(nodes)])
+            k, n_sharing = i // len(nodes), (self.n_processes - i % len(nodes) - 1) // len(nodes) + 1
+            share = node[k * len(node) // n_sharing:(k + 1) * len(node) // n_sharing] or node
+            cpu_sets.append(set(share) if numa else None)
+
+        context = mp.get_context('spawn')  # no fork of a process with running BLAS threads
+        self._conns, self._processes = [], []
+        for cpus in cpu_sets:
+            parent_conn, child_conn = context.Pipe()
+            n_threads = len(cpus) if cpus else max(1, (os.cpu_count() or 1) // self.n_processes)
+            process = context.Process(target=_worker_main, args=(child_conn, cpus, n_threads), daemon=True)
+            process.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._processes.append(process)
+        self._finalizer = weakref.finalize(self, ProcessEngine._shutdown, self._conns, self._processes)
+
+    @staticmethod
+    def _shutdown(conns, processes):
+        for conn in conns:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+    def close(self):
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _blocks(self, start, stop):
+        """
+        Block-cyclic split of [start, stop) by the block grid of the matrix: worker w gets the blocks w, w + P, ...
+        """
+        per_worker = [[] for _ in range(self.n_processes)]
+        first = start // self.block_size
+        for b in range(first, (stop + self.block_size - 1) // self.block_size):
+            bounds = (max(b * self.block_size, start), min((b + 1) * self.block_size, stop))
+            if bounds[0] < bounds[1]:
+                per_worker[b % self.n_processes].append(bounds)
+        return per_worker
+
+    def _run(self, func, args, per_worker):
+        busy = []
+        for conn, blocks in zip(self._conns, per_worker):
+            if blocks:
+                conn.send((func, args + (blocks,)))
+                busy.append(conn)
+        errors = [result for ok, result in (conn.recv() for conn in busy) if not ok]
+        if errors:
+            raise errors[0]
+
+    def _free(self, *arrays):
+        names = [array.desc[0] for array in arrays]
+        for conn in self._conns:
+            conn.send((_release, (names,)))
+        for conn in self._conns:
+            conn.recv()
+        for array in arrays:
+            array.free()
+
+    def _shared(self, shape):
+        """
+        Shared array of zeros; the workers touch their row blocks before the parent writes anything
+        """
+        S = _Shared(shape)
+        self._run(_touch_rows, (S.desc,), self._blocks(0, shape[0]))
+        return S
+
+    def _shared_copy(self, X):
+        S = self._shared(X.shape)
+        S.array[...] = X
+        return S
+
+    def _matmul(self, A: _Shared, B: _Shared, C: _Shared):
+        self._run(_matmul_rows, (A.desc, B.desc, C.desc), self._blocks(0, A.array.shape[0]))
+
+    def _cholesky(self, F: _Shared):
+        """
+        F = M -> L (lower triangle) in place; raises LinAlgError if M is not positive definite
+        """
+        M, n = F.array, F.array.shape[0]
+        for k0 in range(0, n, self.block_size):
+            k1 = min(k0 + self.block_size, n)
+            L_kk = cholesky(M[k0:k1, k0:k1], lower=True, check_finite=False)
+            M[k0:k1, k0:k1] = L_kk
+            if k1 < n:
+                M[k1:, k0:k1] = solve_triangular(L_kk, M[k1:, k0:k1].T, lower=True, check_finite=False).T
+                self._run(_cholesky_update, (F.desc, k0, k1), self._blocks(k1, n))
+
+    def _lu(self, F: _Shared):
+        """
+        F = M -> LU in place (unit L below the diagonal), returns perm: M[perm] = LU
+        """
+        M, n = F.array, F.array.shape[0]
+        perm = np.arange(n)
+        for k0 in range(0, n, self.block_size):
+            k1 = min(k0 + self.block_size, n)
+            lu, piv, info = lapack.dgetrf(M[k0:, k0:k1])
+            if info > 0:
+                raise LinAlgError('Singular matrix')
+            # the interchanges of the panel applied one by one (laswp) to the rows outside of it, O(n) per pivot
+            for i, p in enumerate(piv):
+                if p != i:
+                    a, b = k0 + i, k0 + p
+                    M[[a, b], :k0] = M[[b, a], :k0]
+                    M[[a, b], k1:] = M[[b, a], k1:]
+                    perm[a], perm[b] = perm[b], perm[a]
+            M[k0:, k0:k1] = lu
+            if k1 < n:
+                M[k0:k1, k1:] = solve_triangular(lu[:k1 - k0], M[k0:k1, k1:], lower=True, unit_diagonal=True,
+                                                 check_finite=False)
+                self._run(_lu_update, (F.desc, k0, k1), self._blocks(k1, n))
+        return perm
+
+    def _factor(self, F: _Shared, M: np.ndarray = None):
+        """
+        F = M -> its Cholesky factorization if M is symmetric positive definite, else LU; returns perm (None for
+        Cholesky). M is the matrix F was copied from (None: not symmetric), F is restored from it if Cholesky fails,
+        so there is no second copy of the matrix
+        """
+        if M is not None and np.array_equal(M, M.T):
+            try:
+                self._cholesky(F)
+                return None
+            except LinAlgError:
+                F.array[...] = M
+        return self._lu(F)
+
+    def _solve(self, F: _Shared, perm, B, X: _Shared):
+        self._run(_solve_cols, (F.desc, perm, B.desc if B is not None else None, X.desc),
+                  self._blocks(0, X.array.shape[1]))
+
+    def solve(self, M: np.ndarray, B: np.ndarray = None):
+        """
+        X = M^{-1}B (B = None: M^{-1}); raises LinAlgError for singular M
+        """
+        F = self._shared_copy(M)
+        Bs = self._shared_copy(B) if B is not None else None
+        X = self._shared((M.shape[0], M.shape[0] if B is None else B.shape[1]))
+        shared = [F, X] + ([Bs] if Bs is not None else [])
+        try:
+            self._solve(F, self._factor(F, M), Bs, X)
+            return X.array.copy()
+        finally:
+            self._free(*shared)
+
+    def inv(self, M: np.ndarray):
+        return self.solve(M)
+
+    def matmul(self, A: np.ndarray, B: np.ndarray):
+        As, Bs, C = self._shared_copy(A), self._shared_copy(B), self._shared((A.shape[0], B.shape[1]))
+        try:
+            self._matmul(As, Bs, C)
+            return C.array.copy()
+        finally:
+            self._free(As, Bs, C)
+
+    def expm(self, X: np.ndarray):
+        """
+        exp(X) = r_13(X/2^s)^{2^s}, r_13 = (V - U)^{-1}(V + U) is the Padé approximant, s: ||X/2^s||_1 <= θ_13
+            U = X[A_6(b_13A_6 + b_11A_4 + b_9A_2) + b_7A_6 + b_5A_4 + b_3A_2 + b_1I]
+            V = A_6(b_12A_6 + b_10A_4 + b_8A_2) + b_6A_6 + b_4A_4 + b_2A_2 + b_0I
+        """
+        n, b = X.shape[0], _PADE13
+        norm = np.max(np.sum(np.abs(X), axis=0)) if n > 0 else 0.
+        s = max(0, int(np.ceil(np.log2(norm / _THETA13)))) if norm > 0 else 0
+        X1, A2, A4, A6, T, P = shared = [self._shared((n, n)) for _ in range(6)]
+        diag = np.diag_indices(n)
+        try:
+            X1.array[...] = X / 2 ** s
+            self._matmul(X1, X1, A2)
+            self._matmul(A2, A2, A4)
+            self._matmul(A4, A2, A6)
+            a2, a4, a6 = A2.array, A4.array, A6.array
+
+            T.array[...] = b[13] * a6 + b[11] * a4 + b[9] * a2
+            self._matmul(A6, T, P)
+            P.array += b[7] * a6 + b[5] * a4 + b[3] * a2
+            P.array[diag] += b[1]
+            self._matmul(X1, P, T)  # T = U
+
+            P.array[...] = b[12] * a6 + b[10] * a4 + b[8] * a2
+            self._matmul(A6, P, X1)  # X1 = V
+            X1.array += b[6] * a6 + b[4] * a4 + b[2] * a2
+            X1.array[diag] += b[0]
+
+            np.subtract(X1.array, T.array, out=a2)  # A2 = V - U
+            np.add(X1.array, T.array, out=a4)  # A4 = V + U
+            self._solve(A2, self._factor(A2), A4, A6)  # A6 = r_13(X/2^s)
+            R, R_next = A6, P
+            for _ in range(s):
+                self._matmul(R, R, R_next)
+                R, R_next = R_next, R
+            return R.array.copy()
+        finally:
+            self._free(*shared)
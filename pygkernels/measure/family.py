@@ -0,0 +1,79 @@
+from typing import Optional, Type
+
+import numpy as np
+
+from pygkernels.measure import produced
+from pygkernels.measure.context import GraphContext
+from pygkernels.measure.distance import Distance
+from pygkernels.measure.elementwise import ewpower
+from pygkernels.measure.kernel import Kernel
+from . import shortcuts as h
+
+
+def _children(parent_class, base_class):
+    return [cls for cls in vars(produced).values()
+            if isinstance(cls, type) and issubclass(cls, base_class) and cls._parent_kernel_class is parent_class]
+
+
+class MeasureFamily:
+    """
+    Evaluates every variant of a measure family at once:
+        X_H    = K                 (the base kernel)
+        logX_H = log(K)            (element-wise)
+        X_D    = K_to_D(K)^p
+        logX_D = K_to_D(log(K))^p
+    The base kernel is computed once per param instead of once per variant. With reuse_buffers=True the derived
+    matrices are written into buffers owned by the family, so every call overwrites the results of the previous one.
+    Log kernels with their own form (logComm_H and the log heat kernels) are evaluated directly: log(K) of the
+    computed K loses the small entries, and K may overflow.
+
+    family = MeasureFamily(For_H, A)
+    results = family.get_all(param)  # {'For_H': ..., 'logFor_H': ..., 'For_D': ..., 'logFor_D': ...}
+    """
+
+    def __init__(self, kernel_class: Type[Kernel], A: np.ndarray, ctx: Optional[GraphContext] = None,
+                 reuse_buffers=False):
+        self.ctx = ctx if ctx is not None else GraphContext(A)
+        self.kernel = kernel_class(A, ctx=self.ctx)
+        self.scaler = self.kernel.scaler
+        self.reuse_buffers = reuse_buffers
+        self._buffers = {}
+
+        logs = _children(kernel_class, Kernel)
+        self.log_kernel_class = logs[0] if logs else None
+        self.log_kernel = self.log_kernel_class(A, ctx=self.ctx) \
+            if self.log_kernel_class and self.log_kernel_class.get_K is not Kernel.get_K else None
+        self.distance_classes = _children(kernel_class, Distance)
+        self.log_distance_classes = _children(self.log_kernel_class, Distance) if self.log_kernel_class else []
+
+    @property
+    def members(self):
+        return [type(self.kernel)] + ([self.log_kernel_class] if self.log_kernel_class else []) \
+               + self.distance_classes + self.log_distance_classes
+
+    def _buffer(self, name, shape):
+        if not self.reuse_buffers:
+            return None
+        if name not in self._buffers or self._buffers[name].shape != shape:
+            self._buffers[name] = np.empty(shape, dtype=np.float64)
+        return self._buffers[name]
+
+    def _distances(self, K, distance_classes):
+        results = {}
+        for distance_class in distance_classes:
+            D = h.K_to_D(K, out=self._buffer(distance_class.__name__, K.shape))
+            results[distance_class.__name__] = ewpower(D, distance_class.power, out=D) if distance_class.power else D
+        return results
+
+    def get_all(self, param):
+        K = self.kernel.get_K(param)
+        results = {type(self.kernel).__name__: K}
+        results.update(self._distances(K, self.distance_classes))
+        if self.log_kernel_class:
+            if self.log_kernel is not None:
+                logK = self.log_kernel.get_K(param)
+            else:
+                logK = h.ewlog(K, out=self._buffer(self.log_kernel_class.__name__, K.shape))
+            results[self.log_kernel_class.__name__] = logK
+            results.update(self._distances(logK, self.log_distance_classes))
+        return results
@@ -1,10 +1,15 @@
 from abc import ABC
+from collections import OrderedDict
+from typing import Optional
 
 import numpy as np
-from scipy.linalg import expm
+from scipy.sparse.csgraph import connected_components
 
 from pygkernels.measure import scaler
+from . import elementwise
 from . import shortcuts as h
+from .context import GraphContext
+from .kron import laplacian_pinv
 
 
 class Kernel(ABC):
@@ -12,122 +17,366 @@ class Kernel(ABC):
     name, _default_scaler = None, None
     _parent_distance_class, _parent_kernel_class = None, None
 
-    def __init__(self, A: np.ndarray):
+    def __init__(self, A: np.ndarray, ctx: Optional[GraphContext] = None):
         assert not (self._parent_distance_class and self._parent_kernel_class)
+        self.ctx = ctx if ctx is not None else GraphContext(A)
         if self._parent_distance_class:
             self._parent_kernel = None
-            self._parent_distance = self._parent_distance_class(A)
+            self._parent_distance = self._parent_distance_class(A, ctx=self.ctx)
             self._default_scaler = self._parent_distance._default_scaler
         elif self._parent_kernel_class:
-            self._parent_kernel = self._parent_kernel_class(A)
+            self._parent_kernel = self._parent_kernel_class(A, ctx=self.ctx)
             self._parent_distance = None
             self._default_scaler = self._parent_kernel._default_scaler
         self.scaler: scaler.Scaler = self._default_scaler(A)
         self.A = A
 
     def get_K(self, param):
-        if self._parent_distance:  # use D -> K transform
+        if self._parent_distance:  # use D -> K transform per component, distances between components are inf
             D = self._parent_distance.get_D(param)
-            return h.D_to_K(D)
-        elif self._parent_kernel:  # use element-wise log transform
+            return self.ctx.blockwise(h.D_to_K, D)
+        elif self._parent_kernel:  # use element-wise log transform; the parent's output may be cached, keep it intact
             H0 = self._parent_kernel.get_K(param)
             return h.ewlog(H0)
         else:
             raise NotImplementedError()
 
+    def get_K_and_grad(self, param):
+        """
+        K(param) and its element-wise derivative dK/dparam, computed from the same factorization as K.
+        The derivative is w.r.t. the kernel param, not the flat one (chain it with the scaler if needed).
+        Produced log kernels: d(log H) = dH / H, zero where H <= 0
+        """
+        if self._parent_kernel_class:
+            H, dH = self._parent_kernel.get_K_and_grad(param)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                dK = np.where(H > 0, dH / H, 0.)
+            return h.ewlog(H), dK
+        raise NotImplementedError()
+
+    def condition_estimate(self, param):
+        """
+        Cheap upper bound of the condition number of the matrix inverted by the measure for the param, from cached
+        spectral bounds of the graph; inf if the result can't be computed (singular matrix, overflow).
+        Measures without an inversion return 1, produced measures ask the parent one
+        """
+        if self._parent_kernel_class:
+            return self._parent_kernel.condition_estimate(param)
+        elif self._parent_distance_class:
+            return self._parent_distance.condition_estimate(param)
+        return 1.
+
+    def is_well_conditioned(self, param, max_condition=1e12):
+        return self.condition_estimate(param) <= max_condition
+
+    def spectral_operator(self, param):
+        """
+        Symmetric operator M of the graph if K(param) = f(param, M) with f increasing in the eigenvalue on the spectrum
+        of M: then the top eigenvectors of K(param) are the top eigenvectors of M, the same for every such param.
+        None for the other params and kernels and for directed graphs
+        """
+        return None
+
+    def update_edges(self, added=(), removed=(), max_updates=None):
+        """
+        Applies edge changes of the undirected graph (see shortcuts.edit_edges) to the measure.
+        Produced kernels forward them to the parent measure
+        """
+        if self._parent_kernel_class:
+            parent = self._parent_kernel
+        elif self._parent_distance_class:
+            parent = self._parent_distance
+        else:
+            raise NotImplementedError()
+        parent.update_edges(added, removed, max_updates=max_updates)
+        self.A, self.ctx, self.scaler = parent.A, parent.ctx, parent.scaler
+
+
+class _InverseKernel(Kernel, ABC):
+    """
+    Kernel built from the inverse of M(param), where an edge change touches M on the block of its ends only.
+    With GraphContext(A, keep_inverses=k) the last k inverses are kept (none for cache_size = 0); update_edges corrects
+    them by Woodbury formula in O(n^2) per edge instead of recomputing in O(n^3). Past max_updates changes at once the
+    inverses are recomputed on request. get_K returns a copy of a kept inverse, else the inverse itself.
+    """
+    max_updates = 32
+    min_kept = 0
 
-class CT_H(Kernel):
+    def __init__(self, A: np.ndarray, ctx: Optional[GraphContext] = None):
+        super().__init__(A, ctx=ctx)
+        self._inverses = OrderedDict()
+
+    def _calc_inverse(self, param):
+        raise NotImplementedError()
+
+    def _delta_M(self, param, dA, dd):
+        """
+        Change of M(param) on the block of the touched nodes, given the changes of A and of the degrees there
+        """
+        raise NotImplementedError()
+
+    def _can_update(self, A_new):
+        return self.ctx.is_symmetric
+
+    def _inverse(self, param):
+        if param in self._inverses:
+            self._inverses.move_to_end(param)
+            return self._inverses[param]
+        Minv = self._calc_inverse(param)
+        n_kept = max(min(self.ctx.keep_inverses, self.ctx.cache_size), self.min_kept)
+        if n_kept > 0:
+            self._inverses[param] = Minv
+            while len(self._inverses) > n_kept:
+                self._inverses.popitem(last=False)
+        return Minv
+
+    def _own_inverse(self, param):
+        """
+        M^{-1} the caller may modify: copied only if it is kept
+        """
+        Minv = self._inverse(param)
+        return Minv.copy() if param in self._inverses else Minv
+
+    def update_edges(self, added=(), removed=(), max_updates=None):
+        max_updates = self.max_updates if max_updates is None else max_updates
+        A_new, idx, dA = h.edit_edges(self.A, added, removed)
+        inverses = OrderedDict()
+        if len(added) + len(removed) <= max_updates and self._can_update(A_new):
+            dd = np.sum(dA, axis=0)
+            for param, Minv in self._inverses.items():
+                Minv = h.woodbury(Minv, idx, self._delta_M(param, dA, dd))
+                if Minv is not None:  # singular after the update, will be recomputed on request
+                    inverses[param] = Minv
+        self.A = A_new
+        self.ctx = self.ctx.updated(A_new)
+        self.scaler = self._default_scaler(A_new)
+        self._inverses = inverses
+
+
+class CT_H(_InverseKernel):
     name, _default_scaler = 'CT', scaler.Linear
+    min_kept = 1  # L^+ is the kernel itself
 
-    def __init__(self, A: np.ndarray):
-        super().__init__(A)
-        self.K_CT = np.linalg.pinv(h.get_L(self.A))
+    def __init__(self, A: np.ndarray, ctx: Optional[GraphContext] = None):
+        super().__init__(A, ctx=ctx)
+        self._inverse(None)
+
+    @property
+    def K_CT(self):
+        return self._inverse(None)
+
+    def _calc_inverse(self, param):
+        """
+        H = L^+
+        """
+        if self.ctx.kron_reduction and self.ctx.is_symmetric and len(self.ctx.components) == 1:
+            return laplacian_pinv(h.get_L(self.A), self.ctx.kron(self.ctx.ground))
+        return self.ctx.blockwise(np.linalg.pinv, h.get_L(self.A))
+
+    def _delta_M(self, param, dA, dd):
+        return np.diag(dd) - dA
+
+    def _can_update(self, A_new):
+        # (L + UCU^T)^+ follows Woodbury formula only while the null space of L stays the same
+        return super()._can_update(A_new) and connected_components(self.A)[0] == 1 \
+               and connected_components(A_new)[0] == 1
 
     def get_K(self, param=None):
         return self.K_CT
 
 
-class Katz_H(Kernel):
+class Katz_H(_InverseKernel):
     name, _default_scaler = 'Katz', scaler.Rho
 
-    def get_K(self, t):
+    def _calc_inverse(self, t):
         """
         H0 = (I - tA)^{-1}
         """
         size = self.A.shape[0]
-        return np.linalg.pinv(np.eye(size) - t * self.A)
+        return self.ctx.blockwise(lambda M: self.ctx.inv(M, fallback=np.linalg.pinv), np.eye(size) - t * self.A)
 
+    def _delta_M(self, t, dA, dd):
+        return -t * dA
 
-class For_H(Kernel):
-    name, _default_scaler = 'For', scaler.Fraction
+    def condition_estimate(self, t):
+        """
+        κ(I - tA) = (1 - tλ_min)/(1 - tλ_max); the walk series diverges for tλ_max >= 1
+        """
+        lambda_max, lambda_min = self.ctx.lambda_max, self.ctx.lambda_min
+        if t * lambda_max >= 1:
+            return np.inf
+        return (1 - t * lambda_min) / (1 - t * lambda_max)
 
     def get_K(self, t):
+        return self._own_inverse(t)
+
+    def spectral_operator(self, t):
+        """
+        K = f(A), f(t, λ) = 1/(1 - tλ) is increasing only below the pole: tλ_max < 1
+        """
+        return self.A if self.ctx.is_symmetric and t > 0 and t * self.ctx.lambda_max < 1 else None
+
+    def get_K_and_grad(self, t):
+        """
+        dK/dt = (I - tA)^{-1}A(I - tA)^{-1}
+        """
+        K = self._own_inverse(t)
+        return K, K.dot(self.A).dot(K)
+
+
+class For_H(_InverseKernel):
+    name, _default_scaler = 'For', scaler.Fraction
+
+    def _calc_inverse(self, t):
         """
         H0 = (I + tL)^{-1}
         """
         size = self.A.shape[0]
-        return np.linalg.inv(np.eye(size) + t * h.get_L(self.A))
+        M = np.eye(size) + t * h.get_L(self.A)
+        if self.ctx.kron_reduction and self.ctx.is_symmetric:
+            return self.ctx.kron().inv(M, core_inv=self.ctx.inv)
+        return self.ctx.blockwise(self.ctx.inv, M)
+
+    def _delta_M(self, t, dA, dd):
+        return t * (np.diag(dd) - dA)
+
+    def condition_estimate(self, t):
+        """
+        κ(I + tL) <= 1 + t*μ_max, μ_max <= 2*d_max
+        """
+        return 1 + t * 2 * np.max(self.ctx.degrees)
+
+    def get_K(self, t):
+        return self._own_inverse(t)
+
+    def spectral_operator(self, t):
+        """
+        K = f(-L), f(t, λ) = 1/(1 - tλ), increasing for λ <= 0 and t > 0
+        """
+        return -h.get_L(self.A) if self.ctx.is_symmetric and t > 0 else None
+
+    def get_K_and_grad(self, t):
+        """
+        dK/dt = -(I + tL)^{-1}L(I + tL)^{-1}
+        """
+        K = self._own_inverse(t)
+        return K, -K.dot(h.get_L(self.A)).dot(K)
 
 
 class Comm_H(Kernel):
     name, _default_scaler = 'Comm', scaler.Fraction
 
+    def condition_estimate(self, t):
+        """
+        ||exp(tA)|| = exp(tλ_max) overflows for tλ_max > log(max float)
+        """
+        return np.inf if t * self.ctx.lambda_max >= np.log(np.finfo(np.float64).max) else 1.
+
     def get_K(self, t):
         """
         H0 = exp(tA)
         """
-        return expm(t * self.A)  # if t < 30 else None
+        return self.ctx.blockwise(self.ctx.expm, t * self.A)  # if t < 30 else None
+
+    def spectral_operator(self, t):
+        """
+        K = f(A), f(t, λ) = exp(tλ), increasing for t > 0
+        """
+        return self.A if self.ctx.is_symmetric and t > 0 else None
+
+    def get_K_and_grad(self, t):
+        """
+        dH0/dt = A*exp(tA)
+        """
+        K = self.get_K(t)
+        return K, self.A.dot(K)
 
 
 class Heat_H(Kernel):
     name, _default_scaler = 'Heat', scaler.Fraction
 
-    def __init__(self, A: np.ndarray):
-        super().__init__(A)
+    def __init__(self, A: np.ndarray, ctx: Optional[GraphContext] = None):
+        super().__init__(A, ctx=ctx)
         self.L = h.get_L(self.A)
 
     def get_K(self, t):
         """
         H0 = exp(-tL)
         """
-        return expm(-t * self.L)
+        return self.ctx.blockwise(self.ctx.expm, -t * self.L)
+
+    def spectral_operator(self, t):
+        """
+        K = f(-L), f(t, λ) = exp(tλ), increasing for t > 0
+        """
+        return -self.L if self.ctx.is_symmetric and t > 0 else None
+
+    def get_K_and_grad(self, t):
+        """
+        dH0/dt = -L*exp(-tL)
+        """
+        K = self.get_K(t)
+        return K, -self.L.dot(K)
 
 
 class NHeat_H(Kernel):
     name, _default_scaler = 'NHeat', scaler.Fraction
 
-    def __init__(self, A: np.ndarray):
-        super().__init__(A)
-        self.nL = h.get_normalized_L(A)
-
     def get_K(self, t):
         """
         H0 = exp(-t*nL)
         """
-        return expm(-t * self.nL)
+        return self.ctx.heat_core(t).copy()
+
+    def spectral_operator(self, t):
+        """
+        K = f(-nL), f(t, λ) = exp(tλ), increasing for t > 0
+        """
+        return -self.ctx.normalized_L if self.ctx.is_symmetric and t > 0 else None
+
+    def get_K_and_grad(self, t):
+        """
+        dH0/dt = -nL*exp(-t*nL)
+        """
+        K = self.get_K(t)
+        return K, -self.ctx.normalized_L.dot(K)
 
 
 class SCT_H(CT_H):
     name, _default_scaler = 'SCT', scaler.Fraction
 
-    def __init__(self, A: np.ndarray):
-        super().__init__(A)
+    def __init__(self, A: np.ndarray, ctx: Optional[GraphContext] = None):
+        super().__init__(A, ctx=ctx)
+        self._standardize()
+
+    def _standardize(self):
         self.sigma = self.K_CT.std()
         self.Kds = self.K_CT / (self.sigma + self.EPS)
 
+    def update_edges(self, added=(), removed=(), max_updates=None):
+        super().update_edges(added, removed, max_updates=max_updates)
+        self._standardize()
+
     def get_K(self, alpha):
         """
         H = 1/(1 + exp(-αL+/σ))
         """
-        return 1. / (1. + np.exp(-alpha * self.Kds))
+        return elementwise.ewsigmoid(self.Kds, alpha)
+
+    def get_K_and_grad(self, alpha):
+        """
+        dH/dα = L+/σ * H(1 - H)
+        """
+        K = self.get_K(alpha)
+        return K, self.Kds * K * (1. - K)
 
 
 class CCT_H(Kernel):
     name, _default_scaler = 'CCT', scaler.Fraction
 
-    def __init__(self, A: np.ndarray):
-        super().__init__(A)
-        self.K_CCT = self.H_CCT(A)
+    def __init__(self, A: np.ndarray, ctx: Optional[GraphContext] = None):
+        super().__init__(A, ctx=ctx)
+        self.K_CCT = self.ctx.cached('K_CCT', lambda: self.H_CCT(A))
 
     def H_CCT(self, A: np.ndarray):
         """
@@ -136,15 +385,27 @@ class CCT_H(Kernel):
             d is a vector of the diagonal elements of D,
             vol(G) is the volume of the graph (sum of all elements of A)
         K_CCT = HD^{-1/2}M(I - M)^{-1}MD^{-1/2}H
+        For symmetric M = VΛV^T: M(I - M)^+M = V*f(Λ)*V^T, f(λ) = λ^2/(1 - λ) >= 0, so
+        K_CCT = H*WW^T*H, W = D^{-1/2}V*f(Λ)^{1/2}; multiplying by H is subtracting the row and column means
         """
-        size = A.shape[0]
-        I = np.eye(size)
-        d = np.sum(A, axis=0).reshape((-1, 1))
-        D05 = np.diag(np.power(d, -0.5)[:, 0])
-        H = np.eye(size) - np.ones((size, size)) / size
-        volG = np.sum(A)
-        M = D05.dot(A - d.dot(d.transpose()) / volG).dot(D05)
-        return H.dot(D05).dot(M).dot(np.linalg.pinv(I - M)).dot(M).dot(D05).dot(H)
+        d = np.sum(A, axis=0).astype(np.float64)
+        d_12 = 1. / self.ctx.d_sqrt  # isolated nodes: zero rows of M
+        d_sqrt = np.sqrt(d)
+        M = d_12[:, None] * A * d_12[None, :] - np.outer(d_sqrt, d_sqrt) / np.sum(A)
+        if self.ctx.is_symmetric:
+            lmbda, V = np.linalg.eigh(M)
+            gap = 1. - lmbda
+            nonzero = np.abs(gap) > np.max(np.abs(gap)) * 1e-15  # same cutoff as np.linalg.pinv
+            f = np.zeros_like(lmbda)
+            f[nonzero] = lmbda[nonzero] ** 2 / gap[nonzero]
+            W = d_12[:, None] * V * np.sqrt(np.maximum(f, 0))[None, :]
+            K = W.dot(W.T)
+        else:
+            K = M.dot(np.linalg.pinv(np.eye(A.shape[0]) - M)).dot(M)
+            K *= d_12[:, None] * d_12[None, :]
+        K -= K.mean(axis=0, keepdims=True)
+        K -= K.mean(axis=1, keepdims=True)
+        return K
 
     def get_K(self, alpha=None):
         return self.K_CCT
@@ -153,8 +414,8 @@ class CCT_H(Kernel):
 class SCCT_H(CCT_H):
     name, _default_scaler = 'SCCT', scaler.Fraction
 
-    def __init__(self, A: np.ndarray):
-        super().__init__(A)
+    def __init__(self, A: np.ndarray, ctx: Optional[GraphContext] = None):
+        super().__init__(A, ctx=ctx)
         self.sigma = self.K_CCT.std()
         self.Kds = self.K_CCT / self.sigma
 
@@ -162,58 +423,97 @@ class SCCT_H(CCT_H):
         """
         H = 1/(1 + exp(-αL+/σ))
         """
-        return 1. / (1. + np.exp(-alpha * self.Kds))
+        return elementwise.ewsigmoid(self.Kds, alpha)
 
+    def get_K_and_grad(self, alpha):
+        """
+        dH/dα = L+/σ * H(1 - H)
+        """
+        K = self.get_K(alpha)
+        return K, self.Kds * K * (1. - K)
 
-class PPR_H(Kernel):
-    name, _default_scaler = 'PPR', scaler.Linear
 
-    def __init__(self, A: np.ndarray):
-        super().__init__(A)
-        self.I = np.eye(A.shape[0])
-        self.P = h.get_P(A)
+class _ResolventKernel(_InverseKernel, ABC):
+    def _calc_inverse(self, alpha):
+        """
+        R(α) = (D - αA)^{-1}, shared through the context
+        """
+        return self.ctx.resolvent_core(alpha)
+
+    def _delta_M(self, alpha, dA, dd):
+        return np.diag(dd) - alpha * dA
+
+    def condition_estimate(self, alpha):
+        """
+        D - αA = D^{1/2}(I - αS)D^{1/2}, spec(S) ⊂ [-1, 1]: κ <= d_max(1 + α) / (d_min(1 - α))
+        """
+        if alpha >= 1:
+            return np.inf
+        d = self.ctx.degrees
+        return np.max(d) * (1 + alpha) / (np.min(d) * (1 - alpha))
+
+    def _can_update(self, A_new):
+        # isolated nodes have d = 1 instead of 0, the change of D is not dd there
+        return super()._can_update(A_new) and np.all(np.sum(self.A, axis=0) > 0) and np.all(np.sum(A_new, axis=0) > 0)
+
+
+class PPR_H(_ResolventKernel):
+    name, _default_scaler = 'PPR', scaler.Linear
 
     def get_K(self, alpha):
         """
-        H = (I - αP)^{-1}
+        H = (I - αP)^{-1} = (D - αA)^{-1}*D
         """
-        return np.linalg.inv(self.I - alpha * self.P)
+        return self._inverse(alpha) * self.ctx.degrees[None, :]
 
+    def get_K_and_grad(self, alpha):
+        """
+        dH/dα = (D - αA)^{-1}A*H
+        """
+        K = self.get_K(alpha)
+        return K, self._inverse(alpha).dot(self.A).dot(K)
 
-class ModifPPR_H(Kernel):
-    name, _default_scaler = 'ModifPPR', scaler.Linear
 
-    def __init__(self, A: np.ndarray):
-        super().__init__(A)
-        self.D = h.get_D(A)
+class ModifPPR_H(_ResolventKernel):
+    name, _default_scaler = 'ModifPPR', scaler.Linear
 
     def get_K(self, alpha):
         """
         H = (I - αP)^{-1}*D^{-1} = (D - αA)^{-1}
         """
-        return np.linalg.inv(self.D - alpha * self.A)
+        return self._inverse(alpha).copy()
+
+    def get_K_and_grad(self, alpha):
+        """
+        dH/dα = (D - αA)^{-1}A(D - αA)^{-1}
+        """
+        K = self._inverse(alpha)
+        return K.copy(), K.dot(self.A).dot(K)
 
 
 class HeatPR_H(Kernel):
     name, _default_scaler = 'HeatPR', scaler.Fraction
 
-    def __init__(self, A: np.ndarray):
-        super().__init__(A)
-        self.I = np.eye(A.shape[0])
-        self.P = h.get_P(A)
-
     def get_K(self, t):
         """
-        H = expm(-t(I - P))
+        H = expm(-t(I - P)) = D^{-1/2}*expm(-t*nL)*D^{1/2}
         """
-        return expm(-t * (self.I - self.P))
+        d_sqrt = self.ctx.d_sqrt
+        return self.ctx.heat_core(t) * (d_sqrt[None, :] / d_sqrt[:, None])
+
+    def get_K_and_grad(self, t):
+        """
+        dH/dt = -(I - P)H
+        """
+        K = self.get_K(t)
+        return K, h.get_P(self.A).dot(K) - K
 
 
 class DF_H(Kernel):
     name, _default_scaler = 'DF', scaler.Fraction
 
-    def __init__(self, A: np.ndarray, n_iter=30):
-        super().__init__(A)
+    def __init__(self, A: np.ndarray, n_iter=30, ctx: Optional[GraphContext] = None):
+        super().__init__(A, ctx=ctx)
         self.n_iter = n_iter
         self.dfac = self.calc_double_factorial(n_iter)
 
@@ -225,21 +525,55 @@ class DF_H(Kernel):
             mem[i] = mem[i - 2] * i
         return mem
 
-    def get_K(self, t):
-        tA = t * self.A
+    def _series(self, tA):
         K, tA_k = np.eye(tA.shape[0]), np.eye(tA.shape[0])
         for i in range(1, self.n_iter):
             tA_k = tA_k.dot(tA)
             K += tA_k / self.dfac[i]
         return K
 
+    def get_K(self, t):
+        return self.ctx.blockwise(self._series, t * self.A)
+
+    def _series_and_grad(self, t, A):
+        if t == 0:
+            return np.eye(A.shape[0]), A.copy()
+        tA = t * A
+        K, dK, tA_k = np.eye(A.shape[0]), np.zeros(A.shape), np.eye(A.shape[0])
+        for i in range(1, self.n_iter):
+            tA_k = tA_k.dot(tA)
+            K += tA_k / self.dfac[i]
+            dK += tA_k * (i / (t * self.dfac[i]))
+        return K, dK
+
+    def get_K_and_grad(self, t):
+        """
+        dH/dt = Σ_{k>=1} k*t^{k-1}*A^k/k!! = Σ_{k>=1} k*(tA)^k/(t*k!!), term by term with the same powers
+        """
+        K, dK = np.zeros(self.A.shape), np.zeros(self.A.shape)
+        for idx in self.ctx.components:
+            block = np.ix_(idx, idx)
+            K[block], dK[block] = self._series_and_grad(t, self.A[block])
+        return K, dK
+
 
 class Abs_H(Kernel):
     name, _default_scaler = 'Abs', scaler.Fraction
 
-    def __init__(self, A: np.ndarray):
-        super().__init__(A)
+    def __init__(self, A: np.ndarray, ctx: Optional[GraphContext] = None):
+        super().__init__(A, ctx=ctx)
         self.L = h.get_L(A)
 
     def get_K(self, t):
-        return np.linalg.pinv(t * self.A + self.L)
+        if self.ctx.kron_reduction and self.ctx.is_symmetric and 0 < t < 2 and not self.ctx.has_isolated_nodes:
+            # D - (1 - t)A is strictly diagonally dominant, no pivoting is needed
+            return self.ctx.kron().inv(t * self.A + self.L)
+        return self.ctx.blockwise(np.linalg.pinv, t * self.A + self.L)
+
+    def get_K_and_grad(self, t):
+        """
+        dH/dt = -H*A*H, H = (tA + L)^{-1}; also for the pseudo-inverse, the null space (isolated nodes) doesn't
+        depend on t
+        """
+        K = self.get_K(t)
+        return K, -K.dot(self.A).dot(K)
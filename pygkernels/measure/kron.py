@@ -0,0 +1,117 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import shortest_path
+
+
+class KronReduction:
+    """
+    Elimination of pendant trees and chains before a dense O(n^3) step.
+
+    Nodes with at most two neighbours are eliminated one by one (eliminating a node of a chain joins its neighbours by
+    an edge, so the chain shrinks and the tree is peeled leaf by leaf) until only the core is left. For a symmetric M
+    with the sparsity of the graph every step is the Schur complement (Kron reduction)
+        M' = M_RR - M_Rv * M_vR / M_vv
+    so the core matrix stays small, and the inverse is recovered for the eliminated nodes in reverse order from the row
+    of v in M'K = I:
+        K_vw = -Σ_u M_vu * K_uw / M_vv,  w ≠ v
+        K_vv = (1 - Σ_u M_vu * K_uv) / M_vv
+    Shortest paths are reduced the same way in the (min, +) semiring. The elimination order only depends on the graph;
+    the exclude node (the ground for the Laplacian) is left out of the matrix.
+    """
+
+    def __init__(self, A: np.ndarray, exclude=None):
+        self.size = A.shape[0]
+        self.exclude = exclude
+        G = csr_matrix(A)
+        neighbours = [set(G.indices[G.indptr[i]:G.indptr[i + 1]]) - {i} for i in range(self.size)]
+        if exclude is not None:
+            for u in neighbours[exclude]:
+                neighbours[u].discard(exclude)
+            neighbours[exclude] = set()
+
+        self.eliminated, self.neighbours = [], []
+        is_eliminated = np.zeros(self.size, dtype=bool)
+        if exclude is not None:
+            is_eliminated[exclude] = True
+        stack = [v for v in range(self.size) if v != exclude and len(neighbours[v]) <= 2]
+        while stack:
+            v = stack.pop()
+            if is_eliminated[v] or len(neighbours[v]) > 2:
+                continue
+            N = sorted(neighbours[v])
+            for u in N:
+                neighbours[u].discard(v)
+            if len(N) == 2:
+                neighbours[N[0]].add(N[1])
+                neighbours[N[1]].add(N[0])
+            self.eliminated.append(v)
+            self.neighbours.append(np.array(N, dtype=np.int64))
+            is_eliminated[v] = True
+            stack.extend(u for u in N if len(neighbours[u]) <= 2)
+        self.core = np.flatnonzero(~is_eliminated)
+
+        # the core first, then the eliminated nodes in reverse order: every node only refers to the previous ones
+        self.perm = np.concatenate([self.core, np.array(self.eliminated[::-1], dtype=np.int64)])
+        self.pos = np.full(self.size, -1, dtype=np.int64)
+        self.pos[self.perm] = np.arange(len(self.perm))
+
+    def _embed(self, Kp, fill=0.):
+        K = np.full((self.size, self.size), fill, dtype=np.float64)
+        K[np.ix_(self.perm, self.perm)] = Kp
+        return K
+
+    def inv(self, M: np.ndarray, core_inv=np.linalg.inv):
+        """
+        K = M^{-1} for a symmetric M with the sparsity of the graph; zero row and column for the exclude node
+        """
+        M = np.array(M, dtype=np.float64)
+        rows = []
+        for v, N in zip(self.eliminated, self.neighbours):
+            m_vN, m_vv = M[v, N].copy(), M[v, v]
+            M[np.ix_(N, N)] -= np.outer(m_vN, m_vN) / m_vv
+            rows.append((m_vN, m_vv))
+
+        k, n = len(self.core), len(self.perm)
+        Kp = np.empty((n, n), dtype=np.float64)
+        if k > 0:
+            Kp[:k, :k] = core_inv(M[np.ix_(self.core, self.core)])
+        for p, (N, (m_vN, m_vv)) in zip(range(k, n), reversed(list(zip(self.neighbours, rows)))):
+            N = self.pos[N]
+            Kp[p, :p] = -m_vN.dot(Kp[N, :p]) / m_vv
+            Kp[:p, p] = Kp[p, :p]
+            Kp[p, p] = (1. - m_vN.dot(Kp[p, N])) / m_vv
+        return self._embed(Kp)
+
+    def shortest_path(self, lengths: np.ndarray):
+        """
+        All-pairs shortest paths for edge lengths (inf for no edge)
+        """
+        lengths = np.array(lengths, dtype=np.float64)
+        rows = []
+        for v, N in zip(self.eliminated, self.neighbours):
+            l_vN = lengths[v, N].copy()
+            if len(N) == 2:
+                lengths[N[0], N[1]] = lengths[N[1], N[0]] = min(lengths[N[0], N[1]], l_vN[0] + l_vN[1])
+            rows.append(l_vN)
+
+        k, n = len(self.core), len(self.perm)
+        Dp = np.empty((n, n), dtype=np.float64)
+        if k > 0:
+            Dp[:k, :k] = shortest_path(lengths[np.ix_(self.core, self.core)], directed=False)
+        for p, (N, l_vN) in zip(range(k, n), reversed(list(zip(self.neighbours, rows)))):
+            N = self.pos[N]
+            Dp[p, :p] = np.min(l_vN[:, None] + Dp[N, :p], axis=0) if len(N) else np.inf
+            Dp[:p, p] = Dp[p, :p]
+            Dp[p, p] = 0.
+        return self._embed(Dp, fill=np.inf)
+
+
+def laplacian_pinv(L: np.ndarray, reduction: KronReduction):
+    """
+    L^+ = HGH for a connected graph, H = I - E/n, G is the inverse of L grounded at reduction.exclude
+    (zero row and column there)
+    """
+    G = reduction.inv(L)
+    G -= np.mean(G, axis=0, keepdims=True)
+    G -= np.mean(G, axis=1, keepdims=True)
+    return G
@@ -1,6 +1,11 @@
+from typing import Optional
+
+import numpy as np
 from sklearn.utils import deprecated
 
 from pygkernels.measure import scaler, kernel, distance
+from pygkernels.measure import shortcuts as h
+from pygkernels.measure.context import GraphContext
 from pygkernels.measure.distance import Distance, SP_D, CT_D
 from pygkernels.measure.kernel import Kernel, CT_H
 
@@ -9,15 +14,28 @@ from pygkernels.measure.kernel import Kernel, CT_H
 class SPCT_H(Kernel):
     name, _default_scaler = 'SP-CT', scaler.Linear
 
-    def __init__(self, A):
-        super().__init__(A)
-        self.H_SP = SP_K(A).get_K(-1)
-        self.H_CT = 2 * CT_H(A).get_K(-1)
+    def __init__(self, A, ctx: Optional[GraphContext] = None):
+        super().__init__(A, ctx=ctx)
+        self._SP, self._CT = SP_K(A, ctx=self.ctx), CT_H(A, ctx=self.ctx)
+        self._calc_parts()
+
+    def _calc_parts(self):
+        self.H_SP = self._SP.get_K(-1)
+        self.H_CT = 2 * self._CT.get_K(-1)
+
+    def update_edges(self, added=(), removed=(), max_updates=None):
+        self._SP.update_edges(added, removed, max_updates=max_updates)
+        self._CT.update_edges(added, removed, max_updates=max_updates)
+        self.A, self.ctx = self._SP.A, self._SP.ctx
+        self._calc_parts()
 
     def get_K(self, lmbda):
         # when lambda = 0 this is CT, when lambda = 1 this is SP
         return lmbda * self.H_SP + (1. - lmbda) * self.H_CT
 
+    def get_K_and_grad(self, lmbda):
+        return self.get_K(lmbda), self.H_SP - self.H_CT
+
 
 class logKatz_H(Kernel):
     name, _parent_kernel_class = 'logKatz', kernel.Katz_H
@@ -30,14 +48,63 @@ class logFor_H(Kernel):
 class logComm_H(Kernel):
     name, _parent_kernel_class = 'logComm', kernel.Comm_H
 
+    def condition_estimate(self, t):
+        return 1.  # the scaled form doesn't overflow
+
+    def get_K(self, t):
+        """
+        H = log(exp(tA)), exp(tA) itself overflows for large t, see shortcuts.logexpm (for graphs with negative
+        weights: tλ + log(exp(t(A - λI))), λ = λ_max(A))
+        """
+        if len(self.ctx.components) == 1:
+            return h.logexpm(t * self.A, shift=t * self.ctx.lambda_max)
+        logK = np.full(self.A.shape, -np.inf)
+        for idx, lambda_max in zip(self.ctx.components, self.ctx.component_lambda_max):
+            block = np.ix_(idx, idx)
+            logK[block] = h.logexpm(t * self.A[block], shift=t * lambda_max)
+        return logK
+
+    def get_K_and_grad(self, t):
+        """
+        dH/dt = (A*exp(tA)) / exp(tA) element-wise, from H itself, see shortcuts.logexpm_grad
+        """
+        K = self.get_K(t)
+        return K, h.logexpm_grad(self.A, K)
+
 
 class logHeat_H(Kernel):
     name, _parent_kernel_class = 'logHeat', kernel.Heat_H
 
+    def get_K(self, t):
+        """
+        H = log(exp(-tL)), see shortcuts.logexpm
+        """
+        return self.ctx.blockwise(h.logexpm, -t * self._parent_kernel.L, fill=-np.inf)
+
+    def get_K_and_grad(self, t):
+        """
+        dH/dt = (-L*exp(-tL)) / exp(-tL) element-wise, from H itself, see shortcuts.logexpm_grad
+        """
+        K = self.get_K(t)
+        return K, h.logexpm_grad(-self._parent_kernel.L, K)
+
 
 class logNHeat_H(Kernel):
     name, _parent_kernel_class = 'logNHeat', kernel.NHeat_H
 
+    def get_K(self, t):
+        """
+        H = log(exp(-t*nL)), see shortcuts.logexpm; log of the shared heat core would lose its small entries
+        """
+        return self.ctx.log_heat_core(t).copy()
+
+    def get_K_and_grad(self, t):
+        """
+        dH/dt = (-nL*exp(-t*nL)) / exp(-t*nL) element-wise, from H itself, see shortcuts.logexpm_grad
+        """
+        K = self.get_K(t)
+        return K, h.logexpm_grad(-self.ctx.normalized_L, K)
+
 
 class logPPR_H(Kernel):
     name, _parent_kernel_class = 'logPPR', kernel.PPR_H
@@ -50,6 +117,21 @@ class logModifPPR_H(Kernel):
 class logHeatPR_H(Kernel):
     name, _parent_kernel_class = 'logHeatPR', kernel.HeatPR_H
 
+    def get_K(self, t):
+        """
+        H = log(D^{-1/2}*exp(-t*nL)*D^{1/2}) = log(exp(-t*nL)) + (log(d_j) - log(d_i))/2
+        """
+        log_d_sqrt = np.log(self.ctx.d_sqrt)
+        logK = self.ctx.log_heat_core(t) + log_d_sqrt[None, :]
+        logK -= log_d_sqrt[:, None]
+        return logK
+
+    def get_K_and_grad(self, t):
+        """
+        dH/dt = d log(exp(-t*nL))/dt, the degree terms don't depend on t
+        """
+        return self.get_K(t), h.logexpm_grad(-self.ctx.normalized_L, self.ctx.log_heat_core(t))
+
 
 class logDF_H(Kernel):
     name, _parent_kernel_class = 'logDF', kernel.DF_H
@@ -63,11 +145,20 @@ class logAbs_H(Kernel):
 class SPCT_D(Distance):
     name, _default_scaler = 'SP-CT', scaler.Linear
 
-    def __init__(self, A):
-        super().__init__(A)
+    def __init__(self, A, ctx: Optional[GraphContext] = None):
+        super().__init__(A, ctx=ctx)
+        self._SP, self._CT = SP_D(A, ctx=self.ctx), CT_D(A, ctx=self.ctx)
+        self._calc_parts()
+
+    def _calc_parts(self):
+        self.D_SP = self._SP.get_D(-1)
+        self.D_CT = 2 * self._CT.get_D(-1)
 
-        self.D_SP = SP_D(A).get_D(-1)
-        self.D_CT = 2 * CT_D(A).get_D(-1)
+    def update_edges(self, added=(), removed=(), max_updates=None):
+        self._SP.update_edges(added, removed, max_updates=max_updates)
+        self._CT.update_edges(added, removed, max_updates=max_updates)
+        self.A, self.ctx = self._SP.A, self._SP.ctx
+        self._calc_parts()
 
     def get_D(self, lmbda):
         # when lambda = 0 this is CT, when lambda = 1 this is SP
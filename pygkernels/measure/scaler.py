@@ -1,6 +1,20 @@
 from abc import ABC
 
 import numpy as np
+from scipy.sparse.linalg import eigsh, ArpackError
+
+
+def _spectral_radius(A: np.ndarray):
+    """
+    ρ(A); for a symmetric non-negative A this is its largest eigenvalue, found by Lanczos in O(n^2) per iteration
+    """
+    if A.shape[0] > 2 and np.all(A >= 0) and np.allclose(A, A.T):
+        try:
+            return np.abs(eigsh(A.astype(np.float64), k=1, which='LA', v0=np.ones(A.shape[0]),
+                                return_eigenvectors=False)[0])
+        except ArpackError:
+            pass
+    return np.max(np.abs(np.linalg.eigvals(A)))
 
 
 class Scaler(ABC):
@@ -23,8 +37,7 @@ class Linear(Scaler):  # no transformation, for SP-CT
 class AlphaToT(Scaler):  # α > 0 -> 0 < t < α^{-1}
     def __init__(self, A: np.ndarray = None):
         super().__init__(A)
-        cfm = np.linalg.eigvals(self.A)
-        self.rho = np.max(np.abs(cfm))
+        self.rho = _spectral_radius(self.A)
 
     def scale(self, alpha):
         return 1 / ((1 / alpha + self.rho + self.eps) + self.eps)
@@ -33,8 +46,7 @@ class AlphaToT(Scaler):  # α > 0 -> 0 < t < α^{-1}
 class Rho(Scaler):  # pWalk, Walk
     def __init__(self, A: np.ndarray = None):
         super().__init__(A)
-        cfm = np.linalg.eigvals(self.A)
-        self.rho = np.max(np.abs(cfm))
+        self.rho = _spectral_radius(self.A)
 
     def scale(self, t):
         return t / (self.rho + self.eps)
@@ -8,6 +8,7 @@ import numpy as np
 from joblib import Parallel, delayed
 from tqdm import tqdm
 
+from pygkernels.measure import GraphContext
 from pygkernels.util import ddict2dict
 
 d3_category20 = [
@@ -68,7 +69,8 @@ class ParallelByGraphs:
     High-level class for calculate "quality vs. param" plots
     """
 
-    def __init__(self, scorer, params_flat, progressbar=False, verbose=False, ignore_errors=False):
+    def __init__(self, scorer, params_flat, progressbar=False, verbose=False, ignore_errors=False,
+                 skip_ill_conditioned=False, max_condition=1e12):
         self.scorer = scorer
         self.params_flat = params_flat \
             if type(params_flat) == list or type(params_flat) == np.array \
@@ -76,6 +78,8 @@ class ParallelByGraphs:
         self.progressbar = progressbar
         self.verbose = verbose
         self.ignore_errors = ignore_errors
+        self.skip_ill_conditioned = skip_ill_conditioned  # check kernel.is_well_conditioned() before computing
+        self.max_condition = max_condition
 
     def _calc_param(self, param_flat, kernel, estimator, y_true):
         param = kernel.scaler.scale(param_flat)
@@ -95,54 +99,103 @@ class ParallelByGraphs:
         else:
             return func()
 
-    def _calc_graph(self, graph, kernel_class, estimator, graph_idx, single_graph=False):
-        edges, y_true = graph
-        graph_results = {}
-
-        kernel = self.secure_run(partial(kernel_class, edges), f'{kernel_class.name}, graph {graph_idx}')
+    def _prepare_kernel(self, kernel_class, edges, ctx, estimator, y_true, graph_idx, graph_results):
+        """
+        Kernel of the graph on the shared context and its params left to compute one by one
+        """
+        kernel = self.secure_run(partial(kernel_class, edges, ctx=ctx), f'{kernel_class.name}, graph {graph_idx}')
         if kernel is None:
-            return graph_results
+            return None, []
+
+        params = []
+        for param_flat in self.params_flat:
+            if self.skip_ill_conditioned and \
+                    not kernel.is_well_conditioned(kernel.scaler.scale(param_flat), max_condition=self.max_condition):
+                if self.verbose:
+                    logging.warning(f'{kernel_class.name}, graph {graph_idx}: param {param_flat} is ill-conditioned')
+                continue
+            params.append(param_flat)
+
+        # the params with the same eigenvectors at once, from one eigendecomposition
+        shared = [param_flat for param_flat in params
+                  if kernel.spectral_operator(kernel.scaler.scale(param_flat)) is not None] \
+            if hasattr(estimator, 'predict_params') else []
+        if shared:
+            all_y_pred = self.secure_run(
+                partial(estimator.predict_params, kernel, [kernel.scaler.scale(param_flat) for param_flat in shared]),
+                f'{kernel_class.name}, graph {graph_idx}')
+            if all_y_pred is not None:
+                for param_flat, y_pred in zip(shared, all_y_pred):
+                    graph_results[param_flat] = self.scorer(y_true, y_pred)
+                params = [param_flat for param_flat in params if param_flat not in graph_results]
+        return kernel, params
 
-        params = self.params_flat
+    def _calc_graph(self, graph, kernel_classes, estimator, graph_idx, single_graph=False):
+        """
+        {kernel name: {param_flat: score}}. All the kernels of the graph share one GraphContext, and the params are
+        the outer loop: kernels of one family (NHeat, HeatPR, logNHeat, ...) reuse the core of the current param
+        """
+        edges, y_true = graph
+        ctx = GraphContext(edges)
+        results, todo = {}, []
+        for kernel_class in kernel_classes:
+            results[kernel_class.name] = {}
+            kernel, params = self._prepare_kernel(kernel_class, edges, ctx, estimator, y_true, graph_idx,
+                                                  results[kernel_class.name])
+            if params:
+                todo.append((kernel_class, kernel, set(params)))
+
+        params_flat = self.params_flat
         if single_graph and self.progressbar:
-            params = tqdm(params, desc=kernel_class.name)
-        for param_flat in params:
-            score = self.secure_run(partial(self._calc_param, param_flat, kernel, estimator, y_true),
-                                    f'{kernel_class.name}, graph {graph_idx}')
-            if score is not None:
-                graph_results[param_flat] = score
-        return graph_results
+            params_flat = tqdm(params_flat, desc=', '.join(kernel_class.name for kernel_class in kernel_classes))
+        for param_flat in params_flat:
+            for kernel_class, kernel, params in todo:
+                if param_flat not in params:
+                    continue
+                score = self.secure_run(partial(self._calc_param, param_flat, kernel, estimator, y_true),
+                                        f'{kernel_class.name}, graph {graph_idx}')
+                if score is not None:
+                    results[kernel_class.name][param_flat] = score
+        return results
 
     def perform(self, estimator_class, kernel_class, graphs, n_classes, n_jobs=1, n_gpu=2):
-        raw_param_dict = defaultdict(list)
+        """
+        x, y, error of the kernel_class; for a list of kernel classes {name: (x, y, error)}, computed on one
+        GraphContext per graph
+        """
+        kernel_classes = list(kernel_class) if isinstance(kernel_class, (list, tuple)) else [kernel_class]
+        desc = ', '.join(kernel_class.name for kernel_class in kernel_classes)
+        raw_param_dict = {kernel_class.name: defaultdict(list) for kernel_class in kernel_classes}
         if len(graphs) == 1:  # single graph scenario
-            graph_results = self._calc_graph(
-                graphs[0], kernel_class, estimator_class(n_classes, random_state=2000), 0, single_graph=True)
-            for param_flat, ari in graph_results.items():
-                raw_param_dict[param_flat].append(ari)
+            all_graph_results = [self._calc_graph(
+                graphs[0], kernel_classes, estimator_class(n_classes, random_state=2000), 0, single_graph=True)]
         elif n_jobs > 1:  # parallel
             if self.progressbar:
-                graphs = tqdm(graphs, desc=kernel_class.name)
+                graphs = tqdm(graphs, desc=desc)
             all_graph_results = Parallel(n_jobs=n_jobs)(delayed(self._calc_graph)(
-                graph, kernel_class, estimator_class(n_classes, device=graph_idx % n_gpu if n_gpu > 0 else 'cpu',
-                                                     random_state=2000 + graph_idx), graph_idx
+                graph, kernel_classes, estimator_class(n_classes, device=graph_idx % n_gpu if n_gpu > 0 else 'cpu',
+                                                       random_state=2000 + graph_idx), graph_idx
             ) for graph_idx, graph in enumerate(graphs))
-            for graph_results in all_graph_results:
-                for param_flat, ari in graph_results.items():
-                    raw_param_dict[param_flat].append(ari)
         else:
             if self.progressbar:
-                graphs = tqdm(graphs, desc=kernel_class.name)
-            for graph_idx, graph in enumerate(graphs):
-                graph_results = self._calc_graph(
-                    graph, kernel_class, estimator_class(n_classes, random_state=2000 + graph_idx), graph_idx)
-                for param_flat, ari in graph_results.items():
-                    raw_param_dict[param_flat].append(ari)
+                graphs = tqdm(graphs, desc=desc)
+            all_graph_results = (self._calc_graph(
+                graph, kernel_classes, estimator_class(n_classes, random_state=2000 + graph_idx), graph_idx)
+                for graph_idx, graph in enumerate(graphs))
+        for graph_results in all_graph_results:
+            for name, kernel_results in graph_results.items():
+                for param_flat, ari in kernel_results.items():
+                    raw_param_dict[name][param_flat].append(ari)
 
+        results = {name: self._aggregate(param_results, len(graphs)) for name, param_results in raw_param_dict.items()}
+        return results if isinstance(kernel_class, (list, tuple)) else results[kernel_classes[0].name]
+
+    @staticmethod
+    def _aggregate(raw_param_dict, n_graphs):
         param_dict = {}
         for param, values in raw_param_dict.items():
-            # logging.info(f'{param:.2f}: {len(values)}, {0.5 * len(graphs)}')
-            if len(values) >= 0.5 * len(graphs):
+            # logging.info(f'{param:.2f}: {len(values)}, {0.5 * n_graphs}')
+            if len(values) >= 0.5 * n_graphs:
                 param_dict[param] = np.nanmean(values), np.nanstd(values)
         if len(param_dict) > 0:
             x, y, error = zip(*[(x, y[0], y[1]) for x, y in sorted(param_dict.items(), key=lambda x: x[0])])
@@ -1,4 +1,5 @@
-from .score import max_accuracy, rand_index, triplet_measure, ranking, copeland, FC, modularity, modularity2
+from .score import max_accuracy, rand_index, triplet_measure, ranking, copeland, FC, modularity, modularity2, \
+    modularity_batch, kernel_alignment
 from .sns1 import sns1
 
 __all__ = [
@@ -10,5 +11,7 @@ __all__ = [
     'FC',
     'sns1',
     'modularity',
-    'modularity2'
+    'modularity2',
+    'modularity_batch',
+    'kernel_alignment'
 ]
@@ -2,7 +2,7 @@ import itertools
 from collections import defaultdict
 
 import numpy as np
-from scipy import stats
+from scipy import sparse, stats
 
 
 def max_accuracy(y_true, y_pred):
@@ -98,41 +98,56 @@ def FC(comms1, comms2):
     return 1 - 1 / l * max(_getMatch(M, perm) for perm in itertools.permutations(range(max(M.shape))))
 
 
-def modularity(A: np.array, partition):
+def modularity_batch(A, partitions):
     """
-    Simplified version only for undirected graphs
+    Modularity of many labelings of an undirected graph at once, O(m*R + n*R) for R labelings:
+        Q = Σ_c (e_cc - a_c^2 / vol) / vol,  vol = Σ_ij A_ij
+    e_cc = 1_c^T A 1_c is the weight inside class c, a_c = 1_c^T d is its volume. The labelings are one-hot
+    columns of one sparse membership matrix Z [n, R*k], so all e_cc come from the single product A*Z.
+    A is a dense or scipy.sparse matrix, partitions is [R, n]
     """
-    n_edges = np.sum(A)
-    degrees = np.sum(A, axis=1, keepdims=True)
-
-    Q_items = A + np.diagonal(A) - degrees.dot(degrees.T) / n_edges
-    Q = 0
-    for class_name in set(partition):
-        mask = np.array(partition) == class_name
-        Q += np.sum(Q_items[mask][:, mask])
-    return Q / n_edges
+    A = A if sparse.issparse(A) else sparse.csr_matrix(A)
+    A = A.astype(np.float64)
+    partitions = np.asarray(partitions)
+    n_runs, n = partitions.shape
+    labels = np.empty((n_runs, n), dtype=np.int64)
+    for run, partition in enumerate(partitions):
+        labels[run] = np.unique(partition, return_inverse=True)[1]
+    n_classes = np.max(labels) + 1
+    columns = (labels + n_classes * np.arange(n_runs)[:, None]).T  # [n, R]
+    Z = sparse.csr_matrix((np.ones(n * n_runs), columns.reshape(-1), np.arange(0, n * n_runs + 1, n_runs)),
+                          shape=(n, n_runs * n_classes))
+
+    vol = A.sum()
+    degrees = np.asarray(A.sum(axis=1)).reshape(-1)
+    e = np.asarray(Z.multiply(A.dot(Z)).sum(axis=0)).reshape(n_runs, n_classes)
+    a = np.asarray(Z.T.dot(degrees)).reshape(n_runs, n_classes)
+    return np.sum(e - a ** 2 / vol, axis=1) / vol
 
 
-def _create_krondecker(partition):
-    n = len(partition)
-    kron_mask = np.tile(partition, n) == np.repeat(partition, n)
-
-    return np.reshape(kron_mask, (n, n))
+def modularity(A: np.array, partition):
+    """
+    Simplified version only for undirected graphs
+    """
+    return modularity_batch(A, [partition])[0]
 
 
 def modularity2(AIJ, partition):
-    # reverse = {}
-    # for comm_idx, comm in enumerate(partition):
-    #     for item in comm.tolist():
-    #         reverse[item] = comm_idx + 1
-    # partition = [reverse[x] for x in range(len(reverse))]
-
-    n = len(AIJ)
-    m = np.sum(AIJ)  # no of edges
+    return modularity(AIJ, partition)
 
-    k = np.sum(AIJ, axis=1)
-    expectation = np.reshape(np.tile(k, n) * np.repeat(k, n), (n, n)) / m
-    kron = _create_krondecker(partition)
 
-    # Q = (1 / 2m) * SUM(AIJ - (ki.kj / 2m)) ∂(ci, cj)
-    return (1.0 / m) * np.sum(kron * (AIJ - expectation))
\ No newline at end of file
+def kernel_alignment(K: np.array, partition, dK: np.array = None):
+    """
+    Alignment of K with the ideal kernel Y of the partition (Y_ij = 1 if i, j are in the same class, else 0):
+    A(K, Y) = <K, Y> / (||K|| * ||Y||), Frobenius product.
+    If dK = dK/dθ is given, returns (A, dA/dθ), dA = (<dK, Y> - A*||Y||*<dK, K>/||K||) / (||K|| * ||Y||),
+    a smooth objective for gradient search over the kernel parameter
+    """
+    _, y = np.unique(partition, return_inverse=True)
+    Z = np.eye(np.max(y) + 1)[y]  # one-hot n × k, <K, Y> = tr(Z^T K Z)
+    norm_K, norm_Y = np.sqrt(np.sum(K * K)), np.sqrt(np.sum(np.sum(Z, axis=0) ** 2))
+    alignment = np.sum(Z * K.dot(Z)) / (norm_K * norm_Y)
+    if dK is None:
+        return alignment
+    d_alignment = (np.sum(Z * dK.dot(Z)) - alignment * norm_Y * np.sum(dK * K) / norm_K) / (norm_K * norm_Y)
+    return alignment, d_alignment
@@ -17,6 +17,7 @@ setup(
         'pandas',
         'scikit-learn',
         'scipy',
+        'threadpoolctl',
         'tqdm',
         'torch',
         'powerlaw'
@@ -0,0 +1,28 @@
+"""
+Stand-in for pygkernels/cluster/r/worker.r that speaks the same protocol, for testing without R.
+kkmeans and specc are replaced by their sklearn counterparts; argmax, sleep and exit are there to test the protocol.
+"""
+import sys
+import time
+
+import numpy as np
+from sklearn.cluster import k_means, SpectralClustering
+
+METHODS = {
+    'kkmeans': lambda K, k: k_means(K, n_clusters=k, random_state=0)[1] + 1,
+    'specc': lambda K, k: SpectralClustering(n_clusters=k, affinity='precomputed', random_state=0).fit_predict(K) + 1,
+    'argmax': lambda K, k: np.argmax(K, axis=1),
+    'sleep': lambda K, k: time.sleep(60),
+    'exit': lambda K, k: sys.exit(3),
+}
+
+if __name__ == '__main__':
+    for line in sys.stdin:
+        method, kernel_path, n, n_clusters, result_path = line.split()
+        print('loading', kernel_path, flush=True)  # chatter the client has to skip
+        try:
+            K = np.fromfile(kernel_path, dtype=np.float64).reshape(int(n), int(n), order='F')
+            np.asarray(METHODS[method](K, int(n_clusters)), dtype=np.int32).tofile(result_path)
+            print('pygkernels ok', flush=True)
+        except Exception as e:
+            print('pygkernels error', repr(e), flush=True)
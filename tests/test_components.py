@@ -0,0 +1,70 @@
+import unittest
+
+import networkx as nx
+import numpy as np
+from scipy.linalg import expm
+
+import pygkernels.measure.shortcuts as h
+from pygkernels.measure import GraphContext, For_H, Comm_H, logComm_H, CT_H, PPR_H, ModifPPR_H, NHeat_H, HeatPR_H, \
+    Katz_H, CT_D, RSP_D, logHeatPR_D, RSP_K, FE_K, SP_K, SPCT_H
+
+
+class TestComponents(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        G = nx.disjoint_union_all([nx.karate_club_graph(), nx.path_graph(5), nx.complete_graph(4), nx.empty_graph(2)])
+        self.A = nx.to_numpy_array(G, weight=None)
+        self.size = self.A.shape[0]
+        self.isolated = [self.size - 2, self.size - 1]
+
+    def test_components(self):
+        components = GraphContext(self.A).components
+        self.assertEqual([len(idx) for idx in components], [34, 5, 4, 1, 1])
+        self.assertEqual(len(GraphContext(self.A[:34, :34]).components), 1)
+
+    def test_same_as_dense(self):
+        I, L, P = np.eye(self.size), h.get_L(self.A), h.get_P(self.A)
+        for flat in [0.2, 0.7]:
+            t = For_H(self.A).scaler.scale(flat)
+            self.assertTrue(np.allclose(For_H(self.A).get_K(t), np.linalg.inv(I + t * L)))
+            self.assertTrue(np.allclose(Comm_H(self.A).get_K(t), expm(t * self.A)))
+            with np.errstate(divide='ignore'):  # log(0) between the components
+                self.assertTrue(np.allclose(logComm_H(self.A).get_K(t), np.log(expm(t * self.A))))
+            self.assertTrue(np.allclose(NHeat_H(self.A).get_K(t), expm(-t * h.get_normalized_L(self.A))))
+            self.assertTrue(np.allclose(HeatPR_H(self.A).get_K(t), expm(-t * (I - P))))
+            t = Katz_H(self.A).scaler.scale(flat)
+            self.assertTrue(np.allclose(Katz_H(self.A).get_K(t), np.linalg.inv(I - t * self.A)))
+            self.assertTrue(np.allclose(PPR_H(self.A).get_K(flat), np.linalg.inv(I - flat * P)))
+        self.assertTrue(np.allclose(CT_H(self.A).get_K(), np.linalg.pinv(L)))
+
+    def test_isolated_nodes(self):
+        for kernel_class in [PPR_H, ModifPPR_H]:
+            K = kernel_class(self.A).get_K(0.5)
+            self.assertTrue(np.allclose(K[np.ix_(self.isolated, self.isolated)], np.eye(2)))
+        K = HeatPR_H(self.A).get_K(0.5)
+        self.assertTrue(np.allclose(K[np.ix_(self.isolated, self.isolated)], np.exp(-0.5) * np.eye(2)))
+        self.assertFalse(np.any(np.isnan(logHeatPR_D(self.A).get_D(0.5))))
+
+    def test_distances(self):
+        D = CT_D(self.A).get_D(-1)
+        self.assertTrue(np.all(np.isinf(D[:34, 34:])))
+        expected = CT_D(self.A[:34, :34]).get_D(-1) * np.sum(self.A) / np.sum(self.A[:34, :34])
+        self.assertTrue(np.allclose(D[:34, :34], expected))
+        D = RSP_D(self.A).get_D(0.5)
+        self.assertTrue(np.all(np.isinf(D[:34, 34:])))
+        self.assertTrue(np.allclose(D[:34, :34], RSP_D(self.A[:34, :34]).get_D(0.5)))
+
+    def test_kernels_from_distances(self):
+        A = np.zeros((35, 35))
+        A[:34, :34] = self.A[:34, :34]  # karate and an isolated node
+        for kernel_class in [RSP_K, FE_K, SP_K, SPCT_H]:
+            kernel = kernel_class(A)
+            param = kernel.scaler.scale(0.5)
+            K = kernel.get_K(param)
+            self.assertTrue(np.all(np.isfinite(K)), kernel_class.__name__)
+            self.assertTrue(np.allclose(K[:34, :34], kernel_class(self.A[:34, :34]).get_K(param)), kernel_class.__name__)
+            self.assertTrue(np.all(K[34, :34] == 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
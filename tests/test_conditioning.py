@@ -0,0 +1,57 @@
+import unittest
+
+import networkx as nx
+import numpy as np
+
+import pygkernels.measure.shortcuts as h
+from pygkernels.measure import Katz_H, For_H, PPR_H, ModifPPR_H, Comm_H, logComm_H, RSP_D, FE_K, logKatz_D
+from pygkernels.scenario import ParallelByGraphs
+
+
+class _FirstColumnSign:
+    def fit_predict(self, K):
+        return (K[:, 0] > np.median(K[:, 0])).astype(int)
+
+
+class TestConditioning(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.A = nx.to_numpy_array(nx.karate_club_graph(), weight=None)
+        self.size = self.A.shape[0]
+
+    def test_bounds(self):
+        I, L, D = np.eye(self.size), h.get_L(self.A), h.get_D(self.A)
+        for flat in [0.1, 0.5, 0.9, 0.999]:
+            t = Katz_H(self.A).scaler.scale(flat)
+            self.assertAlmostEqual(Katz_H(self.A).condition_estimate(t) / np.linalg.cond(I - t * self.A), 1)
+            self.assertEqual(logKatz_D(self.A).condition_estimate(t), Katz_H(self.A).condition_estimate(t))
+            t = For_H(self.A).scaler.scale(flat)
+            self.assertGreaterEqual(For_H(self.A).condition_estimate(t), np.linalg.cond(I + t * L))
+            self.assertGreaterEqual(ModifPPR_H(self.A).condition_estimate(flat), np.linalg.cond(D - flat * self.A))
+            rsp = RSP_D(self.A)
+            beta = rsp.scaler.scale(flat)
+            with np.errstate(over='ignore'):
+                W = np.exp(-beta * rsp.C) * rsp.Pref
+            self.assertGreaterEqual(rsp.condition_estimate(beta) * (1 + 1e-12), np.linalg.cond(I - W, p=np.inf))
+
+    def test_hopeless_params(self):
+        rho = np.max(np.linalg.eigvalsh(self.A))
+        self.assertFalse(Katz_H(self.A).is_well_conditioned(1.01 / rho))
+        self.assertFalse(PPR_H(self.A).is_well_conditioned(1.))
+        self.assertFalse(Comm_H(self.A).is_well_conditioned(1000.))
+        self.assertTrue(logComm_H(self.A).is_well_conditioned(1000.))
+        self.assertFalse(FE_K(self.A).is_well_conditioned(1e-15))
+        self.assertTrue(FE_K(self.A).is_well_conditioned(1.))
+
+    def test_scenario_skips_ill_conditioned(self):
+        graphs = [(self.A, np.array([0] * 17 + [1] * 17))]
+        params_flat = [0.1, 0.5, 0.99999]
+        for skip, expected in [(False, params_flat), (True, params_flat[:2])]:
+            scenario = ParallelByGraphs(lambda y_true, y_pred: 1., params_flat, skip_ill_conditioned=skip,
+                                        ignore_errors=True)
+            x, _, _ = scenario.perform(lambda n_classes, random_state: _FirstColumnSign(), Comm_H, graphs, 2)
+            self.assertEqual(list(x), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
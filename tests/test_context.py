@@ -0,0 +1,117 @@
+import unittest
+
+import networkx as nx
+import numpy as np
+from scipy.linalg import expm
+
+import pygkernels.measure.shortcuts as h
+from pygkernels.measure import GraphContext, NHeat_H, HeatPR_H, PPR_H, ModifPPR_H, logHeatPR_H, logPPR_H, \
+    Comm_H, Heat_H, logComm_H, logHeat_H, logNHeat_H, SCCT_H
+from pygkernels.measure.kernel import CCT_H
+from pygkernels.scenario import ParallelByGraphs
+
+
+class _FirstColumnSign:
+    def fit_predict(self, K):
+        return (K[:, 0] > np.median(K[:, 0])).astype(int)
+
+
+class TestGraphContext(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.A = nx.to_numpy_array(nx.karate_club_graph(), weight=None)
+        self.size = self.A.shape[0]
+
+    def test_markov_family_identities(self):
+        I, P = np.eye(self.size), h.get_P(self.A)
+        for t in [0.01, 0.5, 5.]:
+            self.assertTrue(np.allclose(NHeat_H(self.A).get_K(t), expm(-t * h.get_normalized_L(self.A))))
+            self.assertTrue(np.allclose(HeatPR_H(self.A).get_K(t), expm(-t * (I - P))))
+        for alpha in [0.01, 0.5, 0.95]:
+            self.assertTrue(np.allclose(PPR_H(self.A).get_K(alpha), np.linalg.inv(I - alpha * P)))
+            self.assertTrue(np.allclose(ModifPPR_H(self.A).get_K(alpha), np.linalg.inv(h.get_D(self.A) - alpha * self.A)))
+
+    def test_shared_cores(self):
+        ctx = GraphContext(self.A, cache_size=3)
+        NHeat_H(self.A, ctx=ctx).get_K(0.5)
+        logHeatPR_H(self.A, ctx=ctx).get_K(0.5)
+        logNHeat_H(self.A, ctx=ctx).get_K(0.5)
+        ModifPPR_H(self.A, ctx=ctx).get_K(0.3)
+        logPPR_H(self.A, ctx=ctx).get_K(0.3)
+        self.assertEqual(set(ctx._cores.keys()), {('heat', 0.5), ('log_heat', 0.5), ('resolvent', 0.3)})
+
+    def test_scaled_log_kernels(self):
+        for log_class, parent_class in [(logComm_H, Comm_H), (logHeat_H, Heat_H), (logNHeat_H, NHeat_H),
+                                        (logHeatPR_H, HeatPR_H)]:
+            t = parent_class(self.A).scaler.scale(0.4)
+            self.assertTrue(np.allclose(log_class(self.A).get_K(t), np.log(parent_class(self.A).get_K(t))),
+                            log_class.__name__)
+
+    def test_log_heat_on_long_path(self):
+        # far entries of exp(-tL) are below the float64 range, log(expm) gives -inf there and garbage above it
+        size = 150
+        A = nx.to_numpy_array(nx.path_graph(size), weight=None)
+        d = np.sum(A, axis=0)
+        for t in [0.005, 0.1, 3.]:
+            # reference: log of the Taylor series of exp(t(cI - L)), all terms non-negative, in the log domain
+            log_T = np.where(np.eye(size) > 0, 0., -np.inf)
+            log_E = log_T.copy()
+            with np.errstate(divide='ignore'):
+                log_diag = np.log(np.max(d) - d)  # cI - L = diag(c - d) + A
+                for k in range(1, 400):
+                    up, down = np.full_like(log_T, -np.inf), np.full_like(log_T, -np.inf)
+                    up[:-1], down[1:] = log_T[1:], log_T[:-1]
+                    log_T = np.logaddexp(np.logaddexp(log_diag[:, None] + log_T, up), down) + np.log(t) - np.log(k)
+                    log_E = np.logaddexp(log_E, log_T)
+            expected = log_E - t * np.max(d)
+            logK = logHeat_H(A).get_K(t)
+            self.assertTrue(np.all(np.isfinite(logK)))
+            if t < 1:
+                self.assertLess(np.min(expected), -709)  # exp underflows
+            self.assertTrue(np.allclose(logK, expected, rtol=1e-10, atol=1e-8), t)
+        self.assertTrue(np.all(np.isfinite(logNHeat_H(A).get_K(0.005))))
+        self.assertTrue(np.all(np.isfinite(logComm_H(A).get_K(0.005))))
+
+    def test_log_kernels_at_zero(self):
+        # exp(0) = I: log is 0 on the diagonal and -inf elsewhere, without the log-domain squarings
+        expected = np.where(np.eye(self.size) > 0, 0., -np.inf)
+        for log_class in [logComm_H, logHeat_H, logNHeat_H]:
+            self.assertTrue(np.array_equal(log_class(self.A).get_K(0.), expected), log_class.__name__)
+
+    def test_log_comm_does_not_overflow(self):
+        kernel = logComm_H(self.A)
+        t = kernel.scaler.scale(0.999999)
+        self.assertTrue(np.all(np.isfinite(kernel.get_K(t))))
+        self.assertAlmostEqual(kernel.ctx.lambda_max, np.max(np.linalg.eigvalsh(self.A)))
+
+    def test_spectral_cct(self):
+        ctx, size = GraphContext(self.A), self.size
+        d = np.sum(self.A, axis=0).reshape((-1, 1))
+        D05 = np.diag(np.power(d, -0.5)[:, 0])
+        H = np.eye(size) - np.ones((size, size)) / size
+        M = D05.dot(self.A - d.dot(d.transpose()) / np.sum(self.A)).dot(D05)
+        expected = H.dot(D05).dot(M).dot(np.linalg.pinv(np.eye(size) - M)).dot(M).dot(D05).dot(H)
+        K_CCT = CCT_H(self.A, ctx=ctx).get_K()
+        self.assertTrue(np.allclose(K_CCT, expected))
+        self.assertIs(SCCT_H(self.A, ctx=ctx).K_CCT, K_CCT)
+
+    def test_cached_core_is_not_exposed(self):
+        ctx = GraphContext(self.A)
+        K = ModifPPR_H(self.A, ctx=ctx).get_K(0.3)
+        K[:] = 0
+        self.assertFalse(np.allclose(ModifPPR_H(self.A, ctx=ctx).get_K(0.3), 0))
+
+    def test_scenario_over_kernel_list(self):
+        graphs = [(self.A, np.array([0] * 17 + [1] * 17))]
+        scenario = ParallelByGraphs(lambda y_true, y_pred: np.mean(y_pred), [0.1, 0.5, 0.9])
+        kernel_classes = [NHeat_H, HeatPR_H, logNHeat_H, PPR_H, ModifPPR_H]
+        results = scenario.perform(lambda n_classes, random_state: _FirstColumnSign(), kernel_classes, graphs, 2)
+        self.assertEqual(set(results.keys()), {kernel_class.name for kernel_class in kernel_classes})
+        for kernel_class in kernel_classes:
+            expected = scenario.perform(lambda n_classes, random_state: _FirstColumnSign(), kernel_class, graphs, 2)
+            for result, expected_part in zip(results[kernel_class.name], expected):
+                self.assertTrue(np.array_equal(result, expected_part), kernel_class.name)
+
+
+if __name__ == "__main__":
+    unittest.main()
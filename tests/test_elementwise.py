@@ -0,0 +1,46 @@
+import unittest
+
+import numpy as np
+
+from pygkernels.measure import elementwise, logFor_H, For_H
+
+
+class TestElementwise(unittest.TestCase):
+    def setUp(self):
+        self.old_chunk_size, self.old_n_threads = elementwise.CHUNK_SIZE, elementwise.N_THREADS
+        elementwise.CHUNK_SIZE = 7  # force many blocks on small matrices
+        elementwise.set_n_threads(3)
+
+    def tearDown(self):
+        elementwise.CHUNK_SIZE = self.old_chunk_size
+        elementwise.set_n_threads(self.old_n_threads)
+
+    def test_ewlog(self):
+        K = np.array([[1., 0., -1.], [np.e, np.nan, 2.], [0.5, 3., 4.]])
+        K_copy = K.copy()
+        logK = elementwise.ewlog(K)
+        self.assertTrue(np.array_equal(K, K_copy, equal_nan=True))  # input is not mutated
+        expected = np.array([[0., -np.inf, -np.inf], [1., np.nan, np.log(2.)], [np.log(0.5), np.log(3.), np.log(4.)]])
+        self.assertTrue(np.allclose(logK, expected, equal_nan=True))
+
+    def test_ewpower_inplace(self):
+        X = np.random.RandomState(0).rand(20, 20)
+        expected = np.power(X, 0.5)
+        out = elementwise.ewpower(X, 0.5, out=X)
+        self.assertIs(out, X)
+        self.assertTrue(np.allclose(X, expected))
+
+    def test_ewsigmoid(self):
+        X = np.random.RandomState(0).randn(20, 20) * 100
+        self.assertTrue(np.allclose(elementwise.ewsigmoid(X, 0.3), 1. / (1. + np.exp(-0.3 * X))))
+
+    def test_log_kernel_keeps_parent_output(self):
+        A = np.array([[0, 1, 0], [1, 0, 1], [0, 1, 0]], dtype=np.float64)
+        kernel = logFor_H(A)
+        K = For_H(A).get_K(0.5)
+        self.assertTrue(np.allclose(kernel.get_K(0.5), np.log(K)))
+        self.assertTrue(np.allclose(kernel._parent_kernel.get_K(0.5), K))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+import networkx as nx
+import numpy as np
+from scipy.linalg import expm
+
+from pygkernels.measure import ProcessEngine, GraphContext, For_H, Katz_H, Comm_H, Heat_H, NHeat_H, PPR_H
+from pygkernels.measure.engine import _parse_cpulist, numa_nodes
+
+
+class TestProcessEngine(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = ProcessEngine(n_processes=2, block_size=32, min_size=0)
+        G = nx.disjoint_union(nx.karate_club_graph(), nx.les_miserables_graph())
+        cls.A = nx.to_numpy_array(G, weight=None)
+        cls.size = cls.A.shape[0]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.engine.close()
+
+    def test_topology(self):
+        self.assertEqual(_parse_cpulist('0-3,8,10-11\n'), {0, 1, 2, 3, 8, 10, 11})
+        self.assertTrue(all(len(cpus) > 0 for cpus in numa_nodes()))
+
+    def test_linear_algebra(self):
+        rs = np.random.RandomState(0)
+        X = rs.normal(size=(100, 100))
+        S = X.dot(X.T) + np.eye(100)
+        self.assertTrue(np.allclose(self.engine.matmul(X, S), X.dot(S)))
+        self.assertTrue(np.allclose(self.engine.inv(S), np.linalg.inv(S)))  # Cholesky
+        self.assertTrue(np.allclose(self.engine.inv(X), np.linalg.inv(X)))  # LU
+        self.assertTrue(np.allclose(self.engine.inv(X + X.T), np.linalg.inv(X + X.T)))  # Cholesky fails, then LU
+        self.assertTrue(np.allclose(self.engine.solve(X, S[:, :7]), np.linalg.solve(X, S[:, :7])))
+        for scale in [0.01, 1., 30.]:
+            E = expm(scale * X / 10)
+            self.assertLess(np.max(np.abs(self.engine.expm(scale * X / 10) - E)), 1e-12 * np.max(np.abs(E)))
+        with self.assertRaises(np.linalg.LinAlgError):
+            self.engine.inv(np.zeros((50, 50)))
+
+    def test_measures(self):
+        ctx = GraphContext(self.A, engine=self.engine)
+        for kernel_class in [For_H, Katz_H, Comm_H, Heat_H, NHeat_H, PPR_H]:
+            t = kernel_class(self.A).scaler.scale(0.5)
+            self.assertTrue(np.allclose(kernel_class(self.A, ctx=ctx).get_K(t), kernel_class(self.A).get_K(t)),
+                            kernel_class.__name__)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+
+import networkx as nx
+import numpy as np
+
+from pygkernels.measure import Katz_H, For_H, Comm_H, Heat_H, NHeat_H, SCT_H, SCCT_H, PPR_H, ModifPPR_H, HeatPR_H, \
+    SPCT_H, DF_H, Abs_H, logKatz_H, logFor_H, logComm_H, logHeat_H, logNHeat_H, logPPR_H, logHeatPR_H, RSP_K
+from pygkernels.score import kernel_alignment
+
+
+class TestGradients(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        G = nx.disjoint_union(nx.karate_club_graph(), nx.path_graph(4))
+        self.A = nx.to_numpy_array(G, weight=None)
+        self.y = [0] * 17 + [1] * 17 + [2] * 4
+
+    def _finite_difference(self, kernel, param, eps):
+        return (kernel.get_K(param + eps) - kernel.get_K(param - eps)) / (2 * eps)
+
+    def test_gradients(self):
+        for kernel_class in [Katz_H, For_H, Comm_H, Heat_H, NHeat_H, SCT_H, SCCT_H, PPR_H, ModifPPR_H, HeatPR_H,
+                             SPCT_H, DF_H, Abs_H, logKatz_H, logFor_H, logComm_H, logHeat_H, logNHeat_H, logPPR_H,
+                             logHeatPR_H]:
+            kernel = kernel_class(self.A)
+            for flat in [0.3, 0.7]:
+                param = kernel.scaler.scale(flat)
+                K, dK = kernel.get_K_and_grad(param)
+                self.assertTrue(np.allclose(K, kernel.get_K(param), equal_nan=True), kernel_class.__name__)
+                expected = self._finite_difference(kernel, param, 1e-5 * param)
+                finite = np.isfinite(K)
+                self.assertTrue(np.allclose(dK[finite], expected[finite], rtol=1e-4, atol=1e-6), kernel_class.__name__)
+
+    def test_large_t_log_communicability(self):
+        K, dK = logComm_H(self.A).get_K_and_grad(1000.)
+        self.assertTrue(np.all(np.isfinite(dK)))
+        self.assertTrue(np.allclose(K, logComm_H(self.A).get_K(1000.)))
+
+    def test_log_heat_where_exp_underflows(self):
+        A = nx.to_numpy_array(nx.path_graph(150), weight=None)
+        for kernel_class in [logComm_H, logHeat_H, logNHeat_H, logHeatPR_H]:
+            kernel, t = kernel_class(A), 0.01
+            K, dK = kernel.get_K_and_grad(t)
+            self.assertLess(np.min(K), -745, kernel_class.__name__)  # exp(K) is 0 in float64
+            self.assertTrue(np.array_equal(K, kernel.get_K(t)), kernel_class.__name__)
+            expected = self._finite_difference(kernel, t, 1e-7)
+            self.assertTrue(np.allclose(dK, expected, rtol=1e-5, atol=1e-5), kernel_class.__name__)
+
+    def test_not_supported(self):
+        with self.assertRaises(NotImplementedError):
+            RSP_K(self.A).get_K_and_grad(0.5)
+
+    def test_alignment_gradient(self):
+        kernel = For_H(self.A)
+        t, eps = 2., 1e-5
+        alignment, d_alignment = kernel_alignment(kernel.get_K(t), self.y, dK=kernel.get_K_and_grad(t)[1])
+        Y = np.equal.outer(self.y, self.y).astype(float)
+        K = kernel.get_K(t)
+        self.assertAlmostEqual(alignment, np.sum(K * Y) / np.linalg.norm(K) / np.linalg.norm(Y))
+        expected = (kernel_alignment(kernel.get_K(t + eps), self.y) - kernel_alignment(kernel.get_K(t - eps), self.y)) \
+            / (2 * eps)
+        self.assertAlmostEqual(d_alignment, expected, places=7)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+
+import numpy as np
+import torch
+from sklearn.metrics import adjusted_rand_score
+
+from pygkernels.cluster import _kkmeans_pytorch, KKMeans, KKMeans_iterative, KKMeans_minibatch
+
+
+class TestKKMeansBackend(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        rs = np.random.RandomState(0)
+        self.X = np.concatenate([rs.normal(loc=c, size=(30, 5)) for c in [-3, 0, 3]])
+        self.K = self.X.dot(self.X.T)
+
+    def test_distances(self):
+        K = torch.from_numpy(self.K)
+        h = torch.from_numpy(np.random.RandomState(1).dirichlet(np.ones(90), size=4))
+        e = torch.eye(90, dtype=K.dtype)
+        h_e = h.unsqueeze(1) - e.unsqueeze(0)
+        expected = torch.einsum('kni,ij,knj->kn', [h_e, K, h_e])
+        self.assertTrue(torch.allclose(_kkmeans_pytorch._distances(h, K, torch.diagonal(K)), expected))
+
+    def test_predict(self):
+        h = _kkmeans_pytorch.kmeanspp(self.K, 3, np.random.default_rng(0), device='cpu')
+        self.assertEqual(h.shape, (3, 90))
+        labels, inertia, _, success = _kkmeans_pytorch.predict(self.K, h, 100, None, device='cpu')
+        self.assertTrue(success)
+        self.assertEqual(len(set(labels[:30])) + len(set(labels[30:60])) + len(set(labels[60:])), 3)
+        expected = sum(np.sum((self.X[labels == c] - self.X[labels == c].mean(axis=0)) ** 2) for c in range(3))
+        self.assertAlmostEqual(inertia / expected, 1, places=4)
+
+    def test_predict_batch(self):
+        rs = np.random.RandomState(0)
+        h = np.stack([np.eye(90)[rs.choice(90, 3, replace=False)] for _ in range(5)])
+        h[4] = np.eye(90)[[0, 1, 2]]  # all nodes go to the first centroids, an empty cluster
+        labels, inertia, _, success = _kkmeans_pytorch.predict_batch(self.K, h, 100, None, device='cpu')
+        for i in range(5):
+            labels_i, inertia_i, _, success_i = _kkmeans_pytorch.predict(self.K, h[i], 100, None, device='cpu')
+            self.assertTrue(np.all(labels[i] == labels_i))
+            self.assertAlmostEqual(inertia[i] / inertia_i, 1, places=5)
+            self.assertEqual(success[i], success_i)
+
+    def test_batched_restarts(self):
+        A = (np.abs(self.K) > 20).astype(np.float64)
+        np.fill_diagonal(A, 0)
+        for init in ['one', 'k-means++']:
+            estimator = KKMeans(3, n_init=4, init=init, device='cpu')
+            batched = estimator.predict(self.K, A=A, explicit=True)
+            one_by_one = [estimator._predict_successful_once(self.K, i, init, A=A.astype(np.float32))
+                          for i in range(4)]
+            for result, (labels, _, inertia, _) in zip(batched, one_by_one):
+                self.assertTrue(np.all(result['labels'] == labels))
+                self.assertAlmostEqual(result['inertia'] / inertia, 1, places=5)
+
+    @staticmethod
+    def _iterative_reference(K, labels, node_orders, eps=1e-10):
+        """
+        Fouss's Algorithm 7.3 with the full quadratic forms
+        """
+        labels, n_clusters = labels.copy(), np.max(labels) + 1
+        for node_order in node_orders:
+            for i in node_order:
+                H = np.stack([np.mean(np.eye(len(K))[labels == c], axis=0) for c in range(n_clusters)])
+                nn = np.bincount(labels, minlength=n_clusters)
+                distances = np.array([(H[c] - np.eye(len(K))[i]).dot(K).dot(H[c] - np.eye(len(K))[i])
+                                      for c in range(n_clusters)])
+                k_star = np.argmin(nn / (nn + 1 + eps) * distances)
+                a = labels[i]
+                ΔJ = nn[k_star] / (nn[k_star] + 1 + eps) * distances[k_star] - nn[a] / (nn[a] - 1 + eps) * distances[a]
+                if ΔJ < 0 and a != k_star:
+                    labels[i] = k_star
+        return labels
+
+    def test_iterative_predict(self):
+        rs = np.random.RandomState(0)
+        K = self.K + rs.normal(scale=3, size=self.K.shape)
+        K = K + K.T
+        h = np.eye(90)[[0, 40, 80]]
+        labels, _, _, success = _kkmeans_pytorch.iterative_predict(K, h, 1, 1e-10, None, np.random.default_rng(0),
+                                                                   device='cpu', block_size=7)
+        initial = np.argmin([[(h[c] - np.eye(90)[i]).dot(K).dot(h[c] - np.eye(90)[i]) for i in range(90)]
+                             for c in range(3)], axis=0)
+        expected = self._iterative_reference(K, initial, [np.random.default_rng(0).permutation(90)])
+        self.assertTrue(success)
+        self.assertTrue(np.array_equal(labels, expected))
+
+    def test_thread_pool_is_reproducible(self):
+        for estimator_class in [KKMeans, KKMeans_iterative]:
+            results = [estimator_class(3, n_init=6, init='any', max_iter=5, device='cpu', n_jobs=n_jobs)
+                       .predict(self.K, explicit=True) for n_jobs in [1, 3]]
+            for one, other in zip(*results):
+                self.assertTrue(np.array_equal(one['labels'], other['labels']))
+                self.assertEqual(one['inertia'], other['inertia'])
+
+    def test_minibatch(self):
+        y = np.repeat([0, 1, 2], 30)
+        estimator = KKMeans_minibatch(3, batch_size=32, max_support=40, device='cpu')
+        labels = estimator.predict(self.K)
+        self.assertEqual(adjusted_rand_score(y, labels), 1.)
+        self.assertLessEqual(len(estimator.support_), 40)
+        self.assertTrue(np.allclose(np.sum(estimator.alpha_, axis=1), 1))
+        labels_callable = estimator.predict(lambda rows, cols: self.X[rows].dot(self.X[cols].T), n=90)
+        self.assertTrue(np.array_equal(labels, labels_callable))
+
+    def test_minibatch_fit_predict_callable(self):
+        estimator = KKMeans_minibatch(3, batch_size=32, max_support=40, device='cpu')
+        labels = estimator.fit_predict(self.K)
+        labels_callable = estimator.fit_predict(lambda rows, cols: self.X[rows].dot(self.X[cols].T), n=90)
+        self.assertTrue(np.array_equal(labels, labels_callable))
+        self.assertTrue(np.array_equal(estimator.labels_, labels_callable))
+        with self.assertRaises(ValueError):
+            estimator.fit_predict(lambda rows, cols: self.X[rows].dot(self.X[cols].T))
+
+
+if __name__ == "__main__":
+    unittest.main()
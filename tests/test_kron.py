@@ -0,0 +1,50 @@
+import unittest
+
+import networkx as nx
+import numpy as np
+
+from pygkernels.measure import GraphContext, For_H, Abs_H, CT_H, SCT_H, CT_D, SP_D, SPCT_D, logFor_D
+from pygkernels.measure.kron import KronReduction
+
+
+class TestKronReduction(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        G = nx.karate_club_graph()
+        rs = np.random.RandomState(0)
+        for tree_idx in range(5):  # pendant trees and chains
+            tree = nx.relabel_nodes(nx.random_tree(8, seed=tree_idx), lambda x: f'tree{tree_idx}_{x}')
+            G = nx.union(G, tree)
+            G.add_edge(int(rs.randint(34)), f'tree{tree_idx}_0')
+        nx.add_path(G, [3] + [f'chain_{i}' for i in range(6)] + [30])
+        for u, v in G.edges:
+            G.edges[u, v]['weight'] = rs.uniform(0.5, 2)
+        self.A = nx.to_numpy_array(G)
+
+    def test_core(self):
+        reduction = KronReduction(self.A)
+        self.assertLess(len(reduction.core), 35)
+        self.assertEqual(len(reduction.core) + len(reduction.eliminated), self.A.shape[0])
+
+    def test_same_results(self):
+        for measure_class in [For_H, Abs_H, CT_H, SCT_H, CT_D, SP_D, SPCT_D, logFor_D]:
+            for flat in [0.2, 0.6]:
+                measure = measure_class(self.A)
+                reduced = measure_class(self.A, ctx=GraphContext(self.A, kron_reduction=True))
+                param = measure.scaler.scale(flat)
+                if hasattr(measure, 'get_K'):
+                    expected, result = measure.get_K(param), reduced.get_K(param)
+                else:
+                    expected, result = measure.get_D(param), reduced.get_D(param)
+                self.assertTrue(np.allclose(result, expected), f'{measure_class.__name__}, {flat}')
+
+    def test_tree(self):
+        A = nx.to_numpy_array(nx.random_tree(30, seed=1))
+        self.assertEqual(len(KronReduction(A).core), 0)
+        self.assertTrue(np.allclose(For_H(A, ctx=GraphContext(A, kron_reduction=True)).get_K(0.5),
+                                    For_H(A).get_K(0.5)))
+        self.assertTrue(np.allclose(SP_D(A, ctx=GraphContext(A, kron_reduction=True)).get_D(-1), SP_D(A).get_D(-1)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import unittest
+
+import networkx as nx
+import numpy as np
+import torch
+from scipy.cluster.hierarchy import linkage, fcluster, is_valid_linkage
+from scipy.sparse.csgraph import connected_components
+from sklearn.cluster import AgglomerativeClustering
+from sklearn.metrics import adjusted_rand_score
+from sklearn.neighbors import kneighbors_graph
+
+from pygkernels.cluster import KWard, _kward_pytorch
+from pygkernels.measure import For_H, logComm_H, PPR_H
+
+
+def greedy_kward(K, n_clusters):
+    """
+    Reference: merge the pair with the smallest dJ = (n_k * n_l)/(n_k + n_l) * (h_k - h_l)^T * K * (h_k - h_l)
+    """
+    clusters = [[i] for i in range(K.shape[0])]
+    while len(clusters) > n_clusters:
+        H = np.zeros((len(clusters), K.shape[0]))
+        for i, nodes in enumerate(clusters):
+            H[i, nodes] = 1 / len(nodes)
+        n = np.array([len(nodes) for nodes in clusters])
+        HKH = H.dot(K).dot(H.T)
+        dJ = n[:, None] * n[None, :] / (n[:, None] + n[None, :]) * \
+            (np.diag(HKH)[:, None] + np.diag(HKH)[None, :] - HKH - HKH.T)
+        dJ[np.diag_indices_from(dJ)] = np.inf
+        k, l = np.unravel_index(np.argmin(dJ), dJ.shape)
+        clusters = [nodes for i, nodes in enumerate(clusters) if i not in (k, l)] + [clusters[k] + clusters[l]]
+    labels = np.empty(K.shape[0], dtype=np.int64)
+    for i, nodes in enumerate(clusters):
+        labels[nodes] = i
+    return labels
+
+
+class TestKWard(unittest.TestCase):
+    def test_same_as_scipy_ward(self):
+        rs = np.random.RandomState(0)
+        X = np.concatenate([rs.randn(50, 4) + 3 * rs.randn(4) for _ in range(4)])
+        Z = linkage(X, 'ward')
+        for n_clusters in [2, 4, 9]:
+            labels = KWard(n_clusters, device='cpu').predict(X.dot(X.T))
+            self.assertEqual(adjusted_rand_score(labels, fcluster(Z, n_clusters, 'maxclust')), 1.)
+
+    def test_same_as_greedy(self):
+        G = nx.stochastic_block_model([20, 25, 30], [[0.3, 0.05, 0.02], [0.05, 0.3, 0.05], [0.02, 0.05, 0.3]],
+                                      seed=0)
+        A = nx.to_numpy_array(G, weight=None)
+        for kernel_class in [For_H, logComm_H]:
+            K = kernel_class(A).get_K(kernel_class(A).scaler.scale(0.5))
+            for n_clusters in [2, 3, 6]:
+                labels = KWard(n_clusters, device='cpu').predict(K)
+                self.assertEqual(len(np.unique(labels)), n_clusters)
+                self.assertEqual(adjusted_rand_score(labels, greedy_kward(K, n_clusters)), 1.)
+
+    def test_linkage(self):
+        rs = np.random.RandomState(0)
+        X = np.concatenate([rs.randn(50, 4) + 3 * rs.randn(4) for _ in range(4)])
+        estimator = KWard(4, device='cpu')
+        Z = estimator.linkage(X.dot(X.T))
+        self.assertTrue(is_valid_linkage(Z))
+        self.assertTrue(np.allclose(Z[:, 2], linkage(X, 'ward')[:, 2], rtol=1e-3))
+        self.assertTrue(np.allclose(Z[:, 3], linkage(X, 'ward')[:, 3]))
+        ks = [1, 2, 4, 9]
+        for n_clusters, labels in zip(ks, estimator.cut_many(ks, Z)):
+            self.assertEqual(len(np.unique(labels)), n_clusters)
+            self.assertEqual(adjusted_rand_score(labels, fcluster(Z, n_clusters, 'maxclust')), 1.)
+        self.assertTrue(np.array_equal(estimator.cut(200, Z), np.arange(200)))
+        labels = estimator.predict(X.dot(X.T))
+        self.assertTrue(np.array_equal(estimator.linkage_, Z))
+        self.assertTrue(np.array_equal(labels, estimator.cut(4)))
+
+    def test_connectivity_same_as_sklearn(self):
+        rs = np.random.RandomState(0)
+        X = rs.randn(200, 2)
+        A = kneighbors_graph(X, 10, include_self=False)
+        self.assertEqual(connected_components(A)[0], 1)
+        estimator = KWard(4, device='cpu', connectivity=A)
+        estimator.predict(X.dot(X.T))
+        self.assertTrue(is_valid_linkage(estimator.linkage_))
+        for n_clusters in [2, 4, 10]:
+            expected = AgglomerativeClustering(n_clusters, linkage='ward', connectivity=A).fit_predict(X)
+            self.assertEqual(adjusted_rand_score(estimator.cut(n_clusters), expected), 1.)
+
+    def test_connectivity_merges_adjacent_clusters(self):
+        G = nx.disjoint_union(nx.stochastic_block_model([20, 25], [[0.3, 0.02], [0.02, 0.3]], seed=0),
+                              nx.path_graph(5))
+        A = nx.to_numpy_array(G, weight=None)
+        K = For_H(A).get_K(For_H(A).scaler.scale(0.5))
+        estimator = KWard(3, device='cpu', connectivity=True)
+        labels = estimator.predict(K, A=A)
+        self.assertTrue(is_valid_linkage(estimator.linkage_))
+        for n_clusters in [3, 5, 8]:
+            labels = estimator.cut(n_clusters)
+            for label in range(n_clusters):
+                idx = np.flatnonzero(labels == label)
+                self.assertEqual(connected_components(A[np.ix_(idx, idx)])[0], 1)
+        self.assertEqual(len(np.unique(estimator.cut(1))), 1)
+
+    def test_compaction(self):
+        rs = np.random.RandomState(0)
+        X = rs.randn(100, 3)
+        K = torch.from_numpy(X.dot(X.T))
+        merges = _kward_pytorch.nn_chain(K, min_compact_size=2)
+        self.assertTrue(np.allclose(np.sort(merges[:, 2]), np.sort(_kward_pytorch.nn_chain(K)[:, 2])))
+        for n_clusters in [2, 5]:
+            labels = _kward_pytorch.cut(_kward_pytorch.linkage_from_merges(100, merges), n_clusters)
+            self.assertEqual(adjusted_rand_score(labels, greedy_kward(X.dot(X.T), n_clusters)), 1.)
+
+    def test_not_finite_kernel(self):
+        rs = np.random.RandomState(0)
+        X = rs.randn(40, 3)
+        K = X.dot(X.T)
+        K[:5] = K[:, :5] = np.inf
+        K[5, 6] = K[6, 5] = np.nan
+        A = kneighbors_graph(X, 5, include_self=False)
+        for connectivity in [None, A]:
+            estimator = KWard(3, device='cpu', connectivity=connectivity)
+            self.assertEqual(len(np.unique(estimator.predict(K))), 3)
+            self.assertEqual(estimator.linkage_.shape, (39, 4))
+
+    def test_not_symmetric_kernel(self):
+        G = nx.stochastic_block_model([20, 25], [[0.3, 0.05], [0.05, 0.3]], seed=0)
+        A = nx.to_numpy_array(G, weight=None)
+        K = PPR_H(A).get_K(0.5)
+        for n_clusters in [2, 5]:
+            labels = KWard(n_clusters, device='cpu').predict(K)
+            self.assertEqual(adjusted_rand_score(labels, greedy_kward(K, n_clusters)), 1.)
+
+
+if __name__ == "__main__":
+    unittest.main()
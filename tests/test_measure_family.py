@@ -0,0 +1,43 @@
+import unittest
+
+import networkx as nx
+import numpy as np
+
+from pygkernels.measure import MeasureFamily, For_H, Comm_H, PPR_H, SCT_H, logFor_H, For_D, logFor_D, Comm_D
+
+
+class TestMeasureFamily(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.A = nx.to_numpy_array(nx.karate_club_graph(), weight=None)
+
+    def test_members(self):
+        family = MeasureFamily(For_H, self.A)
+        self.assertEqual(family.members, [For_H, logFor_H, For_D, logFor_D])
+        self.assertEqual(len(MeasureFamily(SCT_H, self.A).members), 2)
+
+    def test_same_as_separate_measures(self):
+        for kernel_class in [For_H, Comm_H, PPR_H, SCT_H]:
+            for reuse_buffers in [False, True]:
+                family = MeasureFamily(kernel_class, self.A, reuse_buffers=reuse_buffers)
+                param = family.scaler.scale(0.4)
+                results = family.get_all(param)
+                for measure_class in family.members:
+                    measure = measure_class(self.A)
+                    expected = measure.get_K(param) if hasattr(measure, 'get_K') else measure.get_D(param)
+                    self.assertTrue(np.allclose(results[measure_class.__name__], expected, equal_nan=True),
+                                    f'{measure_class.__name__}, reuse_buffers={reuse_buffers}')
+
+    def test_overflowed_base_kernel(self):
+        family = MeasureFamily(Comm_H, self.A)
+        results = family.get_all(family.scaler.scale(0.999999))
+        self.assertFalse(np.all(np.isfinite(results['Comm_H'])))
+        self.assertTrue(np.all(np.isfinite(results['logComm_H'])))
+
+    def test_distance_power(self):
+        family = MeasureFamily(Comm_H, self.A)
+        self.assertTrue(np.allclose(family.get_all(0.3)['Comm_D'], Comm_D(self.A).get_D(0.3)))
+
+
+if __name__ == "__main__":
+    unittest.main()
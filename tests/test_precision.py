@@ -0,0 +1,32 @@
+import unittest
+
+import networkx as nx
+import numpy as np
+
+import pygkernels.measure.shortcuts as h
+
+
+class TestRefinement(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.A = nx.to_numpy_array(nx.karate_club_graph(), weight=None)
+
+    def test_refinement(self):
+        M = np.eye(self.A.shape[0]) + 0.5 * h.get_L(self.A)
+        Minv = h.refined_inv(M)
+        self.assertTrue(np.allclose(Minv.dot(M), np.eye(M.shape[0]), rtol=0, atol=1e-13))
+
+    def test_refined_solve(self):
+        M = np.eye(self.A.shape[0]) + 0.5 * h.get_L(self.A)
+        B = np.random.RandomState(0).rand(self.A.shape[0], 3)
+        self.assertTrue(np.allclose(h.refined_solve(M, B), np.linalg.solve(M, B), rtol=1e-12, atol=1e-13))
+
+    def test_near_singular_falls_back(self):
+        rho = np.max(np.linalg.eigvalsh(self.A))
+        M = np.eye(self.A.shape[0]) - (1 - 1e-9) / rho * self.A
+        self.assertIsNone(h.refined_inv(M))
+        self.assertIsNone(h.refined_solve(M, np.ones((M.shape[0], 1))))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+from sklearn.cluster import k_means
+
+from pygkernels.cluster import KKMeans_kernlab, SpectralClustering_kernlab
+from pygkernels.cluster.base import REstimatorWrapper, RWorker
+
+MOCK_COMMAND = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'r_mock_worker.py')]
+
+
+class TestRWorker(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.worker = RWorker(MOCK_COMMAND, tmp_dir=self.tmp_dir.name)
+        rs = np.random.RandomState(0)
+        X = np.concatenate([rs.randn(20, 2), rs.randn(20, 2) + 10])
+        self.K = X.dot(X.T)
+
+    def tearDown(self):
+        self.worker.close()
+        self.tmp_dir.cleanup()
+
+    def test_binary_layout(self):
+        K = np.random.RandomState(1).rand(30, 30)  # not symmetric, so a transposed kernel would be noticed
+        self.assertEqual(self.worker.predict('argmax', K, 2), list(np.argmax(K, axis=1)))
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+
+    def test_persistent(self):
+        self.worker.predict('argmax', self.K, 2)
+        pid = self.worker._process.pid
+        futures = [self.worker.submit('kkmeans', self.K, 2) for _ in range(5)]
+        expected = list(k_means(self.K, n_clusters=2, random_state=0)[1] + 1)
+        for future in futures:
+            self.assertEqual(future.result(), expected)
+        self.assertEqual(self.worker._process.pid, pid)
+
+    def test_errors(self):
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.worker.predict('unknown', self.K, 2)
+        self.assertEqual(len(self.worker.predict('argmax', self.K, 2)), 40)
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.worker.predict('exit', self.K, 2)
+        self.assertEqual(len(self.worker.predict('argmax', self.K, 2)), 40)  # restarted
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self.worker.predict('sleep', self.K, 2, timeout=2)
+        self.assertEqual(len(self.worker.predict('argmax', self.K, 2)), 40)
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+
+    def test_wrappers(self):
+        with patch.object(REstimatorWrapper, 'WORKER_COMMAND', MOCK_COMMAND):
+            pred = KKMeans_kernlab(2, device='cpu').predict(self.K)
+            self.assertEqual(sorted(set(pred)), [1, 2])
+            self.assertEqual(len(set(pred[:20])), 1)
+            pred = SpectralClustering_kernlab(2, device='cpu').predict(self.K)
+            self.assertEqual(len(pred), 40)
+            self.assertIs(RWorker.shared(MOCK_COMMAND), RWorker.shared(MOCK_COMMAND))
+        RWorker.close_shared()
+
+
+if __name__ == "__main__":
+    unittest.main()
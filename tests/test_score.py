@@ -0,0 +1,42 @@
+import unittest
+
+import networkx as nx
+import numpy as np
+import torch
+from scipy.sparse import csr_matrix
+
+from pygkernels.cluster import _kkmeans_pytorch as _backend
+from pygkernels.score import modularity, modularity_batch
+
+
+class TestModularity(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.G = nx.karate_club_graph()
+        self.A = nx.to_numpy_array(self.G, weight=None)
+        rs = np.random.RandomState(0)
+        self.partitions = rs.randint(0, 4, size=(5, self.A.shape[0]))
+        self.partitions[0] = [int(self.G.nodes[i]['club'] == 'Officer') for i in self.G.nodes]
+
+    def _networkx(self, partition):
+        return nx.community.modularity(self.G, [np.flatnonzero(partition == c) for c in np.unique(partition)],
+                                       weight=None)
+
+    def test_same_as_networkx(self):
+        for partition in self.partitions:
+            self.assertAlmostEqual(modularity(self.A, partition), self._networkx(partition))
+            self.assertAlmostEqual(modularity(csr_matrix(self.A), list(partition)), self._networkx(partition))
+
+    def test_batch(self):
+        expected = [self._networkx(partition) for partition in self.partitions]
+        self.assertTrue(np.allclose(modularity_batch(self.A, self.partitions), expected))
+        self.assertTrue(np.allclose(modularity_batch(self.A, self.partitions + 10), expected))
+        Q = _backend._modularity(torch.from_numpy(self.A).float(), torch.from_numpy(self.partitions))
+        self.assertTrue(np.allclose(Q.numpy(), expected))
+        Q = _backend._modularity(csr_matrix(self.A), torch.from_numpy(self.partitions[0]))
+        self.assertEqual(Q.shape, (1,))
+        self.assertAlmostEqual(Q.item(), expected[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+
+import networkx as nx
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import LinearOperator
+from sklearn.metrics import adjusted_rand_score
+
+from pygkernels.cluster import SpectralClustering_rubanov
+from pygkernels.measure import For_H, PPR_H, Heat_H, Comm_H, Katz_H, NHeat_H
+
+
+class TestSpectralClustering(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        G = nx.stochastic_block_model([60, 80, 100], [[0.2, 0.01, 0.01], [0.01, 0.2, 0.01], [0.01, 0.01, 0.2]],
+                                      seed=0)
+        self.A = nx.to_numpy_array(G, weight=None)
+
+    def _old_max_ort(self, M, n_clusters=3, symmetric=None):
+        val, vec = np.linalg.eig(M)
+        return vec[:, np.argpartition(val, -n_clusters)[-n_clusters:]]
+
+    def test_same_as_full_eig(self):
+        K = For_H(self.A).get_K(For_H(self.A).scaler.scale(0.5))
+        expected = SpectralClustering_rubanov(3, random_state=0)
+        expected._max_ort = self._old_max_ort
+        expected = expected.predict(K)
+        for eigensolver in SpectralClustering_rubanov.EIGENSOLVERS:
+            estimator = SpectralClustering_rubanov(3, random_state=0, eigensolver=eigensolver)
+            self.assertEqual(adjusted_rand_score(estimator.predict(K), expected), 1., eigensolver)
+            self.assertEqual(adjusted_rand_score(estimator.predict(K), expected), 1., eigensolver)  # warm start
+
+    def test_top_eigenvectors(self):
+        K = For_H(self.A).get_K(For_H(self.A).scaler.scale(0.5))
+        val, vec = np.linalg.eigh(K)
+        for eigensolver in ['arpack', 'lobpcg']:
+            X = SpectralClustering_rubanov(3, eigensolver=eigensolver)._max_ort(K)
+            self.assertTrue(np.allclose(np.abs(X.T.dot(vec[:, -3:])).sum(axis=0), 1, atol=1e-6), eigensolver)
+
+    def test_sparse_and_operator_kernels(self):
+        K = self.A + np.eye(self.A.shape[0]) * 10
+        expected = SpectralClustering_rubanov(3, random_state=0).predict(K)
+        operator = LinearOperator(K.shape, matvec=K.dot, matmat=K.dot, dtype=np.float64)
+        for eigensolver in ['arpack', 'lobpcg']:
+            for kernel, symmetric in [(sparse.csr_matrix(K), None), (operator, True), (operator, None)]:
+                estimator = SpectralClustering_rubanov(3, random_state=0, eigensolver=eigensolver)
+                self.assertEqual(adjusted_rand_score(estimator.predict(kernel, symmetric=symmetric), expected), 1.)
+
+    def test_not_symmetric(self):
+        K = PPR_H(self.A).get_K(0.5)
+        expected = SpectralClustering_rubanov(3, random_state=0, eigensolver='dense').predict(K)
+        for eigensolver in ['arpack', 'lobpcg']:
+            estimator = SpectralClustering_rubanov(3, random_state=0, eigensolver=eigensolver)
+            self.assertEqual(adjusted_rand_score(estimator.predict(K), expected), 1.)
+            K_sparse = sparse.csr_matrix(np.where(np.abs(K) > 1e-3, K, 0.))  # sparse and not symmetric
+            self.assertFalse(estimator._is_symmetric(K_sparse))
+            expected_sparse = SpectralClustering_rubanov(3, random_state=0, eigensolver='dense').predict(K_sparse)
+            self.assertEqual(adjusted_rand_score(estimator.predict(K_sparse), expected_sparse), 1.)
+
+    def test_predict_params(self):
+        for kernel_class in [For_H, Heat_H, Comm_H, Katz_H, NHeat_H, PPR_H]:
+            kernel = kernel_class(self.A)
+            params = [0.2, 0.5, 0.8] if kernel_class is PPR_H else list(kernel.scaler.scale_list([0.2, 0.5, 0.8]))
+            estimator = SpectralClustering_rubanov(3, random_state=0)
+            for param, labels in zip(params, estimator.predict_params(kernel, params)):
+                expected = SpectralClustering_rubanov(3, random_state=0).predict(kernel.get_K(param))
+                self.assertEqual(adjusted_rand_score(labels, expected), 1., f'{kernel_class.name}, {param}')
+
+    def test_spectral_operator(self):
+        self.assertIsNone(PPR_H(self.A).spectral_operator(0.5))
+        self.assertIsNone(For_H(np.triu(self.A)).spectral_operator(1.))
+        kernel = Katz_H(self.A)
+        self.assertIsNotNone(kernel.spectral_operator(0.99 / kernel.ctx.lambda_max))
+        self.assertIsNone(kernel.spectral_operator(1.01 / kernel.ctx.lambda_max))  # past the pole, f isn't increasing
+        kernel = Heat_H(self.A)
+        t = kernel.scaler.scale(0.3)
+        M = kernel.spectral_operator(t)
+        val, vec = np.linalg.eigh(M)
+        self.assertTrue(np.allclose(kernel.get_K(t), (vec * np.exp(t * val)).dot(vec.T)))
+
+
+if __name__ == "__main__":
+    unittest.main()
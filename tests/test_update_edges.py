@@ -0,0 +1,96 @@
+import unittest
+
+import networkx as nx
+import numpy as np
+
+import pygkernels.measure.shortcuts as h
+from pygkernels.measure import GraphContext, For_H, Katz_H, PPR_H, ModifPPR_H, CT_H, SCT_H, For_D, logFor_H, logKatz_D, Comm_H, \
+    SP_D, SP_K, CT_D, SPCT_D, SPCT_H
+
+
+class TestUpdateEdges(unittest.TestCase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.A = nx.to_numpy_array(nx.karate_club_graph(), weight=None)
+        self.added, self.removed = [(0, 9), (5, 30, 2.)], [(0, 1), (32, 33)]
+        self.A_new = h.edit_edges(self.A, self.added, self.removed)[0]
+
+    @staticmethod
+    def _get(measure, param):
+        return measure.get_K(param) if hasattr(measure, 'get_K') else measure.get_D(param)
+
+    def _check(self, measure_class, max_updates=None):
+        measure = measure_class(self.A, ctx=GraphContext(self.A, keep_inverses=2))
+        params = list(measure.scaler.scale_list([0.2, 0.5]))
+        for param in params:
+            self._get(measure, param)
+        measure.update_edges(self.added, self.removed, max_updates=max_updates)
+        expected_measure = measure_class(self.A_new)
+        self.assertAlmostEqual(measure.scaler.scale(0.5), expected_measure.scaler.scale(0.5))
+        for param in params:
+            self.assertTrue(np.allclose(self._get(measure, param), self._get(expected_measure, param)),
+                            f'{measure_class.__name__}, {param}')
+
+    def test_low_rank_updates(self):
+        for measure_class in [For_H, Katz_H, PPR_H, ModifPPR_H, CT_H, SCT_H, For_D, logFor_H, logKatz_D]:
+            self._check(measure_class)
+
+    def test_inverses_are_updated_not_recomputed(self):
+        kernel = For_H(self.A, ctx=GraphContext(self.A, keep_inverses=2))
+        kernel.get_K(0.5)
+        kernel._calc_inverse = None
+        kernel.update_edges(self.added, self.removed)
+        self.assertTrue(np.allclose(kernel.get_K(0.5), For_H(self.A_new).get_K(0.5)))
+
+    def test_recompute_past_max_updates(self):
+        self._check(For_H, max_updates=1)
+        kernel = For_H(self.A, ctx=GraphContext(self.A, keep_inverses=2))
+        kernel.get_K(0.5)
+        kernel.update_edges(self.added, self.removed, max_updates=1)
+        self.assertEqual(len(kernel._inverses), 0)
+
+    def test_kept_inverses(self):
+        kernel = For_H(self.A)
+        kernel.get_K(0.5)
+        self.assertEqual(len(kernel._inverses), 0)
+        kernel = For_H(self.A, ctx=GraphContext(self.A, keep_inverses=2, cache_size=0))
+        kernel.get_K(0.5)
+        self.assertEqual(len(kernel._inverses), 0)
+        kernel = For_H(self.A, ctx=GraphContext(self.A, keep_inverses=2))
+        for t in [0.2, 0.5, 0.7]:
+            kernel.get_K(t)[0, 0] = -1.  # a kept inverse is handed out as a copy
+        self.assertEqual(list(kernel._inverses), [0.5, 0.7])
+        self.assertTrue(np.allclose(kernel.get_K(0.7), For_H(self.A).get_K(0.7)))
+
+    def test_disconnecting_edge(self):
+        for kernel_class in [CT_H, For_H]:
+            kernel = kernel_class(self.A)
+            kernel.get_K(0.5)
+            kernel.update_edges(removed=[(0, 11)])  # node 11 has the only neighbour 0
+            self.assertTrue(np.allclose(kernel.get_K(0.5), kernel_class(h.edit_edges(self.A, removed=[(0, 11)])[0])
+                                        .get_K(0.5)))
+
+    def test_shortest_paths(self):
+        for measure_class in [SP_D, SP_K, CT_D, SPCT_D, SPCT_H]:
+            self._check(measure_class)
+
+    def test_shortest_paths_random_changes(self):
+        rs = np.random.RandomState(0)
+        A = np.triu(rs.uniform(0.5, 2, size=(40, 40)) * (rs.uniform(size=(40, 40)) < 0.15), 1)
+        A = A + A.T
+        measure = SP_D(A)
+        measure.get_D(-1)
+        for _ in range(20):
+            edges = [tuple(rs.choice(40, 2, replace=False)) for _ in range(3)]
+            added = [(i, j, rs.uniform(0.5, 2)) for i, j in edges[:2]]
+            measure.update_edges(added, edges[2:])
+            A = h.edit_edges(A, added, edges[2:])[0]
+            self.assertTrue(np.allclose(measure.get_D(-1), SP_D(A).get_D(-1)))
+
+    def test_not_supported(self):
+        with self.assertRaises(NotImplementedError):
+            Comm_H(self.A).update_edges(added=[(0, 9)])
+
+
+if __name__ == "__main__":
+    unittest.main()